@@ -0,0 +1,377 @@
+# aggregation.py
+# Aggregation cube — daily sums per (type, category) held as one dense NumPy matrix.
+# Weekly / monthly views are cheap reductions of the daily matrix, so every
+# forecast horizon, the total-income series and the net balance come from the
+# same precomputed structure (built once per data version).
+# CubeBuilder builds the same cube from a stream of chunks, so memory is bounded
+# by the number of (day, type, category) cells instead of the transaction count.
+# AggregationEngine is the row-level counterpart the pages use for ad-hoc views
+# (any period × type / category / account), with the same bincount kernel.
+# DashboardBundle holds every dashboard aggregate for one data version in MYR,
+# built straight from SQLite (database.aggregate) and folded with merged().
+#
+#   engine = AggregationEngine(df)
+#   engine.sum(['M', 'Category'], Type='EXPENSE')    # like groupby([month, 'Category']).sum().unstack(fill_value=0)
+#   engine.sum('Category', Type='EXPENSE', M=today)  # like groupby('Category').sum() on this month's expenses
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# 1. Aggregation Cube
+# -------------------------------
+class AggregationCube:
+    """
+    Build from a cleaned transactions frame with Date, Type, Category, Amount.
+
+    daily[d, k]  → sum of Amount on day d for key k = (type, category)
+    counts[d, k] → number of transactions behind that cell
+
+    Counts let the views reproduce the old groupby semantics: a period only
+    exists for a series if at least one transaction fell in it.
+    """
+
+    def __init__(self, df):
+        df = df.dropna(subset=['Date', 'Amount', 'Type', 'Category'])
+        key_codes, keys = pd.factorize(pd.MultiIndex.from_arrays([df['Type'], df['Category']]), sort=True)
+        day = df['Date'].dt.normalize()
+        start = day.min() if len(df) else None
+        day_idx = (day - start).dt.days.to_numpy() if len(df) else np.zeros(0, dtype=np.int64)
+        self._fill(list(keys), start, day_idx, key_codes, df['Amount'].to_numpy(dtype=float))
+
+    @classmethod
+    def from_cells(cls, keys, start, day_idx, key_codes, sums, counts):
+        """Cube from pre-aggregated (day offset, key) cells — see CubeBuilder."""
+        cube = cls.__new__(cls)
+        cube._fill(list(keys), start, day_idx, key_codes, sums, counts)
+        return cube
+
+    def _fill(self, keys, start, day_idx, key_codes, amounts, counts=None):
+        self.keys = keys
+        self._key_pos = {k: i for i, k in enumerate(self.keys)}
+        n_keys = len(self.keys)
+
+        if len(day_idx) == 0:
+            self.days = pd.DatetimeIndex([])
+            self.daily = np.zeros((0, 0))
+            self.counts = np.zeros((0, 0), dtype=np.int64)
+            self._views = {}
+            return
+
+        n_days = int(day_idx.max()) + 1
+        flat = day_idx * n_keys + key_codes
+        size = n_days * n_keys
+        self.days = pd.date_range(start, periods=n_days, freq='D')
+        self.daily = np.bincount(flat, weights=amounts, minlength=size).reshape(n_days, n_keys)
+        if counts is None:
+            self.counts = np.bincount(flat, minlength=size).reshape(n_days, n_keys)
+        else:
+            self.counts = np.bincount(flat, weights=counts, minlength=size).astype(np.int64).reshape(n_days, n_keys)
+        self._views = {'D': (self.days, self.daily, self.counts)}
+
+    # ---------------------------
+    # Views
+    # ---------------------------
+    def view(self, freq: str):
+        """(period starts, sums, counts) at 'D', 'W' or 'M' — reduced once, then reused."""
+        if freq not in self._views:
+            if len(self.days) == 0:
+                return self.days, self.daily, self.counts
+            starts = self.days.to_period(freq).to_timestamp()
+            # days are consecutive, so each period is one contiguous block of rows
+            boundaries = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+            self._views[freq] = (
+                starts[boundaries],
+                np.add.reduceat(self.daily, boundaries, axis=0),
+                np.add.reduceat(self.counts, boundaries, axis=0),
+            )
+        return self._views[freq]
+
+    def categories(self, typ: str):
+        return [cat for t, cat in self.keys if t == typ]
+
+    def _columns(self, typ: str, cat=None):
+        if cat is None:
+            return [i for i, (t, _) in enumerate(self.keys) if t == typ]
+        pos = self._key_pos.get((typ, cat))
+        return [] if pos is None else [pos]
+
+    # ---------------------------
+    # Series & Frames
+    # ---------------------------
+    def series(self, freq: str, typ: str, cat=None):
+        """
+        One series as a ds/y frame. cat=None → total for the type.
+        Only periods with at least one transaction in the series are kept.
+        """
+        periods, sums, counts = self.view(freq)
+        cols = self._columns(typ, cat)
+        if not cols:
+            return pd.DataFrame({'ds': pd.DatetimeIndex([]), 'y': np.array([], dtype=float)})
+        y = sums[:, cols].sum(axis=1)
+        mask = counts[:, cols].sum(axis=1) > 0
+        return pd.DataFrame({'ds': periods[mask], 'y': y[mask]})
+
+    def frame(self, freq: str, typ: str):
+        """Wide Period × Category frame for one type (zeros where a category had nothing)."""
+        periods, sums, counts = self.view(freq)
+        cols = self._columns(typ)
+        mask = counts[:, cols].sum(axis=1) > 0
+        out = pd.DataFrame(sums[mask][:, cols], columns=[self.keys[i][1] for i in cols])
+        out.insert(0, 'Period', periods[mask])
+        return out
+
+    def net_series(self, freq: str):
+        """Income minus expense for every period that has any transaction."""
+        periods, sums, counts = self.view(freq)
+        income = self._columns('INCOME')
+        expense = self._columns('EXPENSE')
+        net = sums[:, income].sum(axis=1) - sums[:, expense].sum(axis=1)
+        mask = counts.sum(axis=1) > 0
+        return pd.DataFrame({'ds': periods[mask], 'y': net[mask]})
+
+    def period_counts(self, freq: str, typ: str):
+        """Number of non-empty periods per category, plus the type total under None."""
+        _, _, counts = self.view(freq)
+        cols = self._columns(typ)
+        out = {None: int((counts[:, cols].sum(axis=1) > 0).sum())} if cols else {}
+        for i in cols:
+            out[self.keys[i][1]] = int((counts[:, i] > 0).sum())
+        return out
+
+# -------------------------------
+# 2. Streaming Builder
+# -------------------------------
+class CubeBuilder:
+    """
+    Folds chunks of Date / Type / Category / Amount rows into per-day cells.
+    Only the distinct (day, type, category) cells are kept between chunks, so
+    peak memory is one chunk plus the cells, however many rows are streamed.
+
+        builder = CubeBuilder()
+        for chunk in pd.read_sql_query(query, conn, chunksize=50_000):
+            builder.add(chunk)
+        cube = builder.build()
+    """
+
+    KEY_SPAN = 1 << 20  # room for ~1M distinct (type, category) keys
+
+    def __init__(self):
+        self._key_pos = {}                          # (type, category) → code, in arrival order
+        self._cells = np.zeros(0, dtype=np.int64)   # day ordinal * KEY_SPAN + code, sorted
+        self._sums = np.zeros(0)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self.rows = 0
+
+    def add(self, chunk):
+        chunk = chunk.dropna(subset=['Date', 'Amount', 'Type', 'Category'])
+        if chunk.empty:
+            return self
+        local, uniques = pd.factorize(pd.MultiIndex.from_arrays([chunk['Type'], chunk['Category']]))
+        codes = np.array([self._key_pos.setdefault(k, len(self._key_pos)) for k in uniques], dtype=np.int64)
+        day = chunk['Date'].dt.normalize().to_numpy().astype('datetime64[D]').astype(np.int64)
+        cells = day * self.KEY_SPAN + codes[local]
+
+        cells, inverse = np.unique(np.concatenate([self._cells, cells]), return_inverse=True)
+        self._sums = np.bincount(inverse, weights=np.concatenate([self._sums, chunk['Amount'].to_numpy(dtype=float)]),
+                                 minlength=len(cells))
+        self._counts = np.bincount(inverse, weights=np.concatenate([self._counts, np.ones(len(chunk))]),
+                                   minlength=len(cells)).astype(np.int64)
+        self._cells = cells
+        self.rows += len(chunk)
+        return self
+
+    @property
+    def n_cells(self):
+        return len(self._cells)
+
+    def build(self):
+        keys = list(self._key_pos)
+        order = sorted(range(len(keys)), key=lambda i: keys[i])  # same key order as AggregationCube(df)
+        remap = np.empty(len(keys), dtype=np.int64)
+        remap[order] = np.arange(len(keys))
+        day = self._cells // self.KEY_SPAN
+        start = pd.Timestamp(int(day.min()), unit='D') if len(day) else None
+        return AggregationCube.from_cells(
+            [keys[i] for i in order], start,
+            day - (day.min() if len(day) else 0), remap[self._cells % self.KEY_SPAN],
+            self._sums, self._counts,
+        )
+
+# -------------------------------
+# 3. Aggregation Engine (row level)
+# -------------------------------
+NAT_DAY = np.iinfo(np.int64).min  # day ordinal of NaT
+PERIOD_STARTS = {'D': 'D', 'W': 'W-MON', 'M': 'MS', 'Y': 'YS'}  # period → date_range freq of its start dates
+
+class AggregationEngine:
+    """
+    Transactions encoded once for repeated aggregation: Type / Category /
+    Account become integer codes and Date a day ordinal, so sum() reduces any
+    (period, key, ...) combination with one np.bincount into a dense array —
+    no string hashing or Period objects per call. Rows stay in df order, so a
+    boolean mask built from df lines up with the engine.
+    """
+
+    KEYS = ('Type', 'Category', 'Account')
+
+    def __init__(self, df, keys=KEYS, measures=('Amount',)):
+        self.n = len(df)
+        self.values = {m: df[m].to_numpy(dtype=float) for m in measures if m in df}
+        self.codes, self.labels = {}, {}
+        for col in keys:
+            if col in df:
+                self.codes[col], self.labels[col] = pd.factorize(df[col], sort=True)  # missing → -1
+        days = df['Date'].to_numpy(dtype='datetime64[D]')
+        self._unique_days, self._day_inverse = np.unique(days, return_inverse=True)
+        self.day = days.astype(np.int64)  # ordinal (days since 1970-01-01); NaT is the int64 minimum
+        self._periods = {}
+
+    # ---------------------------
+    # Dimensions
+    # ---------------------------
+    def _period(self, freq: str):
+        """(code per row, period start dates) — computed from the distinct days only."""
+        if freq not in self._periods:
+            starts = pd.DatetimeIndex(self._unique_days).to_period(freq).to_timestamp()
+            codes, labels = pd.factorize(starts, sort=True)
+            self._periods[freq] = (codes[self._day_inverse] if self.n else codes, labels)
+        return self._periods[freq]
+
+    def _dim(self, name: str):
+        if name in PERIOD_STARTS:
+            return self._period(name)
+        return self.codes[name], self.labels[name]
+
+    def mask(self, mask=None, start=None, end=None, **filters):
+        """
+        Row mask: dimension == value for every filter (a period filter takes any
+        date inside the period), start <= Date < end, and-ed with mask.
+        """
+        out = np.ones(self.n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+        for name, value in filters.items():
+            codes, labels = self._dim(name)
+            if name in PERIOD_STARTS:
+                value = pd.Timestamp(value).to_period(name).to_timestamp()
+            out &= codes == labels.get_indexer([value])[0] if value in labels else False
+        if start is not None:
+            out &= self.day >= pd.Timestamp(start).to_datetime64().astype('datetime64[D]').astype(np.int64)
+        if end is not None:
+            out &= (self.day < pd.Timestamp(end).to_datetime64().astype('datetime64[D]').astype(np.int64)) & (self.day != NAT_DAY)
+        return out
+
+    # ---------------------------
+    # Reductions
+    # ---------------------------
+    def reduce(self, by, mask=None, measure: str = 'Amount'):
+        """Dense (sums, counts, labels) over every combination of the `by` dimensions."""
+        by = [by] if isinstance(by, str) else list(by)
+        dims = [self._dim(name) for name in by]
+        shape = tuple(len(labels) for _, labels in dims)
+        keep = np.ones(self.n, dtype=bool) if mask is None else mask.copy()
+        for codes, _ in dims:
+            keep &= codes >= 0
+        flat = np.ravel_multi_index(tuple(codes[keep] for codes, _ in dims), shape) if all(shape) else np.zeros(0, dtype=np.int64)
+        size = int(np.prod(shape))
+        sums = np.bincount(flat, weights=self.values[measure][keep], minlength=size).reshape(shape)
+        counts = np.bincount(flat, minlength=size).reshape(shape)
+        return sums, counts, [labels for _, labels in dims]
+
+    def sum(self, by, mask=None, measure: str = 'Amount', fill: bool = False, **filters):
+        """
+        groupby(by)[measure].sum() for one dimension (Series) or two (wide frame,
+        0 where a combination is empty, like .unstack(fill_value=0)). Only groups
+        with at least one row are kept; fill=True instead returns every period
+        from the first to the last (like resample) for a single period dimension.
+        """
+        sums, counts, labels = self.reduce(by, self.mask(mask, **filters), measure)
+        if sums.ndim == 1:
+            observed = counts > 0
+            out = pd.Series(sums[observed], index=labels[0][observed], name=measure)
+            name = by if isinstance(by, str) else by[0]
+            if fill and len(out) and name in PERIOD_STARTS:
+                out = out.reindex(pd.date_range(out.index[0], out.index[-1], freq=PERIOD_STARTS[name]), fill_value=0.0)
+            return out
+        rows, cols = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0
+        return pd.DataFrame(sums[rows][:, cols], index=labels[0][rows], columns=labels[1][cols])
+
+    def total(self, mask=None, measure: str = 'Amount', **filters):
+        """Sum of measure over the rows matching the filters."""
+        return float(self.values[measure][self.mask(mask, **filters)].sum())
+
+    def nunique(self, by: str, of: str, mask=None, **filters):
+        """Distinct `of` values per `by` group (e.g. active months per category)."""
+        _, counts, labels = self.reduce([by, of], self.mask(mask, **filters))
+        active = (counts > 0).sum(axis=1)
+        return pd.Series(active[active > 0], index=labels[0][active > 0])
+
+
+# -------------------------------
+# 4. Dashboard Bundle
+# -------------------------------
+class DashboardBundle:
+    """
+    Every aggregate the dashboard draws, computed once per data version in base
+    currency (MYR): type totals, expense by category per month and per year
+    (columns ordered by total, largest first) and income / expense / total per
+    account (ordered by total, smallest first). The render helpers only slice
+    these small frames and scale them by the exchange rate, so switching
+    currency, view or the category limit never touches the transactions.
+    Every aggregate is a sum, so merged() folds in a bundle of appended rows.
+    Bundles are built by from_database() (SQLite GROUP BY) and merged().
+    """
+
+    VIEWS = {'Monthly': 'M', 'Yearly': 'Y'}
+
+    def __init__(self, type_totals, category_views, account_flow):
+        self.type_totals = type_totals
+        self.category_views = {view: grouped[grouped.sum().sort_values(ascending=False).index]
+                               for view, grouped in category_views.items()}
+        account_flow = account_flow.assign(Total=account_flow['Income'] + account_flow['Expense'])
+        self.account_flow = account_flow.sort_values('Total', ascending=True)
+
+    @classmethod
+    def from_database(cls, rowid_range=None, db_path=None):
+        """The same bundle from GROUP BY queries inside SQLite (database.aggregate); no rows are loaded."""
+        from database import aggregate
+
+        def pivot(result, index, columns):
+            return result.pivot(index=index, columns=columns, values='sum').fillna(0.0).rename_axis(index=None, columns=None)
+
+        type_totals = aggregate(group_by=['Type'], rowid_range=rowid_range, db_path=db_path).set_index('Type')['sum']
+        category_views = {}
+        if 'EXPENSE' in type_totals:
+            for view, freq in cls.VIEWS.items():
+                grouped = pivot(aggregate(group_by=[freq, 'Category'], typ='EXPENSE', rowid_range=rowid_range, db_path=db_path),
+                                freq, 'Category')
+                if freq == 'Y':
+                    grouped.index = grouped.index.year
+                category_views[view] = grouped
+        flow = pivot(aggregate(group_by=['Account', 'Type'], rowid_range=rowid_range, db_path=db_path), 'Account', 'Type')
+        flow = pd.DataFrame({'Income': flow.get('INCOME', 0.0), 'Expense': flow.get('EXPENSE', 0.0)}, index=flow.index)
+        return cls(type_totals.rename_axis(None).rename('Amount'), category_views, flow)
+
+    def merged(self, other):
+        """Bundle over both row sets, e.g. the cached one plus one built from newly appended rows."""
+        category_views = {}
+        for view in self.VIEWS:
+            parts = [b.category_views[view] for b in (self, other) if view in b.category_views]
+            if parts:
+                category_views[view] = parts[0] if len(parts) == 1 else parts[0].add(parts[1], fill_value=0).fillna(0.0)
+        flow = self.account_flow[['Income', 'Expense']].add(other.account_flow[['Income', 'Expense']], fill_value=0)
+        return type(self)(self.type_totals.add(other.type_totals, fill_value=0), category_views, flow.fillna(0.0))
+
+    def totals(self, rate: float = 1.0):
+        """(income, expense, net) scaled by rate."""
+        income = float(self.type_totals.get('INCOME', 0.0)) * rate
+        expense = float(self.type_totals.get('EXPENSE', 0.0)) * rate
+        return income, expense, income - expense
+
+    def categories(self, view: str, max_categories: int, rate: float = 1.0):
+        """Period × top-max_categories expense frame for 'Monthly' / 'Yearly', or None without expenses."""
+        grouped = self.category_views.get(view)
+        return None if grouped is None else grouped.iloc[:, :max_categories] * rate
+
+    def accounts(self, max_categories: int, rate: float = 1.0):
+        """Income / Expense / Total of the max_categories largest accounts, smallest first."""
+        return self.account_flow.tail(max_categories) * rate
@@ -0,0 +1,218 @@
+# analytics.py
+# Optional DuckDB backend for the aggregations that scan the whole history:
+# the trends page's monthly history, the chatbot's savings / cash-flow
+# analyses and the forecast cube's (day, type, category) cells. DuckDB reads
+# finance.db directly (its sqlite extension) or a Parquet snapshot of it and
+# runs the GROUP BYs vectorized on every core; only the grouped rows come back
+# to pandas, where names are normalised the same way as data_access.py.
+# Without duckdb installed (or with ANALYTICS_BACKEND=pandas) available() is
+# False and callers keep their pandas / AggregationEngine path.
+#
+#   if analytics.available():
+#       analytics.group_sum('M', start=cutoff, Type='EXPENSE')   # same shapes as AggregationEngine.sum
+#       analytics.group_sum(['M', 'Type'])                       # wide: month × INCOME / EXPENSE
+#       cube = analytics.build_cube()                            # aggregation.AggregationCube
+#       table = analytics.query("SELECT count(*) FROM transactions", arrow=True)
+#
+#   python analytics.py --snapshot finance.parquet   # then ANALYTICS_SOURCE=finance.parquet
+#
+# ANALYTICS_SOURCE only changes the default source of scripts and benchmarks.
+# The pages always pass the live database: their caches are keyed on its data
+# version, which a snapshot does not follow, so they would keep stale totals.
+#
+# ANALYTICS_THREADS caps DuckDB's worker threads (default: one per core).
+
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from aggregation import PERIOD_STARTS, AggregationCube
+
+try:
+    import duckdb
+except ImportError:  # optional: every caller has a pandas path
+    duckdb = None
+
+DB_FILE = os.getenv("FINANCE_DB_PATH", "finance.db")  # same default as database.DB_PATH
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "duckdb")  # "duckdb" (when installed) or "pandas"
+ANALYTICS_SOURCE = os.getenv("ANALYTICS_SOURCE")  # .parquet snapshot to read instead of DB_FILE (scripts only)
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", "0"))
+
+TYPES = ['INCOME', 'EXPENSE']
+RAW_COLUMNS = ['date', 'amount', 'type', 'category', 'account']
+PERIODS = {'D': 'day', 'W': 'week', 'M': 'month', 'Y': 'year'}  # week starts Monday, like to_period('W')
+KEYS = ('Type', 'Category', 'Account')
+
+# Errors a caller may want to report instead of crash on
+ERRORS = (sqlite3.Error, pd.errors.DatabaseError) + ((duckdb.Error,) if duckdb else ())
+
+_sqlite_extension = True  # False once loading DuckDB's sqlite extension failed (offline, no extension dir)
+
+def available():
+    return duckdb is not None and ANALYTICS_BACKEND != "pandas"
+
+# -------------------------------
+# 1. Connection
+# -------------------------------
+def _quote(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+def _read_raw(db_path):
+    """The raw columns through sqlite3, for when DuckDB cannot attach the file itself."""
+    conn = sqlite3.connect(db_path)
+    try:
+        raw = pd.read_sql_query(f"SELECT {', '.join(RAW_COLUMNS)} FROM transactions", conn)
+    finally:
+        conn.close()
+    raw['amount'] = pd.to_numeric(raw['amount'], errors='coerce')  # SQLite columns may hold mixed types
+    return raw
+
+def connect(source=None):
+    """
+    In-memory DuckDB connection exposing the source's rows as the view
+    `transactions`. source is a SQLite file or a .parquet snapshot (default:
+    ANALYTICS_SOURCE, else FINANCE_DB_PATH). Close it when done.
+    """
+    global _sqlite_extension
+    source = str(source or ANALYTICS_SOURCE or DB_FILE)
+    con = duckdb.connect(config={'threads': ANALYTICS_THREADS} if ANALYTICS_THREADS else {})
+    if source.endswith('.parquet'):
+        con.execute(f"CREATE VIEW transactions AS SELECT * FROM read_parquet({_quote(source)})")
+        return con
+    if _sqlite_extension:
+        try:
+            con.execute("LOAD sqlite")
+        except duckdb.Error:
+            _sqlite_extension = False
+    if not _sqlite_extension:
+        con.register('transactions', _read_raw(source))
+        return con
+    con.execute("SET sqlite_all_varchar = true")  # SQLite types are per value; cast in CLEAN_SQL instead
+    con.execute(f"ATTACH {_quote(source)} AS finance (TYPE sqlite, READ_ONLY)")
+    con.execute("CREATE VIEW transactions AS SELECT * FROM finance.transactions")
+    return con
+
+def query(sql, params=None, source=None, arrow=False):
+    """Run sql against `transactions`; a pandas frame, or a pyarrow Table with arrow=True."""
+    con = connect(source)
+    try:
+        result = con.execute(sql, params or [])
+        return result.fetch_arrow_table() if arrow else result.df()
+    finally:
+        con.close()
+
+# -------------------------------
+# 2. Grouped Sums
+# -------------------------------
+CLEAN_SQL = """
+SELECT TRY_CAST(date AS TIMESTAMP) AS ts, TRY_CAST(amount AS DOUBLE) AS amount,
+       CAST(type AS VARCHAR) AS type, CAST(category AS VARCHAR) AS category, CAST(account AS VARCHAR) AS account
+FROM transactions
+"""
+
+def _cells(periods, raw_keys, start=None, end=None, source=None):
+    """
+    Sum / count per (periods..., raw key strings...) for rows with a valid date
+    and amount in [start, end) (whole days). Keys come back exactly as stored.
+    """
+    selects = [f"CAST(date_trunc('{PERIODS[p]}', ts) AS TIMESTAMP) AS \"{p}\"" for p in periods] + list(raw_keys)
+    where, params = ["ts IS NOT NULL", "amount IS NOT NULL"], []
+    if start is not None:
+        where.append("ts >= ?")
+        params.append(pd.Timestamp(start).normalize().to_pydatetime())
+    if end is not None:
+        where.append("ts < ?")
+        params.append(pd.Timestamp(end).normalize().to_pydatetime())
+    cells = query(
+        f"SELECT {', '.join(selects)}, sum(amount) AS \"Amount\", count(*) AS \"Count\" "
+        f"FROM ({CLEAN_SQL}) WHERE {' AND '.join(where)} GROUP BY ALL",
+        params, source)
+    for p in periods:
+        cells[p] = cells[p].astype('datetime64[ns]')  # DuckDB hands back µs; the pages use ns like pandas
+    return cells
+
+def _normalise(cells):
+    """Raw type / category / account → the data_access.py names; drops types other than INCOME / EXPENSE."""
+    cells = cells.rename(columns={'type': 'Type', 'category': 'Category', 'account': 'Account'})
+    cells['Type'] = cells['Type'].str.strip().str.upper()
+    if 'Category' in cells:
+        cells['Category'] = cells['Category'].fillna('Uncategorized').str.strip().str.title()
+    if 'Account' in cells:
+        cells['Account'] = cells['Account'].fillna('Unknown').str.strip().str.title()
+    return cells[cells['Type'].isin(TYPES)]
+
+def group_sum(by, start=None, end=None, fill: bool = False, source=None, **filters):
+    """
+    AggregationEngine.sum computed in DuckDB: groupby(by)['Amount'].sum() over
+    one dimension (Series) or two (wide frame, 0 where a combination is empty).
+    by / filters name D / W / M / Y or Type / Category / Account; filters
+    compare against the cleaned names (Category='Food'). fill=True returns
+    every period from the first to the last for a single period dimension.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    unknown = [name for name in [*by, *filters] if name not in PERIODS and name not in KEYS]
+    if unknown or any(name in PERIODS for name in filters):
+        raise ValueError(f"Cannot group or filter by {unknown or list(filters)}")
+    periods = [name for name in by if name in PERIODS]
+    cells = _normalise(_cells(periods, [k.lower() for k in KEYS if k == 'Type' or k in by or k in filters],
+                              start, end, source))
+    for name, value in filters.items():
+        cells = cells[cells[name] == value]
+    out = cells.groupby(by)['Amount'].sum()
+    if len(by) == 2:
+        return out.unstack(fill_value=0.0).rename_axis(index=None, columns=None)
+    out = out.rename_axis(None)
+    if fill and len(out) and by[0] in PERIODS:
+        out = out.reindex(pd.date_range(out.index[0], out.index[-1], freq=PERIOD_STARTS[by[0]]), fill_value=0.0)
+    return out
+
+# -------------------------------
+# 3. Forecast Cube
+# -------------------------------
+def build_cube(source=None, rate: float = 1.0):
+    """
+    aggregation.AggregationCube from one GROUP BY (day, type, category) —
+    the same cube as AggregationCube(clean transactions) without loading
+    the rows. rate scales every amount (e.g. into the display currency).
+    """
+    cells = _normalise(_cells(['D'], ['type', 'category'], source=source))
+    if cells.empty:
+        none = np.zeros(0, dtype=np.int64)
+        return AggregationCube.from_cells([], None, none, none, np.zeros(0), none)
+    key_codes, keys = pd.factorize(pd.MultiIndex.from_arrays([cells['Type'], cells['Category']]), sort=True)
+    start = cells['D'].min()
+    return AggregationCube.from_cells(
+        list(keys), start, (cells['D'] - start).dt.days.to_numpy(), key_codes,
+        cells['Amount'].to_numpy(dtype=float) * rate, cells['Count'].to_numpy(dtype=np.int64),
+    )
+
+# -------------------------------
+# 4. Parquet Snapshot + CLI
+# -------------------------------
+def export_snapshot(path, source=None):
+    """Write the columns the aggregations read to a Parquet file; returns the row count."""
+    con = connect(source)
+    try:
+        con.execute(f"COPY (SELECT {', '.join(RAW_COLUMNS)} FROM transactions) TO {_quote(path)} (FORMAT parquet)")
+        return con.execute(f"SELECT count(*) FROM read_parquet({_quote(path)})").fetchone()[0]
+    finally:
+        con.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DuckDB analytics over the finance database")
+    parser.add_argument("--db", default=None, help="SQLite database to read (default: FINANCE_DB_PATH)")
+    parser.add_argument("--snapshot", required=True, help="Parquet file to write the transactions to")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if duckdb is None:
+        raise SystemExit("duckdb is not installed (pip install duckdb)")
+    rows = export_snapshot(args.snapshot, source=args.db or DB_FILE)
+    print(f"Wrote {rows:,} transactions to {args.snapshot}")
+
+if __name__ == "__main__":
+    main()
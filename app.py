@@ -2,7 +2,7 @@
 import streamlit as st
 import sqlite3
 import hashlib
-from database import init_db
+from database import DB_PATH, init_db
 init_db()   # This creates the missing "users" table
 
 # -------------------------------
@@ -50,7 +50,7 @@ def hash_password(password: str) -> str:
 
 def authenticate_user(username: str, password: str):
     try:
-        conn = sqlite3.connect("finance.db")
+        conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
         c.execute("""
             SELECT username, role, email FROM users 
@@ -65,7 +65,7 @@ def authenticate_user(username: str, password: str):
 
 def create_user(username: str, email: str, password: str):
     try:
-        conn = sqlite3.connect("finance.db")
+        conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
         c.execute("SELECT 1 FROM users WHERE LOWER(username)=? OR email=?", 
                   (username.lower(), email))
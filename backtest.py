@@ -0,0 +1,235 @@
+# backtest.py
+# Rolling-origin backtesting for every registered forecast backend
+# (see FORECAST_BACKENDS in forecast_engine.py).
+#
+# Every (horizon, type, category) series with enough history is cut at several
+# origins; each backend is fitted on the data before the origin and scored on the
+# next `periods` actual points. Fit / predict wall time and peak memory are
+# recorded next to MAE / MAPE so per-horizon defaults can be picked from data.
+#
+#   python backtest.py --backends prophet naive linear_trend --folds 3 --jobs 4
+#   python backtest.py --horizons "2 Months" "1 Year" --output-dir backtest_results
+
+import argparse
+import os
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from forecast_engine import (DEFAULT_TIER, FORECAST_BACKENDS, HORIZONS, MIN_HISTORY_PERIODS, QUALITY_TIERS,
+                             build_forecast_cube, build_history, get_backend, list_forecast_targets,
+                             load_forecast_transactions)
+
+warnings.filterwarnings("ignore")
+
+OUTPUT_DIR = "backtest_results"
+DEFAULT_FOLDS = 3
+
+# -------------------------------
+# 1. Rolling Origins
+# -------------------------------
+def rolling_origins(n_points: int, periods: int, folds: int):
+    """
+    Cut positions for a series of n_points. The last fold tests on the final
+    `periods` points, each earlier fold moves the origin back by `periods`.
+    Folds that would leave fewer than MIN_HISTORY_PERIODS training points are dropped.
+    """
+    cuts = [n_points - periods * f for f in range(folds, 0, -1)]
+    return [c for c in cuts if c >= MIN_HISTORY_PERIODS]
+
+def score(actual, predicted):
+    """MAE over all points; MAPE only over non-zero actuals (NaN if there are none)."""
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    err = np.abs(actual - predicted)
+    nonzero = actual != 0
+    mape = float(np.mean(err[nonzero] / np.abs(actual[nonzero])) * 100) if nonzero.any() else np.nan
+    return float(err.mean()), mape
+
+# -------------------------------
+# 2. One Backtest Task (runs in a worker process)
+# -------------------------------
+def backtest_series(backend: str, horizon: str, typ: str, cat: str, history, folds: int = DEFAULT_FOLDS,
+                    tier: str = DEFAULT_TIER):
+    """
+    Fold records for one backend on one series.
+    Predictions are matched to actuals by step (1st forecast ↔ 1st test point),
+    because series only keep periods that had transactions.
+    Peak memory is Python-side allocations (tracemalloc); the cmdstan child
+    process Prophet spawns is not included.
+    """
+    periods, freq = HORIZONS[horizon]
+    records = []
+    for fold, cut in enumerate(rolling_origins(len(history), periods, folds), start=1):
+        train = history.iloc[:cut].reset_index(drop=True)
+        test = history.iloc[cut:cut + periods].reset_index(drop=True)
+        record = {
+            'backend': backend, 'horizon': horizon, 'type': typ, 'category': cat,
+            'fold': fold, 'train_points': len(train), 'test_points': len(test),
+        }
+        tracemalloc.start()
+        try:
+            t0 = time.perf_counter()
+            model = get_backend(backend, freq, tier=tier).fit(train)
+            t1 = time.perf_counter()
+            pred = model.predict(periods)
+            t2 = time.perf_counter()
+        except Exception as e:
+            record['error'] = str(e)
+            records.append(record)
+            continue
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        mae, mape = score(test['y'], pred['yhat'].iloc[:len(test)])
+        record.update({
+            'mae': mae, 'mape': mape,
+            'fit_s': t1 - t0, 'predict_s': t2 - t1,
+            'peak_mb': peak / 1024 ** 2,
+        })
+        records.append(record)
+    return records
+
+def _backtest_task(args):
+    return backtest_series(*args)
+
+# -------------------------------
+# 3. Harness
+# -------------------------------
+def build_tasks(cube, backends, horizons, folds, tier=DEFAULT_TIER):
+    tasks = []
+    for horizon in horizons:
+        periods, freq = HORIZONS[horizon]
+        for cat, typ in list_forecast_targets(cube, horizon).items():
+            history = build_history(cube, freq, typ, cat)
+            if not rolling_origins(len(history), periods, folds):
+                continue
+            for backend in backends:
+                tasks.append((backend, horizon, typ, cat, history, folds, tier))
+    return tasks
+
+def run_backtest(backends=None, horizons=None, folds=DEFAULT_FOLDS, jobs=1, db_file=None, df=None, log=print,
+                 tier=DEFAULT_TIER):
+    """
+    Returns (folds_df, summary_df). Tasks are one (backend, horizon, type, category)
+    each and run in a process pool when jobs > 1. tier applies to Prophet fits.
+    """
+    backends = backends or sorted(FORECAST_BACKENDS)
+    horizons = horizons or list(HORIZONS)
+    if df is None:
+        df = load_forecast_transactions(db_file)
+    tasks = build_tasks(build_forecast_cube(df), backends, horizons, folds, tier)
+    log(f"Backtesting {len(tasks)} series x backend tasks ({folds} folds, {jobs} jobs)")
+
+    records = []
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_backtest_task, t) for t in tasks]
+            for i, future in enumerate(as_completed(futures), start=1):
+                records.extend(future.result())
+                if i % 25 == 0:
+                    log(f"  {i}/{len(tasks)} done")
+    else:
+        for task in tasks:
+            records.extend(_backtest_task(task))
+
+    folds_df = pd.DataFrame(records)
+    return folds_df, summarize(folds_df)
+
+def summarize(folds_df):
+    """One row per (horizon, backend), best backend (lowest median MAPE, then MAE) first."""
+    columns = ['horizon', 'backend', 'series', 'folds', 'errors', 'median_mape', 'mean_mae',
+               'mean_fit_s', 'mean_predict_s', 'max_peak_mb']
+    if folds_df.empty:
+        return pd.DataFrame(columns=columns)
+    if 'error' not in folds_df:
+        folds_df = folds_df.assign(error=np.nan)
+    ok = folds_df[folds_df['error'].isna()]
+    ok = ok.assign(series_key=ok['type'] + '/' + ok['category'])
+    summary = ok.groupby(['horizon', 'backend']).agg(
+        series=('series_key', 'nunique'),
+        folds=('fold', 'size'),
+        median_mape=('mape', 'median'),
+        mean_mae=('mae', 'mean'),
+        mean_fit_s=('fit_s', 'mean'),
+        mean_predict_s=('predict_s', 'mean'),
+        max_peak_mb=('peak_mb', 'max'),
+    ).reset_index()
+    errors = folds_df[folds_df['error'].notna()].groupby(['horizon', 'backend']).size().rename('errors')
+    summary = summary.merge(errors, on=['horizon', 'backend'], how='left').fillna({'errors': 0})
+    summary['errors'] = summary['errors'].astype(int)
+
+    order = {h: i for i, h in enumerate(HORIZONS)}
+    summary['_h'] = summary['horizon'].map(order)
+    summary = summary.sort_values(['_h', 'median_mape', 'mean_mae'], na_position='last').drop(columns='_h')
+    return summary[columns].reset_index(drop=True)
+
+def best_backends(summary):
+    """{horizon: backend} — the first (best) row per horizon of summarize()."""
+    return summary.groupby('horizon', sort=False)['backend'].first().to_dict()
+
+# -------------------------------
+# 4. Report
+# -------------------------------
+def build_report(summary, folds_df):
+    lines = ["# Forecast Backend Backtest", ""]
+    if summary.empty:
+        return "\n".join(lines + ["No series had enough history to backtest."])
+    lines += [
+        f"Rolling-origin folds: {int(folds_df['fold'].max())} | series tasks: "
+        f"{folds_df[['backend', 'horizon', 'type', 'category']].drop_duplicates().shape[0]}",
+        "",
+        "## Recommended backend per horizon",
+        "",
+    ]
+    for horizon, backend in best_backends(summary).items():
+        lines.append(f"- **{horizon}**: {backend}")
+    lines += ["", "## Summary", "", summary.round(3).to_markdown(index=False), ""]
+    return "\n".join(lines)
+
+def write_outputs(summary, folds_df, output_dir=OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [
+        os.path.join(output_dir, "backtest_folds.csv"),
+        os.path.join(output_dir, "backtest_summary.csv"),
+        os.path.join(output_dir, "backtest_report.md"),
+    ]
+    folds_df.to_csv(paths[0], index=False)
+    summary.to_csv(paths[1], index=False)
+    with open(paths[2], "w", encoding='utf-8') as f:
+        f.write(build_report(summary, folds_df))
+    return paths
+
+# -------------------------------
+# 5. CLI
+# -------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of forecast backends on finance.db")
+    parser.add_argument("--backends", nargs="+", choices=sorted(FORECAST_BACKENDS), metavar="BACKEND",
+                        help=f"Backends to compare (default: all). Choices: {', '.join(sorted(FORECAST_BACKENDS))}")
+    parser.add_argument("--horizons", nargs="+", choices=list(HORIZONS), metavar="HORIZON",
+                        help=f"Horizons to test (default: all). Choices: {', '.join(HORIZONS)}")
+    parser.add_argument("--tier", choices=list(QUALITY_TIERS), default=DEFAULT_TIER,
+                        help="Prophet quality tier (interactive = analytic intervals, capped iterations)")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS, help="Rolling origins per series")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Parallel worker processes")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--db", default=None, help="Path to the SQLite database (default: database.DB_PATH)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    folds_df, summary = run_backtest(backends=args.backends, horizons=args.horizons, folds=max(1, args.folds),
+                                     jobs=max(1, args.jobs), db_file=args.db, tier=args.tier)
+    paths = write_outputs(summary, folds_df, args.output_dir)
+    print(build_report(summary, folds_df))
+    print(f"\nSaved: {', '.join(paths)}")
+    return summary
+
+if __name__ == "__main__":
+    main()
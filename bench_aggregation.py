@@ -0,0 +1,140 @@
+# bench_aggregation.py
+# Times the pandas groupby / resample views the pages used to compute against
+# AggregationEngine (aggregation.py) on the same transactions, and checks that
+# both give the same numbers. The engine is built once per data version, so its
+# build time is reported separately from the per-view times.
+#
+#   python bench_aggregation.py                      # finance.db
+#   python bench_aggregation.py --rows 1000000       # synthetic frame of N rows
+#   python bench_aggregation.py --db other.db --repeat 5
+
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from aggregation import AggregationEngine
+
+warnings.filterwarnings("ignore")
+
+DEFAULT_REPEAT = 3
+
+# -------------------------------
+# 1. Data
+# -------------------------------
+def load_transactions(db_path=None):
+    """Date / Amount / Type / Category / Account rows as every page loads them (data_access.py, MYR)."""
+    from data_access import read_transactions
+
+    return read_transactions(db_path)[['Date', 'Amount', 'Type', 'Category', 'Account']]
+
+def synthetic_transactions(n_rows, seed=42):
+    """n_rows random transactions over ten years, 20 categories, 5 accounts."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2015-01-01").value
+    end = pd.Timestamp("2024-12-31").value
+    return pd.DataFrame({
+        'Date': pd.to_datetime(rng.integers(start, end, n_rows)).normalize(),
+        'Amount': rng.gamma(2.0, 40.0, n_rows).round(2),
+        'Type': rng.choice(['INCOME', 'EXPENSE'], n_rows, p=[0.2, 0.8]),
+        'Category': rng.choice([f"Category {i:02d}" for i in range(20)], n_rows),
+        'Account': rng.choice(['Cash', 'Card', 'Bank', 'E-Wallet', 'Other'], n_rows),
+    })
+
+# -------------------------------
+# 2. Views (pandas path, engine path)
+# -------------------------------
+def views(df, engine, today):
+    month = df['Date'].dt.to_period('M')
+    expense = df['Type'] == 'EXPENSE'
+    return {
+        "type totals": (
+            lambda: df.groupby('Type')['Amount'].sum(),
+            lambda: engine.sum('Type')),
+        "monthly expense by category": (
+            lambda: df[expense].groupby([df['Date'].dt.to_period('M'), 'Category'])['Amount'].sum().unstack(fill_value=0),
+            lambda: engine.sum(['M', 'Category'], Type='EXPENSE')),
+        "yearly expense by category": (
+            lambda: df[expense].groupby([df['Date'].dt.year, 'Category'])['Amount'].sum().unstack(fill_value=0),
+            lambda: engine.sum(['Y', 'Category'], Type='EXPENSE')),
+        "account × type": (
+            lambda: df.groupby(['Account', 'Type'])['Amount'].sum().unstack(fill_value=0),
+            lambda: engine.sum(['Account', 'Type'])),
+        "month × type": (
+            lambda: df.groupby([df['Date'].dt.to_period('M'), 'Type'])['Amount'].sum().unstack(fill_value=0),
+            lambda: engine.sum(['M', 'Type'])),
+        "monthly expense (resample)": (
+            lambda: df[expense].set_index('Date')['Amount'].resample('M').sum(),
+            lambda: engine.sum('M', fill=True, Type='EXPENSE')),
+        "this month by category": (
+            lambda: df[(month == today.to_period('M')) & expense].groupby('Category')['Amount'].sum(),
+            lambda: engine.sum('Category', Type='EXPENSE', M=today)),
+        "active months per category": (
+            lambda: df[expense].assign(Month=month).groupby('Category')['Month'].nunique(),
+            lambda: engine.nunique('Category', 'M', Type='EXPENSE')),
+    }
+
+def _same(a, b):
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return a.shape == b.shape and np.allclose(a, b)
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+# -------------------------------
+# 3. Harness
+# -------------------------------
+def run_benchmark(df, repeat=DEFAULT_REPEAT, today=None):
+    """One row per view: pandas and engine time (best of `repeat`, ms), speedup, equal results."""
+    today = pd.Timestamp(today) if today is not None else df['Date'].max()
+    t0 = time.perf_counter()
+    engine = AggregationEngine(df)
+    build_ms = (time.perf_counter() - t0) * 1000
+    rows = []
+    for name, (pandas_fn, engine_fn) in views(df, engine, today).items():
+        t_pandas, expected = _best_of(pandas_fn, repeat)
+        t_engine, got = _best_of(engine_fn, repeat)
+        rows.append({
+            'view': name, 'pandas_ms': t_pandas * 1000, 'engine_ms': t_engine * 1000,
+            'speedup': t_pandas / max(t_engine, 1e-9), 'same': _same(expected, got),
+        })
+    return pd.DataFrame(rows), build_ms
+
+def build_report(results, build_ms, n_rows):
+    total_pandas = results['pandas_ms'].sum()
+    total_engine = results['engine_ms'].sum()
+    return "\n".join([
+        "# Aggregation Benchmark", "",
+        f"Rows: {n_rows:,} | engine build: {build_ms:,.1f} ms (once per data version)", "",
+        results.round(2).to_markdown(index=False), "",
+        f"All views: pandas {total_pandas:,.1f} ms vs engine {total_engine:,.1f} ms "
+        f"({total_pandas / max(total_engine, 1e-9):.1f}x, {(total_pandas / max(total_engine + build_ms, 1e-9)):.1f}x incl. build)",
+    ])
+
+# -------------------------------
+# 4. CLI
+# -------------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pandas groupby views against the bincount aggregation engine")
+    parser.add_argument("--db", default=None, help="Path to the SQLite database (default: database.DB_PATH)")
+    parser.add_argument("--rows", type=int, default=None, help="Use a synthetic frame of this many rows instead")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed runs per view (best is kept)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    df = synthetic_transactions(args.rows) if args.rows else load_transactions(args.db)
+    results, build_ms = run_benchmark(df, repeat=max(1, args.repeat))
+    print(build_report(results, build_ms, len(df)))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# data_access.py
+# The one place the app reads transactions. Every page gets the same cleaned,
+# typed frame for the current data version from one shared cache entry, so a
+# full navigation cycle (dashboard → trends → chatbot → records → settings)
+# reads the table once instead of once per page.
+# The frame is held once per process with read-only column arrays; pages get
+# a shallow view of it (no row data copied per rerun or per session). Adding
+# columns to a view is fine, writing into existing ones raises ValueError.
+# A new version that only added rows is caught up by reading the rows past the
+# last rowid seen; the whole table is re-read only after an edit or delete.
+# The database file is database.DB_PATH (set FINANCE_DB_PATH to move it).
+#
+#   from data_access import load_transactions
+#   df = load_transactions()                 # read-only view, cached per data version (pages)
+#   df = read_transactions("other.db")       # uncached (scripts, workers)
+#   for chunk in stream_transactions(chunksize=50_000, columns=['category']): ...   # bounded memory (batch jobs)
+#   bad = load_invalid_transactions(data_version)   # the raw rows left out (records page)
+#   raw = read_raw_transactions()            # the table as stored (exports / backups)
+#   cube = load_forecast_cube(data_version)  # forecast cube shared by trends / chatbot / settings
+#   worker = get_forecast_worker()           # the one background forecast worker per process
+#
+# Columns: id, Date, Title, Category, Account, Amount, Currency, Type,
+# Is_Recurring, Interval, Created_At, Net. Amounts are in MYR; only INCOME /
+# EXPENSE rows with a valid date and amount are kept, in insertion order.
+
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import DB_PATH, get_data_version
+
+SOURCE_COLUMNS = ['id', 'date', 'title', 'category', 'account', 'amount', 'currency', 'type',
+                  'is_recurring', 'interval', 'created_at']
+COLUMNS = ['id', 'Date', 'Title', 'Category', 'Account', 'Amount', 'Currency', 'Type',
+           'Is_Recurring', 'Interval', 'Created_At', 'Net']
+TYPES = ['INCOME', 'EXPENSE']
+
+# -------------------------------
+# 1. Read + Clean (no Streamlit)
+# -------------------------------
+# Raw column → (clean column, cleaner), in COLUMNS order
+CLEANERS = {
+    'id': ('id', lambda s: s),
+    'date': ('Date', lambda s: pd.to_datetime(s, errors='coerce', format='mixed')),
+    'title': ('Title', lambda s: s.fillna('No Title').str.strip()),
+    'category': ('Category', lambda s: s.fillna('Uncategorized').str.strip().str.title()),
+    'account': ('Account', lambda s: s.fillna('Unknown').str.strip().str.title()),
+    'amount': ('Amount', lambda s: pd.to_numeric(s, errors='coerce')),
+    'currency': ('Currency', lambda s: s.fillna('MYR')),
+    'type': ('Type', lambda s: s.str.strip().str.upper()),
+    'is_recurring': ('Is_Recurring', lambda s: pd.to_numeric(s, errors='coerce').fillna(0).astype(int)),
+    'interval': ('Interval', lambda s: s.fillna('').astype(str).str.strip().str.lower()),
+    'created_at': ('Created_At', lambda s: pd.to_datetime(s, errors='coerce', format='mixed')),
+}
+
+def clean_transactions(raw):
+    """
+    Typed, normalised frame (see COLUMNS) from raw `transactions` rows. Only
+    the columns raw has are cleaned; date, amount and type are required.
+    """
+    df = pd.DataFrame({name: clean(raw[col]) for col, (name, clean) in CLEANERS.items() if col in raw})
+    df = df.dropna(subset=['Date', 'Amount'])
+    df = df[df['Type'].isin(TYPES)].reset_index(drop=True)
+    df['Net'] = np.where(df['Type'] == 'INCOME', df['Amount'], -df['Amount'])
+    return df
+
+def invalid_rows(raw):
+    """Mask of the raw rows clean_transactions drops: no valid date or amount, or another type."""
+    dates = pd.to_datetime(raw['date'], errors='coerce', format='mixed')
+    amounts = pd.to_numeric(raw['amount'], errors='coerce')
+    types = raw['type'].str.strip().str.upper()
+    return (dates.isna() | amounts.isna() | ~types.isin(TYPES)).to_numpy()
+
+def freeze(df):
+    """Same frame rebuilt on read-only column arrays, so in-place writes raise instead of leaking."""
+    arrays = {}
+    for col in df.columns:
+        values = df[col].to_numpy(copy=True)
+        values.flags.writeable = False
+        arrays[col] = values
+    return pd.DataFrame(arrays, index=df.index, copy=False)
+
+def _read_raw(conn, after_rowid=0, chunksize=None, columns=SOURCE_COLUMNS):
+    """Raw rows with rowid > after_rowid, oldest first, plus their rowid (an iterator of frames with chunksize)."""
+    return pd.read_sql_query(
+        f"SELECT rowid AS row_id, {', '.join(columns)} FROM transactions WHERE rowid > ? ORDER BY rowid",
+        conn, params=(after_rowid,), chunksize=chunksize)
+
+def read_transactions(db_path=None):
+    """Every transaction from db_path (default database.DB_PATH), cleaned."""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        raw = _read_raw(conn)
+    finally:
+        conn.close()
+    return clean_transactions(raw)
+
+def stream_transactions(db_path=None, chunksize=50_000, columns=SOURCE_COLUMNS):
+    """
+    read_transactions() in cleaned chunks of up to chunksize rows — never the
+    whole table at once — reading only the given SOURCE_COLUMNS (date, amount
+    and type always included).
+    """
+    columns = list(dict.fromkeys(['date', 'amount', 'type', *columns]))
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        for raw in _read_raw(conn, chunksize=chunksize, columns=columns):
+            yield clean_transactions(raw)
+    finally:
+        conn.close()
+
+def read_raw_transactions(db_path=None):
+    """Every row as stored (SOURCE_COLUMNS), oldest first: nothing parsed, filled or dropped."""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        return _read_raw(conn)[SOURCE_COLUMNS]
+    finally:
+        conn.close()
+
+def read_invalid_transactions(db_path=None):
+    """The rows read_transactions leaves out, as stored (SOURCE_COLUMNS), oldest first."""
+    raw = read_raw_transactions(db_path)
+    return raw[invalid_rows(raw)].reset_index(drop=True)
+
+# -------------------------------
+# 2. Shared Page Cache
+# -------------------------------
+class TransactionStore:
+    """
+    The shared frame for one database and where it was read up to: the last
+    rowid, and the epoch / rewrites of the data_version row (database.py).
+    sync() to a new version appends the rows past that rowid when rewrites is
+    unchanged (only inserts happened) and re-reads everything otherwise. Rowids
+    are only trusted within one epoch; database.vacuum_db() starts a new one.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.frame = freeze(pd.DataFrame(columns=COLUMNS))
+        self.version = None
+        self.state = None  # (epoch, rewrites) the frame was read at
+        self.last_rowid = 0
+
+    def sync(self, data_version):
+        """Frame at data_version; reads the database only if the version moved."""
+        with self.lock:
+            if data_version != self.version:
+                self._catch_up()
+                self.version = data_version
+            return self.frame
+
+    def _catch_up(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("BEGIN")  # one snapshot for the version row and the rows
+            state = tuple(conn.execute("SELECT epoch, rewrites FROM data_version WHERE id = 1").fetchone())
+            appended = state == self.state
+            raw = _read_raw(conn, self.last_rowid if appended else 0)
+        finally:
+            conn.close()
+        if appended and raw.empty:
+            return
+        new_rows = clean_transactions(raw)
+        if appended:
+            new_rows = pd.concat([self.frame, new_rows], ignore_index=True)
+        self.frame = freeze(new_rows)
+        self.state = state
+        if len(raw):
+            self.last_rowid = int(raw['row_id'].iloc[-1])
+
+@st.cache_resource(show_spinner=False)
+def _store(db_path):
+    # cache_resource hands every session the same object (cache_data would unpickle a copy per hit)
+    return TransactionStore(db_path)
+
+def load_transactions(data_version=None):
+    """
+    View of the shared frame for data_version (default: the current one). The
+    database is read at most once per version across all pages and sessions,
+    and only the appended rows when nothing was edited or deleted. On a
+    database error the error is shown and an empty frame is returned.
+    """
+    try:
+        if data_version is None:
+            data_version = get_data_version()
+        return _store(DB_PATH).sync(data_version).copy(deep=False)
+    except (sqlite3.Error, pd.errors.DatabaseError, SQLAlchemyError) as e:
+        st.error(f"⚠️ Database error: {e}")
+        return pd.DataFrame(columns=COLUMNS)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_invalid_transactions(data_version):
+    """read_invalid_transactions for data_version, so pages can show what the shared frame hides."""
+    try:
+        return read_invalid_transactions(DB_PATH)
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        st.error(f"⚠️ Database error: {e}")
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
+
+# -------------------------------
+# 3. Shared Forecast Resources
+# -------------------------------
+# One cache entry per process for every page (trends, chatbot, settings).
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_forecast_cube(data_version):
+    """
+    Forecast cube (forecast_engine.py) for data_version, in MYR. With DuckDB
+    installed (analytics.py) it is one GROUP BY over the live database (never
+    an ANALYTICS_SOURCE snapshot); otherwise it is built from the shared frame.
+    """
+    import analytics
+    from forecast_engine import build_forecast_cube
+
+    if analytics.available():
+        return analytics.build_cube(DB_PATH)
+    return build_forecast_cube(load_transactions(data_version))
+
+@st.cache_resource(show_spinner=False)
+def get_forecast_worker():
+    """The process's one forecast worker thread; jobs and forecasts live in forecasts.db."""
+    from forecast_worker import ForecastWorker
+
+    return ForecastWorker()
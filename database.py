@@ -1,16 +1,18 @@
 # database.py
 import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, Numeric, DateTime, func, update, delete, text
+from sqlalchemy import create_engine, Column, Integer, String, Numeric, DateTime, func, update, delete, text, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import date
 import os
 import hashlib
+import sqlite3
+import threading
 
 # -------------------------------
 # 1. Setup SQLite Engine
 # -------------------------------
-DB_PATH = "finance.db"
+DB_PATH = os.getenv("FINANCE_DB_PATH", "finance.db")
 engine = create_engine(
     f"sqlite:///{DB_PATH}",
     echo=False,
@@ -53,6 +55,36 @@ class Transaction(Base):
 # -------------------------------
 # 4. Initialize DB (Create Table)
 # -------------------------------
+# Data-version counter (section 10): triggers count every insert / update /
+# delete, whichever process or tool makes it; the epoch tells a recreated
+# database apart from an old one. rewrites only counts edits and deletes, so a
+# reader that saw the same rewrites can fetch just the appended rows. VACUUM can
+# renumber rowids without firing a trigger, so it goes through vacuum_db() (section 12).
+# Triggers are recreated on start so older databases pick up the rewrites bump.
+VERSION_BUMPS = {"INSERT": "", "UPDATE": ", rewrites = rewrites + 1", "DELETE": ", rewrites = rewrites + 1"}
+DATA_VERSION_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch TEXT NOT NULL,
+        counter INTEGER NOT NULL DEFAULT 0,
+        rewrites INTEGER NOT NULL DEFAULT 0
+    )""",
+    "INSERT OR IGNORE INTO data_version (id, epoch) VALUES (1, lower(hex(randomblob(8))))",
+] + [f"DROP TRIGGER IF EXISTS transactions_{op.lower()}_version" for op in VERSION_BUMPS] + [
+    f"""CREATE TRIGGER transactions_{op.lower()}_version AFTER {op} ON transactions
+        BEGIN UPDATE data_version SET counter = counter + 1{bump} WHERE id = 1; END"""
+    for op, bump in VERSION_BUMPS.items()
+]
+
+# Indexes behind aggregate() (section 11). The type expression matches how
+# data_access cleans it, so filtering on it can seek instead of scanning, and
+# date / amount / category / account ride along for covering GROUP BY scans.
+TYPE_SQL = "upper(trim(type))"
+AGGREGATE_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS ix_transactions_type_date ON transactions ({TYPE_SQL}, date, amount, category, account)",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_date ON transactions (date)",
+]
+
 def init_db():
     Base.metadata.create_all(engine)
 
@@ -84,6 +116,13 @@ def init_db():
             VALUES ('ali', 'ali@gmail.com', :hash, 'user')
         """), {"hash": hashed_ali})
 
+        # Write counter behind get_data_version()
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(data_version)"))}
+        if columns and 'rewrites' not in columns:  # version tables created before incremental loading
+            conn.execute(text("ALTER TABLE data_version ADD COLUMN rewrites INTEGER NOT NULL DEFAULT 0"))
+        for stmt in DATA_VERSION_SCHEMA + AGGREGATE_INDEXES:
+            conn.execute(text(stmt))
+
         conn.commit()
 
 # RUN AUTOMATICALLY
@@ -193,3 +232,156 @@ def delete_transaction(trans_id: str):
     finally:
         session.close()
 
+
+# -------------------------------
+# 10. Data Version (cache key)
+# -------------------------------
+# Every cached loader and derived computation takes get_data_version() as an
+# argument, so caches stay valid until the transactions change — and no longer.
+# DATA_VERSION_SCHEMA (section 4) keeps the write counter.
+_writes = 0  # commits made through this process' engine
+_version_lock = threading.Lock()
+_version_probe = {'conn': None, 'seen': None, 'token': None}
+
+@event.listens_for(engine, "commit")
+def _count_write(conn):
+    global _writes
+    _writes += 1
+
+def get_data_version():
+    """
+    Token ("<epoch>-<counter>") that changes whenever a transaction is added,
+    edited or deleted. PRAGMA data_version on one long-lived read connection
+    (it moves when any other connection commits) plus this process' commit
+    count say whether anything can have changed; only then is the counter
+    row re-read, so a call is two tiny queries at most. Tokens are the same
+    in every process and survive restarts, so stored forecasts keep matching.
+    """
+    with _version_lock:
+        if _version_probe['conn'] is None:
+            _version_probe['conn'] = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn = _version_probe['conn']
+        seen = (conn.execute("PRAGMA data_version").fetchone()[0], _writes)
+        if seen != _version_probe['seen']:
+            epoch, counter = conn.execute("SELECT epoch, counter FROM data_version WHERE id = 1").fetchone()
+            _version_probe.update(seen=seen, token=f"{epoch}-{counter}")
+        return _version_probe['token']
+
+# -------------------------------
+# 11. Aggregation Pushdown (GROUP BY inside SQLite)
+# -------------------------------
+# Totals like "income this month" or "expense per account" run as one
+# parameterised GROUP BY over the indexes above and return a small frame,
+# instead of loading every row into pandas. Rows and labels are cleaned the
+# way data_access does it (only INCOME / EXPENSE with a date and amount,
+# trimmed, title-cased, defaults for missing labels), so results match the
+# frame-based pages. Period groups come back as period start dates.
+#
+#   aggregate(group_by=['Category'], typ='EXPENSE', date_range=('2025-11-01', '2025-12-01'))
+#   aggregate(['sum', 'count'], group_by=['M', 'Type'])
+AGGREGATE_GROUPS = {
+    'Type': TYPE_SQL,
+    'Category': "trim(COALESCE(category, 'Uncategorized'))",
+    'Account': "trim(COALESCE(account, 'Unknown'))",
+    'D': "date(date)",
+    'W': "date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 6) % 7) || ' days')",
+    'M': "strftime('%Y-%m-01', date)",
+    'Y': "strftime('%Y-01-01', date)",
+}
+AGGREGATE_MEASURES = {  # measure → (SQL, how to combine groups that clean to the same label)
+    'sum': ("SUM(amount)", 'sum'),
+    'count': ("COUNT(*)", 'sum'),
+    'net': (f"SUM(CASE WHEN {TYPE_SQL} = 'INCOME' THEN amount ELSE -amount END)", 'sum'),
+    'min': ("MIN(amount)", 'min'),
+    'max': ("MAX(amount)", 'max'),
+}
+
+def _sql_time(value):
+    # Dates are stored as "YYYY-MM-DD HH:MM:SS[.ffffff]" text; a bare day compares below any time on it
+    ts = pd.Timestamp(value)
+    return ts.strftime('%Y-%m-%d') if ts == ts.normalize() else ts.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def aggregate(measures=('sum',), group_by=(), date_range=None, typ=None, rowid_range=None, db_path=None):
+    """
+    One row per group_by combination (all rows if empty) with one column per
+    measure, in MYR. date_range is (start, end) with end exclusive, either may
+    be None; rowid_range (after, upto] limits it to rows inserted in between.
+    """
+    measures = [measures] if isinstance(measures, str) else list(measures)
+    group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+    unknown = [m for m in measures if m not in AGGREGATE_MEASURES] + [g for g in group_by if g not in AGGREGATE_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown measure / group {unknown}. Choose from {list(AGGREGATE_MEASURES)} / {list(AGGREGATE_GROUPS)}")
+
+    where = ["date(date) IS NOT NULL", "amount IS NOT NULL"]
+    params = []
+    if typ is None:
+        where.append(f"{TYPE_SQL} IN ('INCOME', 'EXPENSE')")
+    else:
+        where.append(f"{TYPE_SQL} = ?")
+        params.append(typ.strip().upper())
+    start, end = date_range or (None, None)
+    if start is not None:
+        where.append("date >= ?")
+        params.append(_sql_time(start))
+    if end is not None:
+        where.append("date < ?")
+        params.append(_sql_time(end))
+    if rowid_range is not None:
+        where.append("rowid > ? AND rowid <= ?")
+        params.extend(rowid_range)
+
+    select = [f"{AGGREGATE_GROUPS[g]} AS \"{g}\"" for g in group_by]
+    select += [f"{AGGREGATE_MEASURES[m][0]} AS \"{m}\"" for m in measures]
+    query = f"SELECT {', '.join(select)} FROM transactions WHERE {' AND '.join(where)}"
+    if group_by:
+        query += f" GROUP BY {', '.join(str(i) for i in range(1, len(group_by) + 1))}"
+
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        result = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    if not group_by:
+        return result.fillna({m: 0 for m in measures if m in ('sum', 'count', 'net')})
+
+    for g in group_by:
+        if g in ('Category', 'Account'):
+            result[g] = result[g].str.title()
+        elif g != 'Type':
+            result[g] = pd.to_datetime(result[g])
+    # Title-casing can merge groups ("food" and "Food"), so combine them again
+    combine = {m: AGGREGATE_MEASURES[m][1] for m in measures}
+    return result.groupby(group_by, as_index=False, sort=True).agg(combine)
+
+def get_write_state():
+    """
+    (epoch, rewrites, last rowid) of the transactions table: while epoch and
+    rewrites stay the same, everything past that rowid was appended since
+    (vacuum_db() starts a new epoch, since VACUUM may renumber rowids).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        conn.execute("BEGIN")
+        epoch, rewrites = conn.execute("SELECT epoch, rewrites FROM data_version WHERE id = 1").fetchone()
+        last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM transactions").fetchone()[0]
+    finally:
+        conn.close()
+    return epoch, rewrites, last_rowid
+
+# -------------------------------
+# 12. Maintenance
+# -------------------------------
+# transactions.id is a TEXT key, so rowid is not an alias for it and VACUUM may
+# renumber the rows. Incremental readers (data_access.TransactionStore, the
+# dashboard bundle) trust rowids while epoch and rewrites are unchanged, so
+# never VACUUM the database directly: vacuum_db() starts a new epoch afterwards,
+# which moves the data version and makes every reader load the table again.
+def vacuum_db(db_path=None):
+    """VACUUM the database, then start a new data-version epoch."""
+    conn = sqlite3.connect(db_path or DB_PATH, isolation_level=None)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("UPDATE data_version SET epoch = lower(hex(randomblob(8))), counter = counter + 1 WHERE id = 1")
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+# downsample.py
+# Point budget for time-series charts, applied before the Plotly figure is
+# built so transfer size and render time stay flat at any history length.
+#   lines: largest-triangle-three-buckets (LTTB) keeps the first and last
+#          point and, per bucket, the point spanning the largest triangle —
+#          peaks and dips survive, flat stretches are thinned.
+#   bars:  consecutive bars are merged into wider buckets (sum or mean).
+# Series already within the budget are returned unchanged.
+#
+#   line = df.iloc[lttb(df['Date'], df['Amount'], CHART_POINT_BUDGET)]
+#   bars = rebucket(df, 'Date', 'Amount', CHART_POINT_BUDGET, how='mean')
+
+import os
+
+import numpy as np
+
+CHART_POINT_BUDGET = int(os.getenv("CHART_POINT_BUDGET", "400"))
+
+# -------------------------------
+# 1. Lines (LTTB)
+# -------------------------------
+def lttb(x, y, n_out: int = CHART_POINT_BUDGET):
+    """Positions of the n_out points LTTB keeps, in order (all positions if len(y) <= n_out)."""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets between first and last
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        nlo, nhi = (bounds[i + 1], bounds[i + 2]) if i + 2 < len(bounds) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+# -------------------------------
+# 2. Bars (re-bucketing)
+# -------------------------------
+def rebucket(df, x: str, y: str, n_out: int = CHART_POINT_BUDGET, how: str = 'sum'):
+    """
+    df with consecutive rows merged so at most n_out remain: x is each
+    bucket's first value, y the sum (or mean) over the bucket.
+    """
+    if len(df) <= n_out:
+        return df
+    size = -(-len(df) // n_out)
+    buckets = np.arange(len(df)) // size
+    return df.groupby(buckets).agg({x: 'first', y: how}).reset_index(drop=True)
@@ -0,0 +1,67 @@
+# figure_cache.py
+# Finished Plotly figures shared by every session, keyed by everything they
+# are drawn from: (data_version, chart id, currency, rate, view parameters...).
+# An unchanged chart is served without rebuilding its traces; the data
+# version in the key retires old figures, least recently used first.
+# Size is the figure's serialized JSON (what the browser receives) and the
+# total is capped at FIGURE_CACHE_MB (default 64).
+#
+#   fig = cached_figure((data_version, "donut", currency, rate), lambda: build_donut(...))
+#   st.plotly_chart(fig)                       # treat cached figures as read-only
+#   get_figure_cache().stats()                 # {'entries': 12, 'bytes': 640512, 'hits': 40, 'misses': 12}
+
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+import streamlit as st
+
+FIGURE_CACHE_MB = float(os.getenv("FIGURE_CACHE_MB", "64"))
+
+class FigureCache:
+    """
+    LRU of figures with a byte cap. Entries hold the built go.Figure (handing
+    Streamlit a figure rebuilt from JSON would re-validate every trace, which
+    costs as much as building it) and the length of its JSON for the cap.
+    """
+
+    def __init__(self, max_bytes=int(FIGURE_CACHE_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key → (figure, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_or_build(self, key, build):
+        """Cached figure for key, else build() — stored unless it alone exceeds the cap."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        fig = build()
+        size = len(pio.to_json(fig, validate=False))
+        if size > self.max_bytes:
+            return fig
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (fig, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return fig
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+@st.cache_resource
+def get_figure_cache():
+    # One cache per server process, shared by every session and page
+    return FigureCache()
+
+def cached_figure(key, build):
+    return get_figure_cache().get_or_build(key, build)
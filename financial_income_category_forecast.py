@@ -1,41 +1,48 @@
 # financial_income_category_forecast.py
 # FULL AI: Income + Expense + Category-Level Forecasting (All Horizons)
 # FIXED: UnicodeEncodeError → Uses only ASCII-safe characters
+#
+# Importable engine + CLI. Nothing runs at import time:
+#   from financial_income_category_forecast import run_forecast
+#   results = run_forecast(horizons=["2 Months"], types=["EXPENSE"], plots=False, ml=False)
+#
+#   python financial_income_category_forecast.py --horizons "2 Months" "1 Year" \
+#       --types expense --categories Food Bills --jobs 4 --no-plots --no-ml
+#
+#   python financial_income_category_forecast.py --stream --no-ml --chunksize 100000   # very large databases
+#   (with duckdb installed --stream aggregates the whole table in one GROUP BY instead, see analytics.py)
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from prophet import Prophet
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
-from xgboost import XGBClassifier
-from sklearn.preprocessing import LabelEncoder
+import argparse
+import atexit
+import io
+import json
 import warnings
 import os
+import sys
 import sqlite3
-import requests
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-
-# -------------------------------
-# FORCE UTF-8 OUTPUT (Windows fix)
-# -------------------------------
-import sys
-import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+import analytics
+from aggregation import AggregationCube, CubeBuilder
+from forecast_engine import (MIN_HISTORY_PERIODS, NET_HORIZON, NET_PERIODS, QUALITY_TIERS, RECONCILE_METHOD,
+                             build_history, forecast_dates, new_prophet)
+from reconciliation import NET_CATEGORY, NET_TYPE, TOTAL_CATEGORIES, is_aggregate, reconcile
+from forecast_charts import CHART_MODES, ChartRenderer, make_chart_spec
 
 warnings.filterwarnings("ignore")
-plt.style.use('seaborn-v0_8')
-sns.set_palette("husl")
 
 # ----------------------------
 # CONFIG — NOW USING DATABASE
 # ----------------------------
-DB_FILE = "finance.db"           # Your new database
+DB_FILE = os.getenv("FINANCE_DB_PATH", "finance.db")  # same default as database.DB_PATH
 TABLE_NAME = "transactions"      # Change if your table has different name
 OUTPUT_DIR = "income_expense_forecast"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+MODEL_DIR = os.getenv("FINANCE_MODEL_DIR", "models")  # versioned next-transaction models
+BATCH_TIER = QUALITY_TIERS["batch"]  # offline runs always use full uncertainty sampling
 
 # Horizons
 HORIZONS = [
@@ -45,61 +52,70 @@ HORIZONS = [
     ("4 Months", 4, 'M'),
     ("1 Year", 12, 'M')
 ]
-
-print("ULTIMATE AI FINANCIAL ENGINE — Powered by finance.db")
-print("="*80)
+HORIZON_LABELS = [h[0] for h in HORIZONS]
+TYPES = ['INCOME', 'EXPENSE']
+OUTPUT_FORMATS = ['csv', 'json', 'none']
+RAW_COLUMNS = ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+CHUNK_ROWS = 50_000  # rows per chunk in --stream mode
 
 # ----------------------------
 # 1. Load from SQLite Database
 # ----------------------------
-print(f"Connecting to database: {DB_FILE}...")
-try:
-    conn = sqlite3.connect(DB_FILE)
-    query = f"SELECT * FROM {TABLE_NAME}"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    print(f"Loaded {len(df):,} transactions from database")
-except Exception as e:
-    raise ConnectionError(f"Cannot connect to {DB_FILE}: {e}")
-
-# Drop unnamed columns
-df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-
-# Replace NULL
-df = df.replace(['NULL', 'null', ''], np.nan)
-
-# Required columns (adjust if your DB uses different names)
-required = ['date', 'title', 'category', 'account', 'amount', 'currency', 'type']
-missing = [col for col in required if col not in df.columns]
-if missing:
-    raise ValueError(f"Missing columns in database: {missing}")
-
-# Parse date
-df['Date'] = pd.to_datetime(df['date'], errors='coerce')
-df = df.dropna(subset=['Date'])
-
-# Parse amount
-df['Amount'] = pd.to_numeric(df['amount'], errors='coerce')
-df = df.dropna(subset=['Amount'])
-
-# Parse type
-df['Type'] = df['type'].astype(str).str.strip().str.upper()
-df = df[df['Type'].isin(['INCOME', 'EXPENSE'])]
-
-# Optional columns
-df['is_recurring'] = pd.to_numeric(df.get('is_recurring', 0), errors='coerce').fillna(0).astype(int)
-df['interval'] = df.get('interval', '').astype(str).str.strip().str.lower().fillna('')
-
-# Clean column names
-df = df.rename(columns={
-    'title': 'Title',
-    'category': 'Category',
-    'account': 'Account',
-    'currency': 'Currency'
-})
+def load_transactions(db_file=DB_FILE, log=print):
+    """Every transaction, cleaned exactly as the pages and the forecast worker see it (data_access.py)."""
+    from data_access import read_transactions
+
+    log(f"Connecting to database: {db_file}...")
+    try:
+        df = read_transactions(db_file)
+    except Exception as e:
+        raise ConnectionError(f"Cannot connect to {db_file}: {e}")
+    log(f"Loaded {len(df):,} transactions from database")
+    return df
+
+def stream_transactions(db_file=DB_FILE, chunksize=CHUNK_ROWS):
+    """Date / Amount / Type / Category (+ Net) chunks, cleaned like load_transactions (data_access.py)."""
+    from data_access import stream_transactions as stream_cleaned
+
+    return stream_cleaned(db_file, chunksize, columns=['date', 'amount', 'type', 'category'])
+
+def build_cube_streaming(db_file=DB_FILE, exchange_rate=1.0, chunksize=CHUNK_ROWS, log=print):
+    """
+    Aggregation cube folded chunk by chunk (aggregation.CubeBuilder): peak memory
+    is one chunk plus the (day, type, category) cells. Returns (cube, stats).
+    """
+    builder = CubeBuilder()
+    stats = {'INCOME': 0, 'EXPENSE': 0, 'first': None, 'last': None}
+    try:
+        for chunk in stream_transactions(db_file, chunksize=chunksize):
+            chunk['Amount'] = chunk['Amount'] * exchange_rate
+            builder.add(chunk)
+            for typ, n in chunk['Type'].value_counts().items():
+                stats[typ] += int(n)
+            if len(chunk):
+                first, last = chunk['Date'].min(), chunk['Date'].max()
+                stats['first'] = first if stats['first'] is None else min(stats['first'], first)
+                stats['last'] = last if stats['last'] is None else max(stats['last'], last)
+            log(f"  streamed {builder.rows:,} rows → {builder.n_cells:,} cells")
+    except (sqlite3.Error, pd.errors.DatabaseError) as e:
+        raise ConnectionError(f"Cannot stream from {db_file}: {e}")
+    return builder.build(), stats
+
+def build_cube_duckdb(db_file=DB_FILE, exchange_rate=1.0):
+    """
+    The cube from one DuckDB GROUP BY over the database (analytics.py), with
+    the same (cube, stats) as build_cube_streaming; counts come from the cells.
+    """
+    try:
+        cube = analytics.build_cube(db_file, rate=exchange_rate)
+    except analytics.ERRORS as e:
+        raise ConnectionError(f"Cannot aggregate {db_file}: {e}")
+    stats = {typ: int(cube.counts[:, [i for i, (t, _) in enumerate(cube.keys) if t == typ]].sum()) for typ in TYPES}
+    stats['first'], stats['last'] = (cube.days[0], cube.days[-1]) if len(cube.days) else (None, None)
+    return cube, stats
 
 # ----------------------------
-# 2. Shared Currency Configuration 
+# 2. Shared Currency Configuration
 # ----------------------------
 # Define supported currencies (same as Streamlit)
 currency_options = [
@@ -117,7 +133,7 @@ currency_symbol_map = {
     "SEK": "kr", "NOK": "kr", "NZD": "NZ$"
 }
 
-def get_exchange_rate(base="MYR", target="MYR"):
+def get_exchange_rate(base="MYR", target="MYR", log=print):
     """Get exchange rate using the same logic as Streamlit (without Streamlit dependency)."""
     if base == target:
         return 1.0
@@ -129,234 +145,475 @@ def get_exchange_rate(base="MYR", target="MYR"):
             data = response.json()
             return data['rates'].get(target, 1.0)
     except Exception as e:
-        print(f"⚠️ Exchange rate API error: {e}. Using fallback rate = 1.0.")
+        log(f"⚠️ Exchange rate API error: {e}. Using fallback rate = 1.0.")
     return 1.0
 
-# Determine target currency (from environment or default to MYR)
-import os
-TARGET_CURRENCY = os.getenv("FORECAST_CURRENCY", "MYR")
-
-# Validate currency
-if TARGET_CURRENCY not in currency_options:
-    print(f"⚠️ Warning: '{TARGET_CURRENCY}' is not in supported currencies. Using MYR.")
-    TARGET_CURRENCY = "MYR"
-
-# Apply currency conversion if needed
-if TARGET_CURRENCY != "MYR":
-    print(f"🌍 Converting transaction amounts from MYR to {TARGET_CURRENCY}...")
-    EXCHANGE_RATE = get_exchange_rate("MYR", TARGET_CURRENCY)
-    df['Amount'] = df['Amount'] * EXCHANGE_RATE
-    print(f"✅ Applied exchange rate: 1 MYR = {EXCHANGE_RATE:.4f} {TARGET_CURRENCY}")
-else:
-    EXCHANGE_RATE = 1.0
-    print("📊 Using base currency: MYR")
-
-# Proceed with income/expense split (unchanged)
-df_income = df[df['Type'] == 'INCOME'].copy()
-df_expense = df[df['Type'] == 'EXPENSE'].copy()
-
-# Day of week
-df['DayOfWeek'] = df['Date'].dt.dayofweek
-
-# Clean categories
-df_income['Category'] = df_income['Category'].astype(str).str.strip().str.title()
-df_expense['Category'] = df_expense['Category'].astype(str).str.strip().str.title()
-
-print(f"Income rows: {len(df_income):,}")
-print(f"Expense rows: {len(df_expense):,}")
-print(f"Date range: {df['Date'].min().date()} → {df['Date'].max().date()}")
-print(f"Income sources: {sorted(df_income['Category'].unique())}")
-print(f"Expense categories: {sorted(df_expense['Category'].unique())}")
-
-# ----------------------------
-# 3. Aggregate by Frequency
-# ----------------------------
-def aggregate_by_freq(data, freq, value_col='Amount'):
-    agg = data.copy()
-    agg['Period'] = agg['Date'].dt.to_period(freq).dt.to_timestamp()
-    grouped = agg.groupby(['Period', 'Category'])[value_col].sum().unstack(fill_value=0)
-    grouped = grouped.reset_index()
-    return grouped
+def resolve_currency(currency, log=print):
+    """Validate the target currency and look up its rate from MYR. Returns (currency, rate)."""
+    if currency not in currency_options:
+        log(f"⚠️ Warning: '{currency}' is not in supported currencies. Using MYR.")
+        currency = "MYR"
+
+    if currency != "MYR":
+        log(f"🌍 Converting transaction amounts from MYR to {currency}...")
+        rate = get_exchange_rate("MYR", currency, log=log)
+        log(f"✅ Applied exchange rate: 1 MYR = {rate:.4f} {currency}")
+    else:
+        rate = 1.0
+        log("📊 Using base currency: MYR")
+    return currency, rate
+
+def apply_currency(df, currency, log=print):
+    """Validate the target currency and convert Amount from MYR. Returns (df, currency, rate)."""
+    currency, rate = resolve_currency(currency, log=log)
+    if rate != 1.0:
+        df = df.assign(Amount=df['Amount'] * rate)
+    return df, currency, rate
 
 # ----------------------------
-# 4. Forecast Series
+# 3. Forecast Series
 # ----------------------------
-def forecast_series(data, col, name, periods, freq, horizon_label, kind=""):
-    df_p = data[['Period', col]].copy()
-    df_p.columns = ['ds', 'y']
-    df_p = df_p.dropna().sort_values('ds')
-    if len(df_p) < 3:
+def chart_file_stem(name, horizon_label, kind, currency):
+    safe_name = "".join(c for c in name if c.isalnum() or c in " _-")
+    safe_h = horizon_label.replace(" ", "_")
+    cur_suffix = f"_{currency}" if currency != "MYR" else ""
+    return f"{safe_h}_{kind.lower()}_{safe_name}_forecast{cur_suffix}"
+
+@contextmanager
+def seeded_rng(seed):
+    """np.random seeded inside the block only; the global RNG state is restored afterwards."""
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+
+def fit_series(history, periods, freq):
+    """Fit one Prophet model on a ds/y history. Returns (history, full forecast frame) or None."""
+    df_p = history[['ds', 'y']].dropna().sort_values('ds')
+    if len(df_p) < MIN_HISTORY_PERIODS:
         return None
 
-    model = Prophet(
+    model = new_prophet(
         yearly_seasonality=(freq in ['D', 'W']),
         weekly_seasonality=(freq == 'D'),
         daily_seasonality=False,
         seasonality_mode='additive',
-        interval_width=0.8
+        interval_width=0.8,
+        uncertainty_samples=BATCH_TIER['uncertainty_samples']
     )
-    model.fit(df_p)
+    model.fit(df_p, iter=BATCH_TIER['iter'])
 
     future = model.make_future_dataframe(periods=periods, freq=freq)
-    forecast = model.predict(future)
-
-    # Plot
-    fig = model.plot(forecast)
-    plt.title(f"{kind} {name} - {horizon_label}")
-    plt.ylabel(TARGET_CURRENCY)  # Updated Y-label
-    safe_name = "".join(c for c in name if c.isalnum() or c in " _-")
-    safe_h = horizon_label.replace(" ", "_")
-    cur_suffix = f"_{TARGET_CURRENCY}" if TARGET_CURRENCY != "MYR" else ""
-    plt.savefig(f"{OUTPUT_DIR}/{safe_h}_{kind.lower()}_{safe_name}_forecast{cur_suffix}.png",
-                dpi=300, bbox_inches='tight')
-    plt.close()
+    with seeded_rng(0):  # reproducible uncertainty intervals → stable chart hashes
+        forecast = model.predict(future)
+    return df_p, forecast
 
+def _format_prediction(forecast, periods, freq):
     pred = forecast[['ds', 'yhat']].tail(periods).copy()
     fmt = '%Y-%m-%d' if freq in ['D', 'W'] else '%Y-%m'
     pred['ds'] = pred['ds'].dt.strftime(fmt)
     return pred.round(2)
 
-# ----------------------------
-# 5. INCOME FORECASTING
-# ----------------------------
-print("\nForecasting INCOME (overall + by source)...")
-income_categories = df_income['Category'].unique()
-
-for label, periods, freq in HORIZONS:
-    print(f"  -> {label}")
-    agg_income = aggregate_by_freq(df_income, freq)
-    agg_income['Total_Income'] = agg_income[income_categories].sum(axis=1)
-
-    # Total
-    total_forecast = forecast_series(agg_income, 'Total_Income', 'Total Income', periods, freq, label, kind="Income")
-
-    # Per source
-    source_forecasts = []
-    for cat in income_categories:
-        print(f"     - {cat}")  # ASCII-safe
-        f = forecast_series(agg_income, cat, cat, periods, freq, label, kind="Income")
-        if f is not None:
-            f['Source'] = cat
-            source_forecasts.append(f)
-
-    if total_forecast is not None and source_forecasts:
-        safe_label = label.replace(" ", "_")
-        cur_suffix = f"_{TARGET_CURRENCY}" if TARGET_CURRENCY != "MYR" else ""
-        total_path = f"{OUTPUT_DIR}/{safe_label}_TOTAL_INCOME{cur_suffix}.csv"
-        total_forecast.rename(columns={'ds': 'Date', 'yhat': 'Predicted_Income'}).to_csv(total_path, index=False)
-
-        combined = pd.concat(source_forecasts, ignore_index=True)
-        combined = combined[['ds', 'Source', 'yhat']].rename(columns={'ds': 'Date', 'yhat': 'Predicted_Income'})
-        src_path = f"{OUTPUT_DIR}/{safe_label}_INCOME_BY_SOURCE{cur_suffix}.csv"
-        combined.to_csv(src_path, index=False)
+def _forecast_task(args):
+    # Top-level so ProcessPoolExecutor can pickle it.
+    # Returns the raw future frame plus the data the chart stage needs (no rendering here).
+    key, history, kw = args
+    fitted = fit_series(history, kw['periods'], kw['freq'])
+    if fitted is None:
+        return key, None, None
+    history, forecast = fitted
+    chart = None
+    if kw['chart']:
+        chart = make_chart_spec(
+            history, forecast,
+            title=f"{kw['kind']} {kw['name']} - {kw['horizon_label']}",
+            ylabel=kw['currency'],
+            file_stem=chart_file_stem(kw['name'], kw['horizon_label'], kw['kind'], kw['currency']),
+        )
+    return key, forecast[RAW_COLUMNS].tail(kw['periods']).reset_index(drop=True), chart
+
+_pool = None  # (jobs, executor) kept warm across run_forecast calls
+
+def _get_pool(jobs):
+    """Long-lived fit workers: imports and compiled models are paid for once per process."""
+    global _pool
+    if _pool is None or _pool[0] != jobs:
+        if _pool is not None:
+            _pool[1].shutdown()
+        _pool = (jobs, ProcessPoolExecutor(max_workers=jobs))
+    return _pool[1]
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None:
+        _pool[1].shutdown(cancel_futures=True)
+
+def _scaled(pred, exchange_rate):
+    """A stored (MYR) forecast in the report currency."""
+    return pred.assign(**{c: pred[c] * exchange_rate for c in RAW_COLUMNS[1:]})
 
 # ----------------------------
-# 6. EXPENSE FORECASTING
+# 4. ML Predictions
 # ----------------------------
-print("\nForecasting EXPENSE by category...")
-expense_categories = df_expense['Category'].unique()
-
-for label, periods, freq in HORIZONS:
-    print(f"  -> {label}")
-    agg_expense = aggregate_by_freq(df_expense, freq)
-
-    forecasts = []
-    for cat in expense_categories:
-        print(f"     - {cat}")  # ASCII-safe
-        f = forecast_series(agg_expense, cat, cat, periods, freq, label, kind="Expense")
-        if f is not None:
-            f['Category'] = cat
-            forecasts.append(f)
-
-    if forecasts:
-        combined = pd.concat(forecasts, ignore_index=True)
-        combined = combined[['ds', 'Category', 'yhat']].rename(columns={'ds': 'Date', 'yhat': 'Predicted_Spending'})
-        safe_label = label.replace(" ", "_")
-        cur_suffix = f"_{TARGET_CURRENCY}" if TARGET_CURRENCY != "MYR" else ""
-        path = f"{OUTPUT_DIR}/{safe_label}_EXPENSE_BY_CATEGORY{cur_suffix}.csv"
-        combined.to_csv(path, index=False)
+def train_next_transaction_models(df, model_dir=MODEL_DIR, log=print):
+    """
+    Returns (next amount MAE, predicted next category). df must be in MYR.
+    Models are versioned artefacts (see ml_models.py): loaded when the data is
+    unchanged, extended by continued boosting when rows were only appended.
+    """
+    from ml_models import predict_next_category, update_models
 
-# ----------------------------
-# 7. NET BALANCE
-# ----------------------------
-print("\nForecasting NET BALANCE (6 months)...")
-monthly_income = df_income.groupby(df_income['Date'].dt.to_period('M').dt.to_timestamp())['Amount'].sum().reset_index()
-monthly_expense = df_expense.groupby(df_expense['Date'].dt.to_period('M').dt.to_timestamp())['Amount'].sum().reset_index()
-
-monthly = pd.merge(monthly_income, monthly_expense, on='Date', how='outer', suffixes=('_Income', '_Expense')).fillna(0)
-monthly['Net'] = monthly['Amount_Income'] - monthly['Amount_Expense']
-
-df_net = monthly[['Date', 'Net']].copy()
-df_net.columns = ['ds', 'y']
-
-if len(df_net) >= 3:
-    model_net = Prophet(yearly_seasonality=True)
-    model_net.fit(df_net)
-    future_net = model_net.make_future_dataframe(periods=6, freq='M')
-    forecast_net = model_net.predict(future_net)[['ds', 'yhat']].tail(6)
-    forecast_net['ds'] = forecast_net['ds'].dt.strftime('%Y-%m')
-    forecast_net = forecast_net.round(2).rename(columns={'ds': 'Month', 'yhat': 'Predicted_Net'})
-else:
-    forecast_net = pd.DataFrame({'Month': [], 'Predicted_Net': []})
-
-cur_suffix = f"_{TARGET_CURRENCY}" if TARGET_CURRENCY != "MYR" else ""
-net_path = f"{OUTPUT_DIR}/NET_BALANCE_6_MONTHS{cur_suffix}.csv"
-forecast_net.to_csv(net_path, index=False)
+    bundle = update_models(df, model_dir, log=log)
+    return bundle['meta']['mae'], predict_next_category(bundle, df)
 
 # ----------------------------
-# 8. ML Predictions
+# 5. Outputs
 # ----------------------------
-print("\nTraining next-transaction models...")
-X_amt = pd.get_dummies(df[['Category', 'Account', 'DayOfWeek']], columns=['Category', 'Account'], drop_first=True)
-y_amt = df['Amount']
-X_train, X_test, y_train, y_test = train_test_split(X_amt, y_amt, test_size=0.2, random_state=42)
-rf = RandomForestRegressor(n_estimators=100, random_state=42)
-rf.fit(X_train, y_train)
-mae = mean_absolute_error(y_test, rf.predict(X_test))
-
-X_cat = pd.get_dummies(df[['Amount', 'Account', 'DayOfWeek']], columns=['Account'], drop_first=True)
-y_cat = df['Category']
-le = LabelEncoder()
-y_cat_encoded = le.fit_transform(y_cat)
-xgb = XGBClassifier(random_state=42, eval_metric='mlogloss')
-xgb.fit(X_cat, y_cat_encoded)
-pred_cat_encoded = xgb.predict(X_cat.iloc[-1:].copy())[0]
-pred_cat = le.inverse_transform([pred_cat_encoded])[0]
-
-# ----------------------------
-# 9. Final Report
-# ----------------------------
-report = f"""
-# Full Financial AI Report — {TARGET_CURRENCY}
+def _output_tables(results):
+    """Flatten results into {file stem: DataFrame} using the original CSV names."""
+    cur_suffix = f"_{results['currency']}" if results['currency'] != "MYR" else ""
+    tables = {}
+    for label, h in results['horizons'].items():
+        safe_label = label.replace(" ", "_")
+        if h.get('income_total') is not None:
+            tables[f"{safe_label}_TOTAL_INCOME{cur_suffix}"] = h['income_total']
+        if h.get('income_by_source') is not None:
+            tables[f"{safe_label}_INCOME_BY_SOURCE{cur_suffix}"] = h['income_by_source']
+        if h.get('expense_by_category') is not None:
+            tables[f"{safe_label}_EXPENSE_BY_CATEGORY{cur_suffix}"] = h['expense_by_category']
+    if results.get('net') is not None:
+        tables[f"NET_BALANCE_6_MONTHS{cur_suffix}"] = results['net']
+    return tables
+
+def build_report(results):
+    currency = results['currency']
+    forecast_net = results.get('net')
+    report = f"""
+# Full Financial AI Report — {currency}
 **Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M')}
-**Base Currency:** MYR → **Forecast Currency:** {TARGET_CURRENCY}
-**Exchange Rate Used:** 1 MYR = {EXCHANGE_RATE:.4f} {TARGET_CURRENCY}
+**Base Currency:** MYR → **Forecast Currency:** {currency}
+**Exchange Rate Used:** 1 MYR = {results['exchange_rate']:.4f} {currency}
 
 ## Summary
-- Income entries: {len(df_income):,}
-- Expense entries: {len(df_expense):,}
-- Date range: {df['Date'].min().date()} to {df['Date'].max().date()}
-- Forecast currency: **{TARGET_CURRENCY}**
+- Income entries: {results['income_rows']:,}
+- Expense entries: {results['expense_rows']:,}
+- Date range: {results['date_range'][0]} to {results['date_range'][1]}
+- Forecast currency: **{currency}**
 
 ## Forecasts
 """
-for h in HORIZONS:
-    report += f"- {h[0]}\n"
+    for label in results['horizons']:
+        report += f"- {label}\n"
 
-report += f"""
+    if forecast_net is not None:
+        report += f"""
 ## 6-Month Net
 {forecast_net.to_markdown(index=False) if not forecast_net.empty else "Not enough data"}
-
+"""
+    if results.get('ml') is not None:
+        report += f"""
 ## Predictions
-- Next amount MAE: {mae:.2f} {TARGET_CURRENCY}
-- Next category: **{pred_cat}**
-
-> Saved in `./{OUTPUT_DIR}/`
+- Next amount MAE: {results['ml']['mae']:.2f} {currency}
+- Next category: **{results['ml']['next_category']}**
+"""
+    if results.get('output_format', 'csv') != 'none':
+        report += f"""
+> Saved in `./{results['output_dir']}/`
 """
+    return report.strip()
+
+def write_outputs(results, output_format="csv", output_dir=OUTPUT_DIR):
+    """Write tables + markdown report. Returns the list of files written."""
+    if output_format == "none":
+        return []
+    os.makedirs(output_dir, exist_ok=True)
+    tables = _output_tables(results)
+    files = []
+    if output_format == "csv":
+        for stem, table in tables.items():
+            path = f"{output_dir}/{stem}.csv"
+            table.to_csv(path, index=False)
+            files.append(path)
+    elif output_format == "json":
+        path = f"{output_dir}/FORECASTS_{results['currency']}.json"
+        with open(path, "w", encoding='utf-8') as f:
+            json.dump({stem: table.to_dict(orient="records") for stem, table in tables.items()}, f, indent=2)
+        files.append(path)
+
+    report_path = f"{output_dir}/FULL_FINANCIAL_REPORT_{results['currency']}.md"
+    with open(report_path, "w", encoding='utf-8') as f:
+        f.write(build_report(results))
+    files.append(report_path)
+    return files
+
+def write_forecast_zip(results, fileobj):
+    """Stream every forecast table (CSV) + the markdown report into a ZIP written to fileobj."""
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for stem, table in _output_tables(results).items():
+            with zf.open(f"{stem}.csv", "w") as handle:
+                text = io.TextIOWrapper(handle, encoding='utf-8', newline='')
+                table.to_csv(text, index=False)
+                text.flush()
+                text.detach()
+        with zf.open(f"FULL_FINANCIAL_REPORT_{results['currency']}.md", "w") as handle:
+            handle.write(build_report(results).encode('utf-8'))
+    return fileobj
+
+def build_forecast_zip(results):
+    """ZIP bytes for a download button."""
+    return write_forecast_zip(results, io.BytesIO()).getvalue()
+
+# ----------------------------
+# 6. Engine
+# ----------------------------
+def run_forecast(horizons=None, types=None, categories=None, jobs=1, currency="MYR",
+                 plots=True, ml=True, output_format="csv", output_dir=OUTPUT_DIR,
+                 db_file=DB_FILE, df=None, verbose=False, chart_mode="full", chart_jobs=1,
+                 model_dir=MODEL_DIR, store_version=None, fit_missing=True, stream=False, chunksize=CHUNK_ROWS):
+    """
+    Run the forecasting engine in-process and return the results as a dict:
+
+        {'currency', 'exchange_rate', 'income_rows', 'expense_rows', 'date_range',
+         'horizons': {label: {'income_total', 'income_by_source', 'expense_by_category'}},
+         'net', 'ml', 'output_dir', 'output_format', 'files', 'charts'}
+
+    horizons / types / categories narrow the slice that gets fitted (None = all).
+    "Total Income" / "Total Expense" in categories fit every category of that
+    type; totals and the 6-month net are reconciled from the category fits
+    (reconciliation.py), never fitted on their own.
+    jobs > 1 fits series in parallel worker processes.
+    Pass df to skip the database read. output_format="none" writes nothing.
+    Charts are rendered by a separate pool of chart_jobs processes from the
+    stored forecasts (chart_mode: full | preview | svg); unchanged charts are skipped.
+    ML models are reused from model_dir and only retrained when the data changed.
+    With store_version (a database.get_data_version() token) forecasts are read
+    from the shared forecasts table (forecast_store.py) — the same numbers the
+    trends page shows — and only missing ones are fitted; no charts in that mode.
+    fit_missing=False leaves missing ones out instead (a page that queued them on
+    the forecast worker and must not fit in its own thread).
+    stream=True reads the database in chunks of chunksize rows straight into the
+    aggregation cube instead of loading the table (ignored when df is given);
+    with duckdb installed the cube comes from one DuckDB GROUP BY instead.
+    The ML models learn from individual rows, so stream=True requires ml=False.
+    """
+    log = print if verbose else (lambda *a, **k: None)
+    horizons = list(horizons) if horizons else HORIZON_LABELS
+    unknown = [h for h in horizons if h not in HORIZON_LABELS]
+    if unknown:
+        raise ValueError(f"Unknown horizons: {unknown}. Choose from {HORIZON_LABELS}")
+    types = [t.upper() for t in types] if types else TYPES
+    if stream and ml and df is None:
+        raise ValueError("stream=True bounds memory only without the ML models (they need every row); pass ml=False")
+    wanted = None if not categories else {c.strip().title() for c in categories}
+
+    df_base = None  # MYR — the ML models are trained in base currency
+    if stream and df is None:
+        if analytics.available():
+            log(f"Aggregating {db_file} with DuckDB...")
+            currency, exchange_rate = resolve_currency(currency, log=log)
+            cube, stats = build_cube_duckdb(db_file, exchange_rate)
+        else:
+            log(f"Streaming {db_file} in chunks of {chunksize:,} rows...")
+            currency, exchange_rate = resolve_currency(currency, log=log)
+            cube, stats = build_cube_streaming(db_file, exchange_rate, chunksize, log=log)
+        if not cube.keys:
+            raise ValueError(f"No INCOME/EXPENSE transactions in {db_file}")
+        rows = {typ: stats[typ] for typ in TYPES}
+        date_range = (stats['first'].date(), stats['last'].date())
+    else:
+        if df is None:
+            df = load_transactions(db_file, log=log)
+        df_base = df
+        df, currency, exchange_rate = apply_currency(df, currency, log=log)
+
+        counts = df['Type'].value_counts()
+        rows = {typ: int(counts.get(typ, 0)) for typ in TYPES}
+        date_range = (df['Date'].min().date(), df['Date'].max().date())
+
+        # Aggregation cube (built once — every horizon reads from it)
+        cube = AggregationCube(df)
+
+    log(f"Income rows: {rows['INCOME']:,}")
+    log(f"Expense rows: {rows['EXPENSE']:,}")
+    log(f"Date range: {date_range[0]} → {date_range[1]}")
+    log(f"Income sources: {cube.categories('INCOME')}")
+    log(f"Expense categories: {cube.categories('EXPENSE')}")
+
+    plot = plots and output_format != "none" and store_version is None
+    common = dict(currency=currency, chart=plot)
+
+    # Collect every requested fit up front so they can run in parallel.
+    # Only categories are fitted (plus the type totals as MinT base forecasts);
+    # totals and the net balance are reconciled from them afterwards.
+    want_net = set(TYPES) <= set(types) and wanted is None
+    fit_labels = [h for h in HORIZON_LABELS if h in horizons or (want_net and h == NET_HORIZON)]
+    tasks = []
+    for label, periods, freq in HORIZONS:
+        if label not in fit_labels:
+            continue
+        for typ, kind in (('INCOME', "Income"), ('EXPENSE', "Expense")):
+            if typ not in types:
+                continue
+            total = TOTAL_CATEGORIES[typ]
+            every = wanted is None or total in wanted  # a total needs all of its categories
+            # Same histories as the forecast worker (forecast_engine.build_history):
+            # only the periods with transactions of that category
+            if RECONCILE_METHOD == "mint" and every:
+                tasks.append(((label, typ, total), build_history(cube, freq, typ, total),
+                              dict(name=total, periods=periods, freq=freq,
+                                   horizon_label=label, kind=kind, currency=currency, chart=False)))
+            for cat in cube.categories(typ):
+                if every or cat in wanted:
+                    tasks.append(((label, typ, cat), build_history(cube, freq, typ, cat),
+                                  dict(name=cat, periods=periods, freq=freq,
+                                       horizon_label=label, kind=kind, **common)))
+
+    log(f"\nForecasting {len(tasks)} series across {len(fit_labels)} horizon(s) with {jobs} job(s)...")
+    renderer = ChartRenderer(output_dir, mode=chart_mode, jobs=chart_jobs) if plot else None
+    fitted = {}
+
+    def collect(done):
+        # Charts are queued as soon as each fit lands; fits never wait on encoding
+        for key, pred, chart in done:
+            fitted[key] = pred
+            if renderer is not None and chart is not None:
+                renderer.submit(chart)
+
+    if store_version is not None:
+        from forecast_store import get_or_compute
+        stored = get_or_compute(store_version, [key for key, _, _ in tasks], data_db_path=db_file,
+                                compute=fit_missing)
+        collect((key, None if pred is None else _scaled(pred, exchange_rate), None) for key, pred in stored.items())
+    elif jobs > 1 and len(tasks) > 1:
+        collect(_get_pool(jobs).map(_forecast_task, tasks))
+    else:
+        collect(_forecast_task(t) for t in tasks)
+
+    results = {
+        'currency': currency,
+        'exchange_rate': exchange_rate,
+        'income_rows': rows['INCOME'],
+        'expense_rows': rows['EXPENSE'],
+        'date_range': date_range,
+        'horizons': {},
+        'net': None,
+        'ml': None,
+        'output_dir': output_dir,
+        'output_format': output_format,
+    }
+
+    for label, periods, freq in HORIZONS:
+        if label not in fit_labels:
+            continue
+        preds = {(typ, cat): pred for (lbl, typ, cat), pred in fitted.items() if lbl == label}
+        nodes = reconcile(preds, RECONCILE_METHOD, forecast_dates(cube.days[-1], label))
+        if label == NET_HORIZON and want_net:
+            log("\nReconciling NET BALANCE (6 months)...")
+            net = nodes.get((NET_TYPE, NET_CATEGORY))
+            results['net'] = (pd.DataFrame({'Month': [], 'Predicted_Net': []}) if net is None else
+                              _format_prediction(net.head(NET_PERIODS[0]), NET_PERIODS[0], NET_PERIODS[1])
+                              .rename(columns={'ds': 'Month', 'yhat': 'Predicted_Net'}))
+        if label not in horizons:
+            continue
+        log(f"  -> {label}")
+        h = {'income_total': None, 'income_by_source': None, 'expense_by_category': None}
+
+        total_income = TOTAL_CATEGORIES['INCOME']
+        total_forecast = nodes.get(('INCOME', total_income))
+        if total_forecast is not None and (wanted is None or total_income in wanted):
+            h['income_total'] = _format_prediction(total_forecast, periods, freq).rename(
+                columns={'ds': 'Date', 'yhat': 'Predicted_Income'})
+            if renderer is not None:
+                renderer.submit(make_chart_spec(
+                    cube.series(freq, 'INCOME'), total_forecast,
+                    title=f"Income {total_income} - {label}", ylabel=currency,
+                    file_stem=chart_file_stem(total_income, label, "Income", currency)))
+
+        for typ, table, column, name in (('INCOME', 'income_by_source', 'Source', 'Predicted_Income'),
+                                         ('EXPENSE', 'expense_by_category', 'Category', 'Predicted_Spending')):
+            # Categories as fitted; only the totals and the net come from the reconciled nodes
+            forecasts = [_format_prediction(f, periods, freq).assign(**{column: cat})
+                         for (t, cat), f in sorted(preds.items())
+                         if f is not None and t == typ and not is_aggregate(t, cat) and (wanted is None or cat in wanted)]
+            if forecasts:
+                combined = pd.concat(forecasts, ignore_index=True)
+                h[table] = combined[['ds', column, 'yhat']].rename(columns={'ds': 'Date', 'yhat': name})
+
+        results['horizons'][label] = h
+
+    if ml:
+        log("\nNext-transaction models...")
+        mae, pred_cat = train_next_transaction_models(df_base, model_dir, log=log)
+        results['ml'] = {'mae': mae * exchange_rate, 'next_category': pred_cat}
+
+    results['files'] = write_outputs(results, output_format, output_dir)
+    results['charts'] = renderer.close() if renderer is not None else None
+    return results
 
-with open(f"{OUTPUT_DIR}/FULL_FINANCIAL_REPORT_{TARGET_CURRENCY}.md", "w", encoding='utf-8') as f:
-    f.write(report.strip())
+# ----------------------------
+# 7. CLI
+# ----------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Income + Expense + Category-level forecasting from finance.db"
+    )
+    parser.add_argument("--horizons", nargs="+", choices=HORIZON_LABELS, metavar="HORIZON",
+                        help=f"Horizons to fit (default: all). Choices: {', '.join(HORIZON_LABELS)}")
+    parser.add_argument("--types", nargs="+", type=str.upper, choices=TYPES,
+                        help="Transaction types to forecast (default: both)")
+    parser.add_argument("--categories", nargs="+", metavar="CATEGORY",
+                        help='Only these categories/sources (e.g. Food "Total Income")')
+    parser.add_argument("--jobs", type=int, default=1, help="Parallel worker processes for model fits")
+    parser.add_argument("--currency", default=os.getenv("FORECAST_CURRENCY", "MYR"), type=str.upper,
+                        help="Forecast currency (default: $FORECAST_CURRENCY or MYR)")
+    parser.add_argument("--no-plots", action="store_true", help="Skip chart rendering")
+    parser.add_argument("--chart-mode", choices=list(CHART_MODES), default="full",
+                        help="full (300 dpi PNG), preview (72 dpi PNG) or svg")
+    parser.add_argument("--chart-jobs", type=int, default=1,
+                        help="Worker processes for chart rendering (0 = render inline)")
+    parser.add_argument("--no-ml", action="store_true", help="Skip next-transaction ML models")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="Where versioned ML models are stored")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="csv",
+                        help="csv (one file per table), json (single file) or none")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read the database in chunks straight into the aggregates (bounded memory). "
+                             "Requires --no-ml: the ML models need every row in memory")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS, help="Rows per chunk with --stream")
+    args = parser.parse_args(argv)
+    if args.stream and not args.no_ml:
+        parser.error("--stream requires --no-ml: the next-transaction models need every row in memory")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # FORCE UTF-8 OUTPUT (Windows fix) — only when running as a script
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    print("ULTIMATE AI FINANCIAL ENGINE — Powered by finance.db")
+    print("="*80)
+
+    results = run_forecast(
+        horizons=args.horizons, types=args.types, categories=args.categories,
+        jobs=max(1, args.jobs), currency=args.currency, plots=not args.no_plots,
+        ml=not args.no_ml, output_format=args.output_format, output_dir=args.output_dir,
+        db_file=args.db, verbose=True, chart_mode=args.chart_mode, chart_jobs=max(0, args.chart_jobs),
+        model_dir=args.model_dir, stream=args.stream, chunksize=max(1, args.chunksize),
+    )
 
-print(f"\nReport: {OUTPUT_DIR}/FULL_FINANCIAL_REPORT_{TARGET_CURRENCY}.md")
-print(f"Charts & CSVs: ./{OUTPUT_DIR}/")
-print("\nDone! AI Forecasting Complete.")
+    if results['charts']:
+        print(f"\nCharts: {len(results['charts']['rendered'])} rendered, "
+              f"{len(results['charts']['skipped'])} unchanged")
+    if results['files']:
+        print(f"\nReport: {results['files'][-1]}")
+        print(f"Charts & {args.output_format.upper()}s: {os.path.join(results['output_dir'], '')}")
+    print("\nDone! AI Forecasting Complete.")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# forecast_charts.py
+# Chart rendering stage for the offline forecaster.
+# Works only from stored forecast data (history + yhat/bounds), never from a
+# fitted model, so it can run in its own worker pool while fits continue.
+# Unchanged charts are skipped using a content-hash manifest.
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+CHART_MODES = {
+    # mode: (file extension, dpi)
+    "full": ("png", 300),
+    "preview": ("png", 72),
+    "svg": ("svg", None),
+}
+MANIFEST_NAME = ".chart_manifest.json"
+STYLE_VERSION = "1"  # bump when the drawing code changes so every chart re-renders
+
+# -------------------------------
+# 1. Chart Spec
+# -------------------------------
+def make_chart_spec(history, forecast, title, ylabel, file_stem):
+    """
+    history:  ds/y frame of actuals
+    forecast: ds/yhat/yhat_lower/yhat_upper frame (history + future)
+    """
+    return {
+        "history": history[['ds', 'y']].reset_index(drop=True),
+        "forecast": forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].reset_index(drop=True),
+        "title": title,
+        "ylabel": ylabel,
+        "file_stem": file_stem,
+    }
+
+def chart_hash(spec, mode):
+    h = hashlib.sha256()
+    for frame in (spec["history"], spec["forecast"]):
+        h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    h.update(f"{spec['title']}|{spec['ylabel']}|{mode}|{STYLE_VERSION}".encode())
+    return h.hexdigest()
+
+# -------------------------------
+# 2. Drawing (same look as Prophet's model.plot)
+# -------------------------------
+def render_chart(spec, path, mode="full"):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+
+    ext, dpi = CHART_MODES[mode]
+    hist, fcst = spec["history"], spec["forecast"]
+
+    fig, ax = plt.subplots(figsize=(10, 6), facecolor='w')
+    ax.plot(hist['ds'], hist['y'], 'k.', label='Observed data points')
+    ax.plot(fcst['ds'], fcst['yhat'], ls='-', c='#0072B2', label='Forecast')
+    ax.fill_between(fcst['ds'], fcst['yhat_lower'], fcst['yhat_upper'],
+                    color='#0072B2', alpha=0.2, label='Uncertainty interval')
+    ax.grid(True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+    ax.set_xlabel('ds')
+    ax.set_ylabel(spec["ylabel"])
+    ax.set_title(spec["title"])
+    fig.tight_layout()
+
+    save_kwargs = {"bbox_inches": 'tight'}
+    if dpi is not None:
+        save_kwargs["dpi"] = dpi
+    fig.savefig(path, **save_kwargs)
+    plt.close(fig)
+    return path
+
+def _render_task(args):
+    spec, path, mode = args
+    return render_chart(spec, path, mode)
+
+# -------------------------------
+# 3. Renderer (separate worker pool + hash skip)
+# -------------------------------
+class ChartRenderer:
+    """
+    submit() returns immediately; charts are encoded in a separate process pool
+    (or inline when jobs=0). close() waits for the pool and writes the manifest.
+
+        renderer = ChartRenderer("income_expense_forecast", mode="preview", jobs=2)
+        renderer.submit(spec)
+        ...
+        summary = renderer.close()   # {'rendered': [...], 'skipped': [...]}
+    """
+
+    def __init__(self, output_dir, mode="full", jobs=1):
+        if mode not in CHART_MODES:
+            raise ValueError(f"Unknown chart mode '{mode}'. Choose from {list(CHART_MODES)}")
+        self.output_dir = output_dir
+        self.mode = mode
+        os.makedirs(output_dir, exist_ok=True)
+        self._manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        try:
+            with open(self._manifest_path, encoding='utf-8') as f:
+                self._manifest = json.load(f)
+        except (OSError, ValueError):
+            self._manifest = {}
+        self._pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 0 else None
+        self._futures = []
+        self.rendered = []
+        self.skipped = []
+
+    def submit(self, spec):
+        ext, _ = CHART_MODES[self.mode]
+        filename = f"{spec['file_stem']}.{ext}"
+        path = os.path.join(self.output_dir, filename)
+        digest = chart_hash(spec, self.mode)
+        if self._manifest.get(filename) == digest and os.path.exists(path):
+            self.skipped.append(path)
+            return None
+        self._manifest[filename] = digest
+        if self._pool is None:
+            self.rendered.append(render_chart(spec, path, self.mode))
+            return None
+        future = self._pool.submit(_render_task, (spec, path, self.mode))
+        self._futures.append((filename, future))
+        return future
+
+    def close(self):
+        for filename, future in self._futures:
+            try:
+                self.rendered.append(future.result())
+            except Exception:
+                self._manifest.pop(filename, None)  # retry next run
+        self._futures = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        with open(self._manifest_path, "w", encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        return {"rendered": self.rendered, "skipped": self.skipped}
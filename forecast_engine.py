@@ -0,0 +1,278 @@
+# forecast_engine.py
+# Shared forecasting — fits ONE (horizon, type, category) series on demand
+# Used by forecast_worker.py / forecast_store.py (trends, chatbot, ZIP export) and backtest.py
+
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+import analytics
+from aggregation import AggregationCube
+from prophet_scipy import use_scipy_backend
+from reconciliation import NET_TYPE, TOTAL_CATEGORIES, Z_80
+
+warnings.filterwarnings("ignore")
+
+# -------------------------------
+# 1. Horizons (label → periods, pandas freq)
+# -------------------------------
+HORIZONS = {
+    "4 Days": (4, 'D'), "4 Weeks": (4, 'W'),
+    "2 Months": (2, 'M'), "4 Months": (4, 'M'), "1 Year": (12, 'M')
+}
+
+MIN_HISTORY_PERIODS = 3  # Prophet needs at least 3 points to fit
+
+# Quality tiers for Prophet fits
+#   interactive: no uncertainty sampling (analytic observation-noise interval), capped optimiser
+#   batch:       Prophet defaults — 1000 uncertainty samples, 10k optimiser iterations
+QUALITY_TIERS = {
+    "interactive": {'uncertainty_samples': 0, 'iter': 1000},
+    "batch": {'uncertainty_samples': 1000, 'iter': 10000},
+}
+DEFAULT_TIER = "batch"
+
+# Where Prophet's MAP fit runs:
+#   scipy:   in-process L-BFGS-B on the same posterior (prophet_scipy.py) — no subprocess, no temp files
+#   cmdstan: Prophet's own cmdstanpy backend
+PROPHET_FIT_ENGINE = os.getenv("PROPHET_FIT_ENGINE", "scipy")
+
+# Only categories are fitted; type totals and the net balance come from reconciling
+# them (reconciliation.py). "mint" additionally fits the type totals as base forecasts.
+RECONCILE_METHOD = os.getenv("FORECAST_RECONCILE", "bottom_up")
+
+# The 6-month net balance table is the first 6 steps of the reconciled 1-year net
+NET_HORIZON = "1 Year"
+NET_PERIODS = (6, 'M')
+
+# -------------------------------
+# 2. Load Transactions (base currency, MYR)
+# -------------------------------
+def load_forecast_transactions(db_path: str = None):
+    """The columns the forecaster needs, cleaned like every page (data_access.py). Amounts stay in MYR."""
+    from data_access import read_transactions  # lazy: importing database initialises the schema
+    return read_transactions(db_path)[['Date', 'Amount', 'Type', 'Category']]
+
+# -------------------------------
+# 3. Forecast Targets (cheap — no model fits)
+# -------------------------------
+def build_forecast_cube(df):
+    """Aggregation cube the forecasts read their history from (see aggregation.py)."""
+    return AggregationCube(df)
+
+def read_forecast_cube(db_path: str = None):
+    """
+    The same cube read straight from the database (worker, scripts): one DuckDB
+    GROUP BY when analytics.py is available, the pandas load + cube otherwise.
+    """
+    if analytics.available():
+        return analytics.build_cube(db_path)
+    return build_forecast_cube(load_forecast_transactions(db_path))
+
+def list_forecast_targets(cube, horizon: str, totals: bool = False):
+    """
+    Returns {category: type} for every series that has enough history to be
+    forecast at this horizon. INCOME entries come first, so a category present
+    in both types resolves to INCOME like before. totals=True also lists each
+    type's total ("Total Income", "Total Expense") ahead of its categories.
+    """
+    _, freq = HORIZONS[horizon]
+    targets = {}
+    for typ in ['INCOME', 'EXPENSE']:
+        counts = cube.period_counts(freq, typ)
+        if totals and counts.get(None, 0) >= MIN_HISTORY_PERIODS:
+            targets.setdefault(TOTAL_CATEGORIES[typ], typ)
+        for cat in sorted(c for c in counts if c is not None):
+            if counts[cat] >= MIN_HISTORY_PERIODS:
+                targets.setdefault(cat, typ)
+    return targets
+
+def fit_targets(cube, horizon: str, method: str = RECONCILE_METHOD):
+    """
+    [(type, category)] that get their own model: every category of both types
+    (a name used by both is fitted twice, so neither total misses it), plus the
+    type totals as base forecasts under MinT.
+    """
+    _, freq = HORIZONS[horizon]
+    targets = []
+    for typ in ['INCOME', 'EXPENSE']:
+        counts = cube.period_counts(freq, typ)
+        if method == "mint" and counts.get(None, 0) >= MIN_HISTORY_PERIODS:
+            targets.append((typ, TOTAL_CATEGORIES[typ]))
+        targets += [(typ, cat) for cat in sorted(c for c in counts if c is not None)
+                    if counts[cat] >= MIN_HISTORY_PERIODS]
+    return targets
+
+def required_targets(cube, horizon: str, typ: str, cat: str, method: str = RECONCILE_METHOD):
+    """[(type, category)] whose fits must be ready before (type, category) can be shown."""
+    targets = fit_targets(cube, horizon, method)
+    if method == "bottom_up" and (typ, cat) in targets:
+        return [(typ, cat)]  # a category only needs its own fit
+    if method == "bottom_up" and typ != NET_TYPE:
+        return [(t, c) for t, c in targets if t == typ]
+    return targets
+
+# -------------------------------
+# 4. Forecast Backends
+# -------------------------------
+# Every backend fits on a ds/y history and predicts ds/yhat/yhat_lower/yhat_upper
+# for the next `periods` periods. Register new ones with @register_backend so the
+# trends page and backtest.py can pick them up by name.
+FORECAST_BACKENDS = {}
+
+def register_backend(name: str):
+    def wrap(cls):
+        cls.name = name
+        FORECAST_BACKENDS[name] = cls
+        return cls
+    return wrap
+
+def get_backend(name: str, freq: str, **options):
+    if name not in FORECAST_BACKENDS:
+        raise ValueError(f"Unknown forecast backend '{name}'. Choose from {sorted(FORECAST_BACKENDS)}")
+    if options.get('tier', DEFAULT_TIER) not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality tier '{options['tier']}'. Choose from {list(QUALITY_TIERS)}")
+    return FORECAST_BACKENDS[name](freq, **options)
+
+def new_prophet(**kwargs):
+    """Prophet(**kwargs) fitted by PROPHET_FIT_ENGINE."""
+    model = Prophet(**kwargs)
+    return use_scipy_backend(model) if PROPHET_FIT_ENGINE == "scipy" else model
+
+def future_dates(last_ds, periods: int, freq: str):
+    """Same dates Prophet's make_future_dataframe would add."""
+    dates = pd.date_range(start=last_ds, periods=periods + 1, freq=freq)
+    return dates[dates > last_ds][:periods]
+
+def forecast_dates(last_date, horizon: str):
+    """
+    The horizon's shared forecast periods: the dates a series whose history
+    reaches the period of last_date (the newest transaction) is forecast on.
+    Totals and the net balance are reconciled on these (reconciliation.py).
+    """
+    periods, freq = HORIZONS[horizon]
+    return future_dates(pd.Timestamp(last_date).to_period(freq).to_timestamp(), periods, freq)
+
+@register_backend("prophet")
+class ProphetBackend:
+    def __init__(self, freq: str, yearly_seasonality=None, tier: str = DEFAULT_TIER):
+        self.freq = freq
+        self.yearly_seasonality = (freq in ['D', 'W']) if yearly_seasonality is None else yearly_seasonality
+        self.tier = QUALITY_TIERS[tier]
+        self.model = None
+
+    def fit(self, history):
+        self.model = new_prophet(yearly_seasonality=self.yearly_seasonality, weekly_seasonality=(self.freq == 'D'),
+                                 seasonality_mode='additive', interval_width=0.8,
+                                 uncertainty_samples=self.tier['uncertainty_samples'])
+        self.model.fit(history, iter=self.tier['iter'])
+        return self
+
+    def predict(self, periods: int):
+        future = self.model.make_future_dataframe(periods=periods, freq=self.freq)
+        forecast = self.model.predict(future).tail(periods).reset_index(drop=True)
+        if not self.model.uncertainty_samples:
+            # Analytic interval: fitted observation noise only (no trend-change sampling)
+            sigma = float(np.asarray(self.model.params['sigma_obs']).mean()) * self.model.y_scale
+            forecast['yhat_lower'] = forecast['yhat'] - Z_80 * sigma
+            forecast['yhat_upper'] = forecast['yhat'] + Z_80 * sigma
+        return forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
+
+class _SimpleBackend:
+    """Shared predict() for the closed-form baselines: flat/linear mean ± z·sigma·sqrt(step)."""
+
+    def __init__(self, freq: str, **options):
+        self.freq = freq
+
+    def _frame(self, yhat, sigma, periods):
+        steps = np.arange(1, periods + 1)
+        spread = Z_80 * sigma * np.sqrt(steps)
+        return pd.DataFrame({
+            'ds': future_dates(self.last_ds, periods, self.freq),
+            'yhat': yhat, 'yhat_lower': yhat - spread, 'yhat_upper': yhat + spread,
+        })
+
+@register_backend("naive")
+class NaiveBackend(_SimpleBackend):
+    def fit(self, history):
+        y = history['y'].to_numpy(dtype=float)
+        self.last_ds = history['ds'].iloc[-1]
+        self.level = y[-1]
+        self.sigma = np.std(np.diff(y)) if len(y) > 1 else 0.0
+        return self
+
+    def predict(self, periods: int):
+        return self._frame(np.full(periods, self.level), self.sigma, periods)
+
+@register_backend("moving_average")
+class MovingAverageBackend(_SimpleBackend):
+    WINDOW = 3
+
+    def fit(self, history):
+        y = history['y'].to_numpy(dtype=float)
+        self.last_ds = history['ds'].iloc[-1]
+        self.level = y[-self.WINDOW:].mean()
+        self.sigma = np.std(y[-12:])
+        return self
+
+    def predict(self, periods: int):
+        return self._frame(np.full(periods, self.level), self.sigma / np.sqrt(self.WINDOW), periods)
+
+@register_backend("linear_trend")
+class LinearTrendBackend(_SimpleBackend):
+    def fit(self, history):
+        y = history['y'].to_numpy(dtype=float)
+        x = np.arange(len(y))
+        self.last_ds = history['ds'].iloc[-1]
+        self.slope, self.intercept = np.polyfit(x, y, 1)
+        self.n = len(y)
+        self.sigma = np.std(y - (self.slope * x + self.intercept))
+        return self
+
+    def predict(self, periods: int):
+        x = np.arange(self.n, self.n + periods)
+        return self._frame(self.slope * x + self.intercept, self.sigma, periods)
+
+# -------------------------------
+# 5. Single Forecast
+# -------------------------------
+def build_history(cube, freq: str, typ: str, cat: str):
+    return cube.series(freq, typ, None if cat == TOTAL_CATEGORIES.get(typ) else cat)
+
+def target_history(cube, horizon: str, typ: str, cat: str):
+    """(periods, freq, ds/y history) for any target, including type totals and the net balance."""
+    periods, freq = HORIZONS[horizon]
+    if typ == NET_TYPE:
+        return periods, freq, cube.net_series(freq)
+    return periods, freq, build_history(cube, freq, typ, cat)
+
+def predict_target(cube, horizon: str, typ: str, cat: str, backend: str = "prophet", tier: str = DEFAULT_TIER):
+    """Raw ds/yhat/yhat_lower/yhat_upper for the next periods, or None if history is too short."""
+    periods, freq, hist_df = target_history(cube, horizon, typ, cat)
+    if len(hist_df) < MIN_HISTORY_PERIODS:
+        return None
+    return get_backend(backend, freq, tier=tier).fit(hist_df).predict(periods)
+
+def format_forecast(cube, horizon: str, typ: str, cat: str, pred):
+    """Display dict for the trends page: formatted dates, last 4 actuals, last actual total."""
+    periods, freq, hist_df = target_history(cube, horizon, typ, cat)
+    pred = pred.copy()
+    last_4_actual = hist_df.tail(4).copy()
+
+    fmt = '%Y-%m-%d' if freq in ['D', 'W'] else '%b %Y'
+    pred['ds'] = pred['ds'].dt.strftime(fmt)
+    last_4_actual['ds'] = last_4_actual['ds'].dt.strftime(fmt)
+
+    return {
+        'forecast': pred.reset_index(drop=True),
+        'history': last_4_actual.reset_index(drop=True),
+        'last_actual_total': hist_df['y'].iloc[-periods:].sum() if len(hist_df) >= periods else hist_df['y'].sum(),
+        'category': cat,
+        'type': typ,
+    }
+
+def forecast_target(cube, horizon: str, typ: str, cat: str, backend: str = "prophet", tier: str = DEFAULT_TIER):
+    """Fit one model for (horizon, type, category). Returns None if history is too short."""
+    pred = predict_target(cube, horizon, typ, cat, backend, tier)
+    return None if pred is None else format_forecast(cube, horizon, typ, cat, pred)
@@ -0,0 +1,187 @@
+# forecast_store.py
+# Precomputed forecasts in one indexed SQLite table, shared by the trends page
+# (filled by forecast_worker.py), the chatbot and the forecast ZIP export.
+# Rows are keyed by (data_version, horizon, type, category, period) and hold
+# yhat + 80% bounds in base currency (MYR); callers scale at render time.
+#
+#   save_forecast(version, "2 Months", "EXPENSE", "Food", pred)
+#   get_forecast(version, "2 Months", "EXPENSE", "Food")        # ds / yhat / yhat_lower / yhat_upper
+#   get_forecasts(version, horizon="2 Months")                 # every category, long format
+#   get_reconciled(version, "2 Months", dates=grid)[("INCOME", "Total Income")]  # totals / net from the categories
+#   (grid = forecast_engine.forecast_dates(last_date, "2 Months"), the periods every total shares)
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+FORECAST_DB_PATH = os.getenv("FORECAST_DB_PATH", "forecasts.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    data_version TEXT NOT NULL,
+    horizon TEXT NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    period TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    yhat REAL,
+    yhat_lower REAL,
+    yhat_upper REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (data_version, horizon, type, category, period)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_forecasts_target ON forecasts (horizon, type, category, created_at);
+"""
+COLUMNS = ['ds', 'yhat', 'yhat_lower', 'yhat_upper']
+
+_initialized = set()
+
+# -------------------------------
+# 1. Connection
+# -------------------------------
+@contextmanager
+def connect(db_path=FORECAST_DB_PATH):
+    """Short-lived connection, committed on success and always closed."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        with conn:
+            if db_path not in _initialized:
+                conn.executescript(SCHEMA)
+                _initialized.add(db_path)
+            yield conn
+    finally:
+        conn.close()
+
+def _frame(rows):
+    df = pd.DataFrame([dict(r) for r in rows])
+    df['ds'] = pd.to_datetime(df.pop('period'))
+    return df
+
+# -------------------------------
+# 2. Write
+# -------------------------------
+def save_forecast(data_version, horizon, typ, cat, pred, db_path=FORECAST_DB_PATH):
+    """Replace the stored forecast for one target. pred: ds / yhat / yhat_lower / yhat_upper (MYR)."""
+    now = time.time()
+    rows = [
+        (data_version, horizon, typ, cat, pd.Timestamp(r.ds).strftime('%Y-%m-%d'), step,
+         float(r.yhat), float(r.yhat_lower), float(r.yhat_upper), now)
+        for step, r in enumerate(pred[COLUMNS].itertuples(index=False), start=1)
+    ]
+    with connect(db_path) as conn:
+        conn.execute("DELETE FROM forecasts WHERE data_version=? AND horizon=? AND type=? AND category=?",
+                     (data_version, horizon, typ, cat))
+        conn.executemany("INSERT INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def prune(keep_versions, db_path=FORECAST_DB_PATH):
+    """
+    Drop every data version not in keep_versions: its forecasts and, when the
+    job table lives in the same file (forecast_worker.py), its jobs.
+    """
+    keep = list(keep_versions)
+    marks = ', '.join('?' * len(keep))
+    with connect(db_path) as conn:
+        conn.execute(f"DELETE FROM forecasts WHERE data_version NOT IN ({marks})", keep)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='forecast_jobs'").fetchone():
+            conn.execute(f"DELETE FROM forecast_jobs WHERE data_version NOT IN ({marks})", keep)
+
+# -------------------------------
+# 3. Lookup (primary-key / index seeks)
+# -------------------------------
+def get_forecast(data_version, horizon, typ, cat, db_path=FORECAST_DB_PATH):
+    """One target's forecast (ds, yhat, yhat_lower, yhat_upper) or None if not stored."""
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT period, yhat, yhat_lower, yhat_upper FROM forecasts "
+            "WHERE data_version=? AND horizon=? AND type=? AND category=? ORDER BY step",
+            (data_version, horizon, typ, cat)).fetchall()
+    return _frame(rows)[COLUMNS] if rows else None
+
+def get_forecasts(data_version, horizon=None, typ=None, db_path=FORECAST_DB_PATH):
+    """Long frame (horizon, type, category, step, ds, yhat, yhat_lower, yhat_upper) for one version."""
+    query = "SELECT horizon, type, category, step, period, yhat, yhat_lower, yhat_upper FROM forecasts WHERE data_version=?"
+    params = [data_version]
+    if horizon is not None:
+        query += " AND horizon=?"
+        params.append(horizon)
+    if typ is not None:
+        query += " AND type=?"
+        params.append(typ)
+    with connect(db_path) as conn:
+        rows = conn.execute(query + " ORDER BY horizon, type, category, step", params).fetchall()
+    if not rows:
+        return pd.DataFrame(columns=['horizon', 'type', 'category', 'step'] + COLUMNS)
+    return _frame(rows)
+
+def latest_forecast(horizon, typ, cat, db_path=FORECAST_DB_PATH):
+    """Newest stored forecast for a target from any data version → (data_version, frame) or (None, None)."""
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT data_version FROM forecasts WHERE horizon=? AND type=? AND category=? "
+            "ORDER BY created_at DESC LIMIT 1", (horizon, typ, cat)).fetchone()
+    if row is None:
+        return None, None
+    return row['data_version'], get_forecast(row['data_version'], horizon, typ, cat, db_path)
+
+# -------------------------------
+# 4. Reconciled Views (totals and net are never stored — always derived)
+# -------------------------------
+def reconcile_stored(stored, method=None, dates=None):
+    """{(type, category): frame} for every node of one horizon's long frame (see reconciliation.py)."""
+    from forecast_engine import RECONCILE_METHOD
+    from reconciliation import reconcile
+
+    preds = {key: g[COLUMNS].reset_index(drop=True) for key, g in stored.groupby(['type', 'category'])}
+    return reconcile(preds, method or RECONCILE_METHOD, dates)
+
+def unfinished_targets(data_version, horizon, targets, db_path=FORECAST_DB_PATH):
+    """
+    [(type, category)] of targets with no stored forecast whose job (forecast_worker.py)
+    hasn't finished either — a total reconciled now would be missing them.
+    """
+    with connect(db_path) as conn:
+        stored = {(r['type'], r['category']) for r in conn.execute(
+            "SELECT DISTINCT type, category FROM forecasts WHERE data_version=? AND horizon=?",
+            (data_version, horizon))}
+        finished = set()
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='forecast_jobs'").fetchone():
+            finished = {(r['type'], r['category']) for r in conn.execute(
+                "SELECT type, category FROM forecast_jobs WHERE data_version=? AND horizon=? "
+                "AND status IN ('done', 'failed')", (data_version, horizon))}
+    return [key for key in targets if key not in stored and key not in finished]
+
+def get_reconciled(data_version, horizon, method=None, db_path=FORECAST_DB_PATH, dates=None):
+    """
+    Categories, type totals and net balance for one horizon, reconciled from
+    what is stored on `dates` (forecast_engine.forecast_dates for the version).
+    Check unfinished_targets() first: a total only covers the categories stored.
+    """
+    return reconcile_stored(get_forecasts(data_version, horizon, db_path=db_path), method, dates)
+
+# -------------------------------
+# 5. Read-through
+# -------------------------------
+def get_or_compute(data_version, targets, db_path=FORECAST_DB_PATH, data_db_path=None, compute=True):
+    """
+    {(horizon, type, category): frame or None} for every target, fitting and
+    storing whatever is missing (the cube is only built if something is).
+    compute=False only reads: a missing target stays None.
+    """
+    from forecast_engine import predict_target, read_forecast_cube
+
+    out, cube = {}, None
+    for key in targets:
+        pred = get_forecast(data_version, *key, db_path=db_path)
+        if pred is None and compute:
+            if cube is None:
+                cube = read_forecast_cube(data_db_path)
+            pred = predict_target(cube, *key)
+            if pred is not None:
+                save_forecast(data_version, *key, pred, db_path=db_path)
+        out[key] = pred
+    return out
@@ -0,0 +1,253 @@
+# forecast_worker.py
+# Background forecast worker with an SQLite job table.
+# Pages enqueue (data_version, horizon, type, category) jobs and poll their
+# status; fits run on a low-priority worker thread (or as a separate process:
+# `python forecast_worker.py`), so navigating away never throws work away.
+# Finished forecasts go to the shared `forecasts` table (forecast_store.py).
+# Only categories are queued; totals and net are reconciled from them on read.
+# Jobs live next to it in forecasts.db — writes here never touch finance.db.
+# When the data version moves, older versions are pruned from both tables,
+# keeping the current one and the newest fully computed one (the pages'
+# fallback while the current version is still being fitted).
+#
+#   worker = ForecastWorker()
+#   worker.submit(version, "2 Months", "EXPENSE", "Food", priority=0)
+#   worker.status(version, "2 Months", "EXPENSE", "Food")     # {'status': 'running', 'progress': 0.5, ...}
+#   forecast_store.get_forecast(version, "2 Months", "EXPENSE", "Food")
+
+import argparse
+import os
+import threading
+import time
+
+from forecast_engine import HORIZONS, QUALITY_TIERS, fit_targets, predict_target, read_forecast_cube
+from forecast_store import FORECAST_DB_PATH, connect, prune, save_forecast
+
+JOBS_DB_PATH = FORECAST_DB_PATH
+POLL_SECONDS = 1.0
+DEFAULT_JOB_TIER = "interactive"  # page-driven jobs; the nightly refresh queues "batch"
+
+# Job life cycle: queued → running → done | failed | stale (data changed before it ran)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data_version TEXT NOT NULL,
+    horizon TEXT NOT NULL,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1,
+    tier TEXT NOT NULL DEFAULT 'interactive',
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (data_version, horizon, type, category)
+);
+CREATE INDEX IF NOT EXISTS ix_forecast_jobs_queue ON forecast_jobs (status, priority, id);
+CREATE INDEX IF NOT EXISTS ix_forecast_jobs_target ON forecast_jobs (horizon, type, category, updated_at);
+"""
+
+# -------------------------------
+# 1. Job Table
+# -------------------------------
+def init_jobs_db(db_path=JOBS_DB_PATH):
+    with connect(db_path) as conn:
+        conn.executescript(SCHEMA)
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(forecast_jobs)")}
+        if 'tier' not in columns:  # job tables created before quality tiers
+            conn.execute("ALTER TABLE forecast_jobs ADD COLUMN tier TEXT NOT NULL DEFAULT 'interactive'")
+
+# -------------------------------
+# 2. Worker
+# -------------------------------
+class ForecastWorker:
+    """
+    submit()/prefetch() insert jobs, the worker thread claims them by
+    (priority, id) and writes each forecast to the forecasts table.
+    version_fn returns the current data version; jobs for any other version
+    are marked stale instead of being fitted on the wrong data.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, version_fn=None, data_db_path=None, start=True):
+        self.db_path = db_path
+        self.data_db_path = data_db_path
+        if version_fn is None:
+            from database import get_data_version
+            version_fn = get_data_version
+        self.version_fn = version_fn
+        self._cube = (None, None)
+        self._pruned_for = None  # data version the tables were last pruned for
+        self._wake = threading.Event()
+        init_jobs_db(db_path)
+        with connect(db_path) as conn:
+            # A previous process died mid-fit — run those again
+            conn.execute("UPDATE forecast_jobs SET status='queued', progress=0 WHERE status='running'")
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self.run_forever, kwargs={'nice': True},
+                                            name="forecast-worker", daemon=True)
+            self._thread.start()
+
+    # ---------------------------
+    # Enqueue
+    # ---------------------------
+    def submit(self, data_version, horizon, typ, cat, priority=1, tier=DEFAULT_JOB_TIER):
+        """
+        Queue one job. If it already exists only its priority can move up (lower
+        number); failed jobs stay failed until refresh() so a broken series
+        isn't refitted on every rerun. A batch request re-runs an interactive result.
+        """
+        now = time.time()
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO forecast_jobs (data_version, horizon, type, category, priority, tier, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (data_version, horizon, type, category) DO UPDATE SET "
+                "priority = MIN(priority, excluded.priority), "
+                "status = CASE WHEN status = 'stale' OR (tier = 'interactive' AND excluded.tier = 'batch') "
+                "THEN 'queued' ELSE status END, "
+                "tier = CASE WHEN excluded.tier = 'batch' THEN 'batch' ELSE tier END",
+                (data_version, horizon, typ, cat, priority, tier, now, now),
+            )
+        self._wake.set()
+
+    def prefetch(self, data_version, targets_by_horizon, priority=1, tier=DEFAULT_JOB_TIER):
+        """Queue every {horizon: [(type, category), ...]} for this data version in one transaction."""
+        now = time.time()
+        rows = [(data_version, h, typ, cat, priority, tier, now, now)
+                for h, targets in targets_by_horizon.items() for typ, cat in targets]
+        with connect(self.db_path) as conn:
+            # Existing jobs are left alone, except interactive results that a batch run upgrades
+            conn.executemany(
+                "INSERT INTO forecast_jobs (data_version, horizon, type, category, priority, tier, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (data_version, horizon, type, category) DO UPDATE SET "
+                "tier = 'batch', status = 'queued', progress = 0 "
+                "WHERE forecast_jobs.tier = 'interactive' AND excluded.tier = 'batch' "
+                "AND forecast_jobs.status != 'running'", rows)
+        self._wake.set()
+
+    def refresh(self, data_version):
+        """Re-run every job of this version; stored forecasts stay readable until replaced."""
+        with connect(self.db_path) as conn:
+            conn.execute("UPDATE forecast_jobs SET status='queued', progress=0, updated_at=? "
+                         "WHERE data_version=? AND status != 'running'", (time.time(), data_version))
+        self._wake.set()
+
+    # ---------------------------
+    # Poll
+    # ---------------------------
+    def status(self, data_version, horizon, typ, cat):
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT status, progress, error FROM forecast_jobs "
+                "WHERE data_version=? AND horizon=? AND type=? AND category=?",
+                (data_version, horizon, typ, cat)).fetchone()
+        return dict(row) if row else None
+
+    def progress(self, data_version):
+        """{'queued': n, 'running': n, 'done': n, ...} for one data version."""
+        with connect(self.db_path) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM forecast_jobs WHERE data_version=? GROUP BY status",
+                                (data_version,)).fetchall()
+        return {r['status']: r['n'] for r in rows}
+
+    def completed_version(self):
+        """Newest data version whose jobs have all finished (done / failed), or None."""
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT data_version FROM forecast_jobs GROUP BY data_version "
+                "HAVING SUM(status IN ('queued', 'running', 'stale')) = 0 "
+                "ORDER BY MAX(updated_at) DESC LIMIT 1").fetchone()
+        return row['data_version'] if row else None
+
+    # ---------------------------
+    # Run
+    # ---------------------------
+    def prune(self, current_version):
+        """Drop the forecasts and jobs of every version but current_version and the newest completed one."""
+        completed = self.completed_version()
+        prune({current_version} | ({completed} if completed else set()), self.db_path)
+        self._pruned_for = current_version
+
+    def _claim(self):
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT id, data_version, horizon, type, category, tier FROM forecast_jobs "
+                               "WHERE status='queued' ORDER BY priority, id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute("UPDATE forecast_jobs SET status='running', progress=0.1, updated_at=? "
+                                   "WHERE id=? AND status='queued'", (time.time(), row['id'])).rowcount
+        return dict(row) if claimed else self._claim()
+
+    def _finish(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with connect(self.db_path) as conn:
+            conn.execute(f"UPDATE forecast_jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+
+    def _get_cube(self, data_version):
+        version, cube = self._cube
+        if version != data_version:
+            cube = read_forecast_cube(self.data_db_path)
+            self._cube = (data_version, cube)
+        return cube
+
+    def run_one(self):
+        """Claim and run one job. Returns False when the queue is empty."""
+        job = self._claim()
+        if job is None:
+            return False
+        current = self.version_fn()
+        if current != self._pruned_for:
+            self.prune(current)  # every write makes a new version; don't keep the old ones forever
+        if job['data_version'] != current:
+            self._finish(job['id'], status='stale', progress=0)
+            return True
+        try:
+            cube = self._get_cube(job['data_version'])
+            self._finish(job['id'], status='running', progress=0.5)
+            key = (job['horizon'], job['type'], job['category'])
+            pred = predict_target(cube, *key, tier=job['tier'])
+            if pred is not None:
+                save_forecast(job['data_version'], *key, pred, db_path=self.db_path)
+            self._finish(job['id'], status='done', progress=1.0, error=None)
+        except Exception as e:
+            self._finish(job['id'], status='failed', progress=0, error=str(e)[:500])
+        return True
+
+    def run_forever(self, nice=False):
+        if nice:
+            try:
+                # Linux nice value is per-thread; cmdstan children inherit it
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except (AttributeError, OSError):
+                pass
+        while True:
+            if not self.run_one():
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+
+# -------------------------------
+# 3. CLI (standalone worker process)
+# -------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the forecast job worker in the foreground")
+    parser.add_argument("--jobs-db", default=JOBS_DB_PATH, help="SQLite file holding the job table")
+    parser.add_argument("--enqueue-all", action="store_true",
+                        help="Queue every horizon/category for the current data version first (nightly refresh)")
+    parser.add_argument("--tier", choices=list(QUALITY_TIERS), default="batch",
+                        help="Quality tier for --enqueue-all jobs (default: batch, full uncertainty sampling)")
+    args = parser.parse_args(argv)
+
+    worker = ForecastWorker(args.jobs_db, start=False)
+    if args.enqueue_all:
+        version = worker.version_fn()
+        cube = worker._get_cube(version)
+        worker.prefetch(version, {h: fit_targets(cube, h) for h in HORIZONS}, tier=args.tier)
+    print(f"Forecast worker polling {args.jobs_db} ...")
+    worker.run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# ml_models.py
+# Next-transaction models (amount regressor + category classifier) kept as
+# versioned artefacts on disk instead of being retrained on every forecast run.
+#
+#   models/next_transaction/v0003/meta.json      vocab, classes, row fingerprint, MAE
+#   models/next_transaction/v0003/category.ubj   XGBoost booster (hist, continued on new rows)
+#   models/next_transaction/v0003/amount.joblib  RandomForestRegressor
+#
+#   from ml_models import update_models, predict_category
+#   bundle = update_models(df)          # load, extend with new rows, or retrain
+#   predict_category(bundle, amount=25.0, account="Cash", date="2025-06-01")
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = os.getenv("FINANCE_MODEL_DIR", "models")
+MODEL_NAME = "next_transaction"
+KEEP_VERSIONS = 3
+FULL_ROUNDS = 100     # same tree count XGBClassifier used by default
+UPDATE_ROUNDS = 10    # extra boosting rounds per batch of new transactions
+
+_bundle_cache = {}    # version path → loaded bundle (inference never re-reads a version)
+
+# -------------------------------
+# 1. Sparse Features
+# -------------------------------
+def prepare_frame(df):
+    """Date / Amount / Category / Account rows the models train on (amounts in MYR)."""
+    out = df[['Date', 'Amount', 'Category', 'Account']].copy()
+    out['Date'] = pd.to_datetime(out['Date'], errors='coerce')
+    out = out.dropna(subset=['Date', 'Amount', 'Category']).reset_index(drop=True)
+    out['DayOfWeek'] = out['Date'].dt.dayofweek
+    return out
+
+def build_vocab(df, columns):
+    return {col: sorted(df[col].dropna().astype(str).unique()) for col in columns}
+
+def encode(df, numeric, categorical, vocab):
+    """
+    CSR matrix: numeric columns first, then one one-hot block per categorical
+    column. Values missing from the vocab get an all-zero block, so the width
+    never changes between incremental updates.
+    """
+    from scipy import sparse
+
+    n = len(df)
+    blocks = [sparse.csr_matrix(df[numeric].to_numpy(dtype=float))]
+    for col in categorical:
+        index = {v: i for i, v in enumerate(vocab[col])}
+        codes = df[col].astype(str).map(index)
+        hit = codes.notna().to_numpy()
+        rows = np.flatnonzero(hit)
+        cols = codes[hit].to_numpy(dtype=np.int64)
+        blocks.append(sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, len(vocab[col]))))
+    return sparse.hstack(blocks, format='csr')
+
+def amount_features(df, vocab):
+    return encode(df, ['DayOfWeek'], ['Category', 'Account'], vocab)
+
+def category_features(df, vocab):
+    return encode(df, ['Amount', 'DayOfWeek'], ['Account'], vocab)
+
+def fingerprint(df, n_rows=None):
+    """Digest of the first n_rows training rows — tells 'rows appended' apart from 'rows edited'."""
+    rows = df if n_rows is None else df.iloc[:n_rows]
+    hashes = pd.util.hash_pandas_object(rows[['Date', 'Amount', 'Category', 'Account']], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+# -------------------------------
+# 2. Training
+# -------------------------------
+def _xgb_params(n_classes):
+    return {
+        'objective': 'multi:softprob', 'num_class': n_classes, 'eval_metric': 'mlogloss',
+        'tree_method': 'hist', 'seed': 42, 'nthread': -1,
+    }
+
+def _train_amount_model(df, vocab):
+    """RandomForest on sparse one-hots, all cores. Returns (model, holdout MAE)."""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error
+    from sklearn.model_selection import train_test_split
+
+    X = amount_features(df, vocab)
+    y = df['Amount'].to_numpy(dtype=float)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    rf = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+    rf.fit(X_train, y_train)
+    return rf, float(mean_absolute_error(y_test, rf.predict(X_test)))
+
+def _category_matrix(df, vocab, classes):
+    import xgboost as xgb
+    labels = df['Category'].astype(str).map({c: i for i, c in enumerate(classes)}).to_numpy()
+    return xgb.DMatrix(category_features(df, vocab), label=labels)
+
+def train_full(df):
+    """Fresh models on every row. Returns an unsaved bundle."""
+    import xgboost as xgb
+
+    vocab = build_vocab(df, ['Category', 'Account'])
+    classes = vocab['Category']
+    rf, mae = _train_amount_model(df, vocab)
+    booster = None
+    if len(classes) > 1:
+        booster = xgb.train(_xgb_params(len(classes)), _category_matrix(df, vocab, classes),
+                            num_boost_round=FULL_ROUNDS)
+    meta = {
+        'vocab': vocab, 'classes': classes, 'mae': mae,
+        'n_rows': len(df), 'digest': fingerprint(df),
+        'mode': 'full', 'boost_rounds': FULL_ROUNDS if booster is not None else 0,
+    }
+    return {'meta': meta, 'booster': booster, 'amount_model': rf}
+
+def can_extend(bundle, df):
+    """True if df is the trained rows plus appended rows with no unseen category/account."""
+    meta = bundle['meta']
+    n = meta['n_rows']
+    if len(df) <= n or bundle['booster'] is None or fingerprint(df, n) != meta['digest']:
+        return False
+    new = df.iloc[n:]
+    return (set(new['Category'].astype(str)) <= set(meta['classes'])
+            and set(new['Account'].dropna().astype(str)) <= set(meta['vocab']['Account']))
+
+def train_incremental(bundle, df):
+    """Continue boosting the saved booster on the appended rows only."""
+    import xgboost as xgb
+
+    meta = dict(bundle['meta'])
+    new = df.iloc[meta['n_rows']:]
+    booster = xgb.train(_xgb_params(len(meta['classes'])), _category_matrix(new, meta['vocab'], meta['classes']),
+                        num_boost_round=UPDATE_ROUNDS, xgb_model=bundle['booster'])
+    # A random forest cannot be extended in place; it's cheap on all cores, so refit it
+    rf, mae = _train_amount_model(df, meta['vocab'])
+    meta.update({
+        'mae': mae, 'n_rows': len(df), 'digest': fingerprint(df),
+        'mode': 'incremental', 'boost_rounds': meta['boost_rounds'] + UPDATE_ROUNDS,
+    })
+    return {'meta': meta, 'booster': booster, 'amount_model': rf}
+
+# -------------------------------
+# 3. Versioned Artefacts
+# -------------------------------
+def _model_root(model_dir):
+    return os.path.join(model_dir, MODEL_NAME)
+
+def list_versions(model_dir=MODEL_DIR):
+    root = _model_root(model_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(d[1:]) for d in os.listdir(root) if d.startswith('v') and d[1:].isdigit())
+
+def save_bundle(bundle, model_dir=MODEL_DIR):
+    """Write a new version directory (atomically renamed into place) and prune old ones."""
+    import joblib
+    import sklearn
+    import xgboost as xgb
+
+    root = _model_root(model_dir)
+    os.makedirs(root, exist_ok=True)
+    versions = list_versions(model_dir)
+    version = (versions[-1] + 1) if versions else 1
+    final = os.path.join(root, f"v{version:04d}")
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    meta = dict(bundle['meta'], version=version, created=time.strftime('%Y-%m-%d %H:%M:%S'),
+                xgboost=xgb.__version__, sklearn=sklearn.__version__)
+    if bundle['booster'] is not None:
+        bundle['booster'].save_model(os.path.join(tmp, "category.ubj"))
+    joblib.dump(bundle['amount_model'], os.path.join(tmp, "amount.joblib"))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, final)
+
+    for old in list_versions(model_dir)[:-KEEP_VERSIONS]:
+        path = os.path.join(root, f"v{old:04d}")
+        shutil.rmtree(path, ignore_errors=True)
+        _bundle_cache.pop(path, None)
+
+    bundle = dict(bundle, meta=meta)
+    _bundle_cache[final] = bundle
+    return bundle
+
+def load_bundle(model_dir=MODEL_DIR, version=None, amount_model=True):
+    """Latest (or given) version, or None if nothing has been trained yet. Cached per version."""
+    versions = list_versions(model_dir)
+    if not versions:
+        return None
+    version = versions[-1] if version is None else version
+    path = os.path.join(_model_root(model_dir), f"v{version:04d}")
+    cached = _bundle_cache.get(path)
+    if cached is not None and (cached['amount_model'] is not None or not amount_model):
+        return cached
+
+    import xgboost as xgb
+    with open(os.path.join(path, "meta.json"), encoding='utf-8') as f:
+        meta = json.load(f)
+    booster = None
+    if os.path.exists(os.path.join(path, "category.ubj")):
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(path, "category.ubj"))
+    rf = None
+    if amount_model:
+        import joblib
+        rf = joblib.load(os.path.join(path, "amount.joblib"))
+    bundle = {'meta': meta, 'booster': booster, 'amount_model': rf}
+    _bundle_cache[path] = bundle
+    return bundle
+
+def update_models(df, model_dir=MODEL_DIR, log=print):
+    """
+    Bring the saved models up to date with df (raw or prepared transactions, MYR):
+      - same rows as the latest version  → load it, no training
+      - only appended rows, nothing new  → continue boosting, refit the forest
+      - anything else (edits, deletes, new categories/accounts) → full retrain
+    """
+    df = prepare_frame(df)
+    bundle = load_bundle(model_dir)
+    if bundle is not None and bundle['meta']['n_rows'] == len(df) and bundle['meta']['digest'] == fingerprint(df):
+        log(f"Using cached models v{bundle['meta']['version']:04d}")
+        return bundle
+    if bundle is not None and can_extend(bundle, df):
+        log(f"Updating models with {len(df) - bundle['meta']['n_rows']:,} new transactions...")
+        bundle = train_incremental(bundle, df)
+    else:
+        log("Training models from scratch...")
+        bundle = train_full(df)
+    bundle = save_bundle(bundle, model_dir)
+    log(f"Saved models v{bundle['meta']['version']:04d}")
+    return bundle
+
+# -------------------------------
+# 4. Inference
+# -------------------------------
+def predict_category_proba(bundle, frame):
+    """Class probabilities (rows × classes) for a prepared frame."""
+    import xgboost as xgb
+
+    meta = bundle['meta']
+    if bundle['booster'] is None:
+        return np.ones((len(frame), len(meta['classes'])))
+    return bundle['booster'].predict(xgb.DMatrix(category_features(frame, meta['vocab'])))
+
+def predict_category(bundle, amount, account, date, top=1):
+    """
+    Most likely categories for one transaction: [(category, probability), ...].
+    Builds the single feature row directly (no DataFrame) for interactive use.
+    """
+    meta = bundle['meta']
+    accounts = meta['vocab']['Account']
+    row = np.zeros(2 + len(accounts))
+    row[0] = float(amount)
+    row[1] = pd.Timestamp(date).dayofweek
+    if account in accounts:
+        row[2 + accounts.index(account)] = 1.0
+    if bundle['booster'] is None:
+        proba = np.ones(len(meta['classes']))
+    else:
+        row[row == 0] = np.nan  # trained on CSR, where zeros are absent (= missing)
+        proba = bundle['booster'].inplace_predict(row.reshape(1, -1))[0]
+    order = np.argsort(proba)[::-1][:top]
+    return [(meta['classes'][i], float(proba[i])) for i in order]
+
+def predict_next_category(bundle, df):
+    """Category the classifier assigns to the latest transaction (forecaster report)."""
+    frame = prepare_frame(df).iloc[-1:]
+    proba = predict_category_proba(bundle, frame)[0]
+    return bundle['meta']['classes'][int(np.argmax(proba))]
@@ -4,7 +4,9 @@ import pandas as pd
 import uuid
 from datetime import datetime, date, time, timedelta
 from dateutil.relativedelta import relativedelta
-from database import init_db, add_transaction, get_last_n, format_display_df
+from database import init_db, add_transaction, get_last_n, format_display_df, get_data_version
+from suggestions import SuggestionService
+from data_access import load_transactions
 from datetime import datetime, date, time, timedelta, timezone
 import requests
 import os
@@ -30,6 +32,14 @@ def convert_to_myr(amount: float, from_currency: str) -> float:
         st.warning(f"⚠️ Could not convert {from_currency} to MYR. Storing as-is.")
         return amount
 
+# -------------------------------
+# Category / Account Suggestions
+# -------------------------------
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_suggestion_service(data_version):
+    # Title index over the shared frame (data_access.py) builds in milliseconds; the classifier loads in the background
+    return SuggestionService(load_transactions(data_version))
+
 # -------------------------------
 # Ensure login
 # -------------------------------
@@ -208,10 +218,32 @@ categories = [
     "Bills", "Education", "Entertainment", "Family", "Food", 
     "Grocery", "Health", "Insurance", "Other", "Transport", "Travel"
 ]
-category = st.selectbox("Category", [""] + categories, index=0)
-
 accounts = ["Savings Bank", "Salary Bank", "Cash", "Credit Card", "Wallet"]
-account = st.selectbox("Account", accounts, index=2)
+
+# Suggest category / account from past titles (or the classifier for new ones)
+try:
+    suggested_amount = float(amount_str.replace(",", "").strip()) if amount_str.strip() else None
+except ValueError:
+    suggested_amount = None
+suggestion = get_suggestion_service(get_data_version()).suggest(
+    name,
+    typ="INCOME" if st.session_state.is_income else "EXPENSE",
+    account=st.session_state.get("last_account"),
+    amount=suggested_amount,
+)
+category_index, account_index = 0, 2
+if suggestion:
+    if suggestion['category'] in categories:
+        category_index = categories.index(suggestion['category']) + 1
+    if suggestion['source'] == 'history' and suggestion['account'] in accounts:
+        account_index = accounts.index(suggestion['account'])
+    if category_index:
+        origin = f"like \"{suggestion['title']}\"" if suggestion['source'] == 'history' else "predicted"
+        st.caption(f"💡 Suggested: **{categories[category_index - 1]}** · {accounts[account_index]} ({origin})")
+
+category = st.selectbox("Category", [""] + categories, index=category_index)
+account = st.selectbox("Account", accounts, index=account_index)
+st.session_state.last_account = account
 
 currency_options = [
     "MYR", "USD", "EUR", "JPY", "GBP", "AUD", "CAD", "CHF", "CNY", "SEK",
@@ -379,9 +411,8 @@ if st.button("✅ Add Record", type="primary"):
             f"✅ Saved **{len(entries_to_add)}** transaction(s): "
             f"**{name.strip()}** → {raw_amount:,.2f} {currency} ({record_type})"
         )
-        # THIS IS THE NUCLEAR FIX — FORCES INSTANT REFRESH EVERYWHERE
-        st.cache_data.clear()                     # Clears ALL Streamlit cache
-        st.session_state.new_transaction_added = True     
+        # No cache clearing needed: the write moves database.get_data_version(),
+        # which every page's cached data is keyed by
 
         # Reset form
         st.session_state.is_income = False
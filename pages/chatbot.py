@@ -1,11 +1,19 @@
 import streamlit as st
 import google.generativeai as genai
 import os
-import pandas as pd
 import sqlite3
+import pandas as pd
 import requests
 from datetime import datetime
+from functools import wraps
 from dotenv import load_dotenv
+import analytics
+from database import DB_PATH, aggregate, get_data_version
+from forecast_engine import fit_targets, forecast_dates
+from forecast_store import get_forecasts, reconcile_stored, unfinished_targets
+from reconciliation import TOTAL_CATEGORIES
+from aggregation import AggregationEngine
+from data_access import load_forecast_cube, load_transactions
 
 # -------------------------------
 # Load environment variables (from .env)
@@ -181,37 +189,38 @@ elif st.session_state.messages and "Financial Assistant" in st.session_state.mes
         st.session_state.messages[0]["content"] = welcome_msg
 
 # -------------------------------
-# Load Data from finance.db
+# Load Data (shared with every page, see data_access.py)
 # -------------------------------
-@st.cache_data(ttl=300)
-def load_data_from_db():
-    try:
-        conn = sqlite3.connect("finance.db")
-        df = pd.read_sql_query("""
-            SELECT date, title, category, account, amount, currency, type, is_recurring
-            FROM transactions 
-            WHERE date IS NOT NULL AND amount IS NOT NULL
-        """, conn)
-        conn.close()
-        
-        df['Date'] = pd.to_datetime(df['date'], errors='coerce')
-        df['Amount'] = pd.to_numeric(df['amount'], errors='coerce')
-        df['Type'] = df['type'].str.strip().str.upper()
-        df['Category'] = df['category'].str.strip().str.title()
-        df['Account'] = df['account'].str.strip().str.title()
-        df['Title'] = df['title'].str.strip()
-        df['Is_Recurring'] = pd.to_numeric(df['is_recurring'], errors='coerce').fillna(0)
-        
-        return df.dropna(subset=['Date', 'Amount', 'Type'])
-    except Exception as e:
-        st.error(f"Database error: {e}")
-        return pd.DataFrame()
+@st.cache_resource(max_entries=1)
+def load_engine(data_version):
+    # Encoded once per data version and shared by every helper below (MYR)
+    return AggregationEngine(load_transactions(data_version))
 
-df = load_data_from_db()
+@st.cache_data(max_entries=1, show_spinner=False)
+def load_monthly_summary(data_version):
+    # Month × type totals (MYR) for the savings and cash-flow analyses, grouped in DuckDB
+    # over the live database (the cache is keyed on its version, so never a snapshot)
+    return analytics.group_sum(['M', 'Type'], source=DB_PATH)
+
+data_version = get_data_version()
+df = load_transactions(data_version)
+engine = load_engine(data_version) if not df.empty else None
 
 # ------------------
 # Helper Functions 
 # ------------------
+def _engine(df, engine=None):
+    """The shared engine if it matches df, otherwise one built for df."""
+    if engine is None or engine.n != len(df):
+        engine = AggregationEngine(df)
+    return engine
+
+def _monthly_summary(df, engine=None):
+    """Month × type totals of df: from DuckDB (analytics.py) for the shared frame when installed."""
+    if analytics.available() and engine is not None and engine.n == len(df):
+        return load_monthly_summary(data_version)
+    return _engine(df, engine).sum(['M', 'Type'])
+
 def get_last_5_transactions(df, exchange_rate, currency_symbol):
     if df.empty:
         return "No transactions found."
@@ -223,57 +232,73 @@ def get_last_5_transactions(df, exchange_rate, currency_symbol):
         rows.append(f"{date_str}: {r['Title']} → {currency_symbol}{amt:,.2f} ({r['Category']})")
     return "📋 <strong>Last 5 Transactions</strong>:<br><br>" + "<br>".join(rows)
 
-def get_total_income(df, exchange_rate, currency_symbol, monthly=False):
-    if df.empty:
+# The quick totals below run as GROUP BY queries inside SQLite (database.aggregate),
+# so answering them never needs the transaction frame. A locked or missing
+# database turns into an apology in the chat instead of an exception.
+def _sql_answer(answer):
+    @wraps(answer)
+    def guarded(*args, **kwargs):
+        try:
+            return answer(*args, **kwargs)
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            return f"⚠️ Couldn't read your transactions right now ({e}). Please try again in a moment."
+    return guarded
+
+def _month_range(month):
+    """(start, end) of the calendar month containing `month`, end exclusive."""
+    start = pd.Timestamp(month).to_period('M').to_timestamp()
+    return start, start + pd.offsets.MonthBegin()
+
+@_sql_answer
+def get_total_income(exchange_rate, currency_symbol, monthly=False):
+    by_type = aggregate(['sum', 'count'], group_by=['Type']).set_index('Type')
+    if by_type.empty:
         return "No income data."
-    
-    income_df = df[df['Type'] == 'INCOME'].copy()
-    if income_df.empty:
+    if 'INCOME' not in by_type.index:
         return "✅ No income recorded."
 
+    totals = by_type.loc['INCOME']
+
     if monthly:
-        this_month = pd.Timestamp.today().to_period('M')
-        income_df = income_df[income_df['Date'].dt.to_period('M') == this_month]
-        if income_df.empty:
+        totals = aggregate(['sum', 'count'], typ='INCOME', date_range=_month_range(pd.Timestamp.today())).iloc[0]
+        if not totals['count']:
             return "✅ No income recorded this month."
 
-    total = income_df['Amount'].sum() * exchange_rate
+    total = totals['sum'] * exchange_rate
     period = "this month" if monthly else "total"
     return f"📈 <strong>Total Income ({period})</strong>: {currency_symbol}{total:,.2f}"
 
-def get_net_balance(df, exchange_rate, currency_symbol, monthly=False):
-    if df.empty:
-        return "No transaction data."
-
-    this_month = pd.Timestamp.today().to_period('M') if monthly else None
-    if monthly:
-        df = df[df['Date'].dt.to_period('M') == this_month]
-        if df.empty:
-            return "✅ No transactions recorded this month."
+@_sql_answer
+def get_net_balance(exchange_rate, currency_symbol, monthly=False):
+    date_range = _month_range(pd.Timestamp.today()) if monthly else None
+    by_type = aggregate(['sum'], group_by=['Type'], date_range=date_range).set_index('Type')['sum'] * exchange_rate
+    if by_type.empty:
+        return "✅ No transactions recorded this month." if monthly else "No transaction data."
 
-    income = df[df['Type'] == 'INCOME']['Amount'].sum() * exchange_rate
-    expense = df[df['Type'] == 'EXPENSE']['Amount'].sum() * exchange_rate
+    income = by_type.get('INCOME', 0.0)
+    expense = by_type.get('EXPENSE', 0.0)
     balance = income - expense
     status = "Profit" if balance >= 0 else "Loss"
     period = "this month" if monthly else "total"
     return f"💰 <strong>Net Balance ({period})</strong>: {currency_symbol}{balance:,.2f} ({status})"
 
-def get_top_expense_category(df, exchange_rate, currency_symbol):
-    expense_df = df[df['Type'] == 'EXPENSE']
-    if expense_df.empty:
+@_sql_answer
+def get_top_expense_category(exchange_rate, currency_symbol):
+    by_cat = aggregate(['sum'], group_by=['Category'], typ='EXPENSE').set_index('Category')['sum']
+    if by_cat.empty:
         return "No expense data."
-    top_cat = expense_df.groupby('Category')['Amount'].sum().sort_values(ascending=False).index[0]
-    top_amt = expense_df[expense_df['Category'] == top_cat]['Amount'].sum() * exchange_rate
+    top_cat = by_cat.sort_values(ascending=False).index[0]
+    top_amt = by_cat[top_cat] * exchange_rate
     return f"🔥 <strong>Top Expense Category</strong>: <strong>{top_cat}</strong> → {currency_symbol}{top_amt:,.2f}"
 
-def get_spending_alert(df, exchange_rate, currency_symbol):
+def get_spending_alert(df, exchange_rate, currency_symbol, engine=None):
     if df.empty:
         return "No transactions yet."
     
-    df['Month'] = df['Date'].dt.to_period('M')
-    this_month = pd.Timestamp.today().to_period('M')
+    engine = _engine(df, engine)
+    this_month = pd.Timestamp.today().to_period('M').to_timestamp()
     
-    current = df[(df['Month'] == this_month) & (df['Type'] == 'EXPENSE')]
+    current = engine.sum('Category', Type='EXPENSE', M=this_month)
     if current.empty:
         # Clear alert context
         if "alert_category" in st.session_state:
@@ -282,18 +307,18 @@ def get_spending_alert(df, exchange_rate, currency_symbol):
             del st.session_state["alert_amount"]
         return "✅ No spending this month yet. Great start!"
     
-    past = df[(df['Month'] < this_month) & (df['Type'] == 'EXPENSE')]
-    if past.empty:
+    past = engine.mask(Type='EXPENSE', end=this_month)
+    if not past.any():
         if "alert_category" in st.session_state:
             del st.session_state["alert_category"]
         if "alert_amount" in st.session_state:
             del st.session_state["alert_amount"]
         return "✅ Not enough past data for alerts. Keep tracking!"
     
-    avg_by_cat = past.groupby('Category')['Amount'].sum() / len(past['Month'].unique())
+    avg_by_cat = engine.sum('Category', mask=past) / len(engine.sum('M', mask=past))
     alerts = []
     for cat, avg in avg_by_cat.items():
-        spent = current[current['Category'] == cat]['Amount'].sum() * exchange_rate
+        spent = current.get(cat, 0.0) * exchange_rate
         avg_amt = avg * exchange_rate
         if spent > 0.8 * avg_amt:
             alerts.append(f"⚠️ <strong>{cat}</strong>: {currency_symbol}{spent:,.0f} (80%+ of avg {currency_symbol}{avg_amt:,.0f})")
@@ -313,17 +338,15 @@ def get_spending_alert(df, exchange_rate, currency_symbol):
             "<br>".join(alerts) + 
             "<br><br>💬 Type <strong>'action plan'</strong> to get AI steps to fix this!")
 
-def get_budget_tip(df, exchange_rate, currency_symbol):
+def get_budget_tip(df, exchange_rate, currency_symbol, engine=None):
     # ✅ Filter to THIS MONTH only
-    df['Month'] = df['Date'].dt.to_period('M')
-    this_month = pd.Timestamp.today().to_period('M')
-    current_month_expense = df[(df['Month'] == this_month) & (df['Type'] == 'EXPENSE')]
+    current_month_expense = _engine(df, engine).sum('Category', Type='EXPENSE', M=pd.Timestamp.today()) if not df.empty else pd.Series(dtype=float)
     
     if current_month_expense.empty:
         return "✅ No expenses this month yet. Great start!"
     
     # ✅ Get top 3 categories THIS MONTH
-    top3 = current_month_expense.groupby('Category')['Amount'].sum().nlargest(3)
+    top3 = current_month_expense.nlargest(3)
     tips = []
     for cat, amt in top3.items():
         amt_fmt = amt * exchange_rate
@@ -334,33 +357,65 @@ def get_budget_tip(df, exchange_rate, currency_symbol):
             "<br><br>".join(tips) +
             "<br><br>💬 Type <strong>'detailed tips for [Category]'</strong> (e.g., 'detailed tips for Family') to get specific ways to save!")
     
-def get_forecast_summary(df, exchange_rate, currency_symbol):
+def get_stored_next_month():
+    """
+    ((income, expense) or None, missing categories) for the next month (MYR),
+    reconciled from the stored category forecasts on the shared periods after
+    the newest transaction. While any category is still forecasting the totals
+    are None (a partial sum is no forecast) and those categories are listed;
+    once all jobs are finished the totals leave out, and list, the failed ones.
+    """
+    if df.empty:
+        return None, []
+    targets = fit_targets(load_forecast_cube(data_version), "2 Months")
+    try:
+        pending = unfinished_targets(data_version, "2 Months", targets)
+        if pending:
+            return None, [cat for _, cat in pending]
+        stored = get_forecasts(data_version, "2 Months")
+    except sqlite3.Error:
+        return None, []
+    fitted = set(zip(stored['type'], stored['category']))
+    failed = [cat for typ, cat in targets if (typ, cat) not in fitted]
+    nodes = reconcile_stored(stored, dates=forecast_dates(df['Date'].max(), "2 Months"))
+    income = nodes.get(('INCOME', TOTAL_CATEGORIES['INCOME']))
+    expense = nodes.get(('EXPENSE', TOTAL_CATEGORIES['EXPENSE']))
+    if income is None or expense is None:
+        return None, []
+    return (float(income['yhat'].iloc[0]), float(expense['yhat'].iloc[0])), failed
+
+def _three_month_average(engine, typ):
+    """Mean of the last 3 calendar months (gaps count as 0), or the per-active-month mean for short histories."""
+    monthly = engine.sum('M', fill=True, Type=typ)
+    if monthly.empty:
+        return 0.0
+    if engine.mask(Type=typ).sum() >= 30:  # At least 30 transactions
+        return monthly.tail(3).mean()
+    return monthly.sum() / max(len(engine.sum('M', Type=typ)), 1)
+
+def get_forecast_summary(df, exchange_rate, currency_symbol, engine=None):
     if df.empty:
         return "📊 <strong>FORECAST INSIGHT</strong>:<br>No transaction data available for forecasting."
-    
-    # Income forecast (3-month avg or total)
-    income_df = df[df['Type'] == 'INCOME'].copy()
-    if not income_df.empty:
-        income_df.set_index('Date', inplace=True)
-        if len(income_df) >= 30:  # At least 30 days of data
-            income_3m = income_df['Amount'].resample('M').sum().tail(3).mean()
-        else:
-            income_3m = income_df['Amount'].sum() / max(len(income_df['Date'].dt.to_period('M').unique()), 1)
-        income_next = income_3m * exchange_rate
-    else:
-        income_next = 0
-
-    # Expense forecast (3-month avg or total)
-    expense_df = df[df['Type'] == 'EXPENSE'].copy()
-    if not expense_df.empty:
-        expense_df.set_index('Date', inplace=True)
-        if len(expense_df) >= 30:
-            expense_3m = expense_df['Amount'].resample('M').sum().tail(3).mean()
-        else:
-            expense_3m = expense_df['Amount'].sum() / max(len(expense_df['Date'].dt.to_period('M').unique()), 1)
-        expense_next = expense_3m * exchange_rate
-    else:
-        expense_next = 0
+
+    # Prefer the AI forecasts the Trend & Prediction page already stored for this data
+    stored, missing = get_stored_next_month()
+    if stored is not None:
+        income_next, expense_next = (v * exchange_rate for v in stored)
+        net_next = income_next - expense_next
+        status = "surplus" if net_next >= 0 else "deficit"
+        partial = (f"<br>⚠️ <em>Partial total: leaves out {len(missing)} "
+                   f"categor{'y' if len(missing) == 1 else 'ies'} whose forecast failed ({', '.join(missing)}).</em>"
+                   if missing else "")
+        return (f"📈 <strong>Forecast Summary (Next Month)</strong>:<br><br>"
+                f"• <strong>Income</strong>: {currency_symbol}{income_next:,.0f}<br>"
+                f"• <strong>Expenses</strong>: {currency_symbol}{expense_next:,.0f}<br>"
+                f"• <strong>Net</strong>: {currency_symbol}{net_next:,.0f} ({status})<br><br>"
+                f"ℹ️ <em>AI forecast (same as the <strong>Trend & Prediction</strong> page).</em>{partial}")
+    
+    # Income / expense forecast (3-month avg or total)
+    engine = _engine(df, engine)
+    income_next = _three_month_average(engine, 'INCOME') * exchange_rate
+    expense_next = _three_month_average(engine, 'EXPENSE') * exchange_rate
 
     net_next = income_next - expense_next
     status = "surplus" if net_next >= 0 else "deficit"
@@ -369,30 +424,30 @@ def get_forecast_summary(df, exchange_rate, currency_symbol):
             f"• <strong>Income</strong>: {currency_symbol}{income_next:,.0f}<br>"
             f"• <strong>Expenses</strong>: {currency_symbol}{expense_next:,.0f}<br>"
             f"• <strong>Net</strong>: {currency_symbol}{net_next:,.0f} ({status})<br><br>"
-            f"ℹ️ <em>Based on 3-month average. For detailed AI-powered forecasts, visit the <strong>Trend & Prediction</strong> page.</em>")
+            f"ℹ️ <em>Based on 3-month average. For detailed AI-powered forecasts, visit the <strong>Trend & Prediction</strong> page.</em>"
+            + (f"<br>⏳ <em>{len(missing)} categor{'y' if len(missing) == 1 else 'ies'} still forecasting — "
+               "the AI forecast replaces this average once they are done.</em>" if missing else ""))
 
-def get_recurring_audit(df, exchange_rate, currency_symbol):
+def get_recurring_audit(df, exchange_rate, currency_symbol, engine=None):
     """Analyze recurring expenses and flag potential waste."""
-    recurring = df[(df['Is_Recurring'] == 1) & (df['Type'] == 'EXPENSE')]
-    if recurring.empty:
+    if df.empty:
+        return "✅ No recurring expenses found."
+    engine = _engine(df, engine)
+    recurring = engine.mask((df['Is_Recurring'] == 1).to_numpy(), Type='EXPENSE')
+    if not recurring.any():
         return "✅ No recurring expenses found."
 
     # Group by category and calculate avg monthly cost
-    recurring = recurring.copy()
-    recurring['Month'] = recurring['Date'].dt.to_period('M')
-    monthly_avg = recurring.groupby('Category').agg(
-        total_amount=('Amount', 'sum'),
-        months_active=('Month', 'nunique')
-    )
-    monthly_avg['avg_monthly'] = (monthly_avg['total_amount'] / monthly_avg['months_active']) * exchange_rate
+    total_amount = engine.sum('Category', mask=recurring)
+    months_active = engine.nunique('Category', 'M', mask=recurring)
+    avg_monthly = (total_amount / months_active).dropna() * exchange_rate
 
     # Find latest transaction per category for inactivity check
-    latest_tx = recurring.loc[recurring.groupby('Category')['Date'].idxmax()]
+    latest_tx = df.loc[recurring].groupby('Category')['Date'].max()
     today = pd.Timestamp.today()
     lines = []
-    for cat, row in monthly_avg.iterrows():
-        avg_amt = row['avg_monthly']
-        latest_date = latest_tx[latest_tx['Category'] == cat]['Date'].iloc[0]
+    for cat, avg_amt in avg_monthly.items():
+        latest_date = latest_tx[cat]
         days_since = (today - latest_date).days
         
         if days_since > 60:  # Flag if no use in 60+ days
@@ -407,14 +462,16 @@ def get_recurring_audit(df, exchange_rate, currency_symbol):
             "<br>".join(lines) + 
             "<br><br>💡 Tip: Cancel unused subscriptions to boost your net balance.")
 
-def get_mom_trend(df, exchange_rate, currency_symbol):
+@_sql_answer
+def get_mom_trend(exchange_rate, currency_symbol):
     """Calculate MoM % change in total expenses."""
-    expenses = df[df['Type'] == 'EXPENSE'].copy()
-    if expenses.empty:
+    monthly = aggregate(['sum'], group_by=['M'], typ='EXPENSE').set_index('M')['sum']
+    if not monthly.empty:
+        monthly = monthly.reindex(pd.date_range(monthly.index[0], monthly.index[-1], freq='MS'), fill_value=0.0)
+    monthly = monthly * exchange_rate
+    if monthly.empty:
         return "✅ No expense data to analyze."
 
-    expenses.set_index('Date', inplace=True)
-    monthly = expenses['Amount'].resample('M').sum() * exchange_rate
     if len(monthly) < 2:
         return "📈 Only one month of data—trend analysis requires ≥2 months."
 
@@ -423,11 +480,10 @@ def get_mom_trend(df, exchange_rate, currency_symbol):
     pct_change = ((current - prior) / prior) * 100 if prior != 0 else 0
 
     # Find top growing category
-    current_month = expenses[expenses.index.to_period('M') == monthly.index[-1].to_period('M')]
-    prior_month = expenses[expenses.index.to_period('M') == monthly.index[-2].to_period('M')]
-    
-    cat_current = current_month.groupby('Category')['Amount'].sum()
-    cat_prior = prior_month.groupby('Category')['Amount'].sum()
+    cat_current, cat_prior = (
+        aggregate(['sum'], group_by=['Category'], typ='EXPENSE', date_range=_month_range(m)).set_index('Category')['sum']
+        for m in (monthly.index[-1], monthly.index[-2])
+    )
     cat_change = (cat_current - cat_prior).fillna(0) * exchange_rate
     top_cat = cat_change.abs().idxmax() if not cat_change.empty else "Unknown"
     top_delta = cat_change.get(top_cat, 0)
@@ -449,13 +505,12 @@ def get_mom_trend(df, exchange_rate, currency_symbol):
     
     return base_msg
 
-def get_savings_health(df, exchange_rate, currency_symbol):
+def get_savings_health(df, exchange_rate, currency_symbol, engine=None):
     """Calculate savings rate and provide benchmark context."""
     if df.empty:
         return "📊 No transaction data available."
 
-    df['Month'] = df['Date'].dt.to_period('M')
-    monthly_summary = df.groupby(['Month', 'Type'])['Amount'].sum().unstack(fill_value=0)
+    monthly_summary = _monthly_summary(df, engine)
     
     if 'INCOME' not in monthly_summary.columns:
         monthly_summary['INCOME'] = 0
@@ -490,15 +545,13 @@ def get_savings_health(df, exchange_rate, currency_symbol):
         "💡 <em>Target: ≥20% for long-term security (per global best practices).</em>"
     )
 
-def get_cash_flow_stability(df, exchange_rate, currency_symbol):
+def get_cash_flow_stability(df, exchange_rate, currency_symbol, engine=None):
     """Analyze volatility in monthly income and expenses."""
     if df.empty:
         return "📊 No transaction data available for cash flow analysis."
 
     # Prepare monthly aggregates
-    df = df.copy()
-    df['Month'] = df['Date'].dt.to_period('M')
-    monthly = df.groupby(['Month', 'Type'])['Amount'].sum().unstack(fill_value=0)
+    monthly = _monthly_summary(df, engine)
     
     # Ensure both INCOME and EXPENSE columns exist
     if 'INCOME' not in monthly.columns:
@@ -583,14 +636,12 @@ def get_cash_flow_stability(df, exchange_rate, currency_symbol):
 # ---------------------------------------
 # AI-Powered Action Plan
 # ---------------------------------------
-def get_alert_action_plan(user_query, df, exchange_rate, currency_symbol):
+def get_alert_action_plan(user_query, df, exchange_rate, currency_symbol, engine=None):
     """AI plan for spending alerts (uses alert context only)"""
     if df.empty:
         return "No data to analyze."
     
-    df['Month'] = df['Date'].dt.to_period('M')
-    this_month = pd.Timestamp.today().to_period('M')
-    current_month_expense = df[(df['Month'] == this_month) & (df['Type'] == 'EXPENSE')]
+    current_month_expense = _engine(df, engine).sum('Category', Type='EXPENSE', M=pd.Timestamp.today())
     
     if current_month_expense.empty:
         return "✅ No expenses this month. Great job!"
@@ -601,11 +652,11 @@ def get_alert_action_plan(user_query, df, exchange_rate, currency_symbol):
         cat_amt = st.session_state["alert_amount"]
     else:
         # Fallback to this month's top category
-        top_cat_series = current_month_expense.groupby('Category')['Amount'].sum().nlargest(1)
+        top_cat_series = current_month_expense.nlargest(1)
         target_cat = top_cat_series.index[0]
         cat_amt = top_cat_series.iloc[0] * exchange_rate
     
-    total_expense = current_month_expense['Amount'].sum() * exchange_rate
+    total_expense = current_month_expense.sum() * exchange_rate
     
     context = f"""
 You are a professional financial coach. 
@@ -625,14 +676,12 @@ User asked: "{user_query}"
     except Exception as e:
         return f"AI is busy right now. Error: {str(e)[:50]}..."
     
-def get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol):
+def get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol, engine=None):
     """AI tips for budget categories (requires category in query)"""
     if df.empty:
         return "No data to analyze."
     
-    df['Month'] = df['Date'].dt.to_period('M')
-    this_month = pd.Timestamp.today().to_period('M')
-    current_month_expense = df[(df['Month'] == this_month) & (df['Type'] == 'EXPENSE')]
+    current_month_expense = _engine(df, engine).sum('Category', Type='EXPENSE', M=pd.Timestamp.today())
     
     if current_month_expense.empty:
         return "✅ No expenses this month. Great job!"
@@ -641,7 +690,7 @@ def get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol):
     user_query_clean = user_query.lower().replace("detailed tips for", "").strip()
     detected_cat = None
     
-    for cat in current_month_expense['Category'].unique():
+    for cat in current_month_expense.index:
         if cat.lower() in user_query_clean or user_query_clean in cat.lower():
             detected_cat = cat
             break
@@ -649,8 +698,8 @@ def get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol):
     if not detected_cat:
         return "❓ Please specify a category (e.g., 'detailed tips for Family')."
     
-    cat_amt = current_month_expense[current_month_expense['Category'] == detected_cat]['Amount'].sum() * exchange_rate
-    total_expense = current_month_expense['Amount'].sum() * exchange_rate
+    cat_amt = current_month_expense[detected_cat] * exchange_rate
+    total_expense = current_month_expense.sum() * exchange_rate
     savings_target = cat_amt * 0.2
     
     context = f"""
@@ -670,23 +719,19 @@ Give 5 CONCRETE, actionable tips to reduce '{detected_cat}' spending:
     except Exception as e:
         return f"AI is busy right now. Error: {str(e)[:50]}..."
 
-def get_mom_action_plan(user_query, df, exchange_rate, currency_symbol):
+def get_mom_action_plan(user_query, df, exchange_rate, currency_symbol, engine=None):
     """Generate AI action plan for rising MoM expenses."""
     if df.empty:
         return "No data to analyze."
 
-    expenses = df[df['Type'] == 'EXPENSE'].copy()
-    if expenses.empty or len(expenses['Date'].dt.to_period('M').unique()) < 2:
+    engine = _engine(df, engine)
+    if len(engine.sum('M', Type='EXPENSE')) < 2:
         return "Not enough data for trend-based advice."
 
     # Identify top growing category
-    expenses.set_index('Date', inplace=True)
-    monthly = expenses['Amount'].resample('M').sum()
-    current_month = expenses[expenses.index.to_period('M') == monthly.index[-1].to_period('M')]
-    prior_month = expenses[expenses.index.to_period('M') == monthly.index[-2].to_period('M')]
-    
-    cat_current = current_month.groupby('Category')['Amount'].sum()
-    cat_prior = prior_month.groupby('Category')['Amount'].sum()
+    monthly = engine.sum('M', fill=True, Type='EXPENSE')
+    cat_current = engine.sum('Category', Type='EXPENSE', M=monthly.index[-1])
+    cat_prior = engine.sum('Category', Type='EXPENSE', M=monthly.index[-2])
     cat_change = (cat_current - cat_prior).fillna(0)
     if cat_change.empty:
         top_cat = "General"
@@ -713,14 +758,12 @@ User wants to control increasing spending.
         return f"AI is busy. Error: {str(e)[:50]}..."
 
 
-def get_cash_flow_action_plan(user_query, df, exchange_rate, currency_symbol):
+def get_cash_flow_action_plan(user_query, df, exchange_rate, currency_symbol, engine=None):
     """Generate AI action plan for volatile cash flow."""
     if df.empty:
         return "No data to analyze."
 
-    df = df.copy()
-    df['Month'] = df['Date'].dt.to_period('M')
-    monthly = df.groupby(['Month', 'Type'])['Amount'].sum().unstack(fill_value=0)
+    monthly = _monthly_summary(df, engine)
     if 'INCOME' not in monthly: monthly['INCOME'] = 0
     if 'EXPENSE' not in monthly: monthly['EXPENSE'] = 0
     if len(monthly) < 2:
@@ -840,19 +883,19 @@ if st.session_state.is_typing and st.session_state.messages[-1]["role"] == "user
     # 1. ACTION PLANS (highest priority)
     if any(k in user_query for k in ["action plan", "what to do", "how to fix", "help me", "steps", "advice"]):
         if any(kw in user_query for kw in ["trend", "increasing", "month over month", "mom"]):
-            trend_report = get_mom_trend(df, exchange_rate, currency_symbol)
+            trend_report = get_mom_trend(exchange_rate, currency_symbol)
             if "increasing" in trend_report:
-                bot_reply = get_mom_action_plan(user_query, df, exchange_rate, currency_symbol)
+                bot_reply = get_mom_action_plan(user_query, df, exchange_rate, currency_symbol, engine=engine)
             else:
                 bot_reply = "Your spending trend is stable or decreasing—great job! No action needed."
         elif any(kw in user_query for kw in ["cash flow", "volatile", "stability", "consistent"]):
-            stability_report = get_cash_flow_stability(df, exchange_rate, currency_symbol)
+            stability_report = get_cash_flow_stability(df, exchange_rate, currency_symbol, engine=engine)
             if "Volatile" in stability_report or "Highly Volatile" in stability_report:
-                bot_reply = get_cash_flow_action_plan(user_query, df, exchange_rate, currency_symbol)
+                bot_reply = get_cash_flow_action_plan(user_query, df, exchange_rate, currency_symbol, engine=engine)
             else:
                 bot_reply = "Your cash flow is stable—excellent! Keep maintaining your buffer."
         else:
-            bot_reply = get_alert_action_plan(user_query, df, exchange_rate, currency_symbol)
+            bot_reply = get_alert_action_plan(user_query, df, exchange_rate, currency_symbol, engine=engine)
 
     # 2. SPECIALIZED REPORTS (context-aware)
     elif any(k in user_query for k in [
@@ -860,58 +903,58 @@ if st.session_state.is_typing and st.session_state.messages[-1]["role"] == "user
         "how consistent", "income stability", "expense stability", "volatility",
         "financial rollercoaster", "money up and down", "income stable", "stable"
     ]):
-        bot_reply = get_cash_flow_stability(df, exchange_rate, currency_symbol)
+        bot_reply = get_cash_flow_stability(df, exchange_rate, currency_symbol, engine=engine)
     
     # Forecast-related queries (MUST come before generic "income" to avoid conflict)
     elif any(k in user_query for k in ["forecast", "next month", "future", "predict", "future income", "future spending", "upcoming"]):
-        bot_reply = get_forecast_summary(df, exchange_rate, currency_symbol)
+        bot_reply = get_forecast_summary(df, exchange_rate, currency_symbol, engine=engine)
         
     # Monthly income
     elif any(k in user_query for k in [
         "earnings this month", "income this month", "this month income", "monthly income",
         "show me my earnings this month", "current income"
     ]):
-        bot_reply = get_total_income(df, exchange_rate, currency_symbol, monthly=True)
+        bot_reply = get_total_income(exchange_rate, currency_symbol, monthly=True)
 
     # Monthly balance
     elif any(k in user_query for k in [
         "profit or loss this month", "am i in profit this month", "monthly profit",
         "this month balance", "net this month", "balance this month", "current balance"
     ]):
-        bot_reply = get_net_balance(df, exchange_rate, currency_symbol, monthly=True)
+        bot_reply = get_net_balance(exchange_rate, currency_symbol, monthly=True)
 
     # Generic income
     elif any(k in user_query for k in ["income", "earnings", "salary", "revenue", "money did i make", "how much did i earn", "total earnings", "made money"]):
-        bot_reply = get_total_income(df, exchange_rate, currency_symbol)
+        bot_reply = get_total_income(exchange_rate, currency_symbol)
 
     # Generic balance
     elif any(k in user_query for k in ["balance", "net", "profit", "loss", "profit or loss", "am i in", "bottom line", "net position"]):
-        bot_reply = get_net_balance(df, exchange_rate, currency_symbol)
+        bot_reply = get_net_balance(exchange_rate, currency_symbol)
 
     # 3. STANDARD REPORTS (broad keywords)
     elif any(k in user_query for k in ["alert", "overspend", "warning"]):
-        bot_reply = get_spending_alert(df, exchange_rate, currency_symbol)
+        bot_reply = get_spending_alert(df, exchange_rate, currency_symbol, engine=engine)
 
     elif "detailed tips for" in user_query:
-        bot_reply = get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol)
+        bot_reply = get_budget_detailed_tips(user_query, df, exchange_rate, currency_symbol, engine=engine)
 
     elif any(k in user_query for k in ["tip", "budget", "save money", "reduce", "cut"]):
-        bot_reply = get_budget_tip(df, exchange_rate, currency_symbol)
+        bot_reply = get_budget_tip(df, exchange_rate, currency_symbol, engine=engine)
 
     elif any(k in user_query for k in ["last 5", "recent", "latest transactions"]):
         bot_reply = get_last_5_transactions(df, exchange_rate, currency_symbol)
 
     elif any(k in user_query for k in ["top", "highest", "most spent", "biggest expense", "spend the most"]):
-        bot_reply = get_top_expense_category(df, exchange_rate, currency_symbol)
+        bot_reply = get_top_expense_category(exchange_rate, currency_symbol)
 
     elif any(k in user_query for k in ["recurring", "subscription", "auto-pay", "monthly bill"]):
-        bot_reply = get_recurring_audit(df, exchange_rate, currency_symbol)
+        bot_reply = get_recurring_audit(df, exchange_rate, currency_symbol, engine=engine)
 
     elif any(k in user_query for k in ["savings", "save", "buffer", "emergency fund", "financial health"]):
-        bot_reply = get_savings_health(df, exchange_rate, currency_symbol)
+        bot_reply = get_savings_health(df, exchange_rate, currency_symbol, engine=engine)
 
     elif any(k in user_query for k in ["trend", "increasing", "decreasing", "month over month", "mom"]):
-        bot_reply = get_mom_trend(df, exchange_rate, currency_symbol)
+        bot_reply = get_mom_trend(exchange_rate, currency_symbol)
 
     # 4. FULL AI FALLBACK
     if bot_reply is None:
@@ -941,21 +984,21 @@ with col1:
 
 with col2:
     if st.button("Total income?", use_container_width=True):
-        response = get_total_income(df, exchange_rate, currency_symbol)
+        response = get_total_income(exchange_rate, currency_symbol)
         st.session_state.messages.append({"role": "user", "content": "Total income?"})
         st.session_state.messages.append({"role": "model", "content": response})
         st.rerun()
 
 with col3:
     if st.button("What's my net balance?", use_container_width=True):
-        response = get_net_balance(df, exchange_rate, currency_symbol)
+        response = get_net_balance(exchange_rate, currency_symbol)
         st.session_state.messages.append({"role": "user", "content": "What's my balance?"})
         st.session_state.messages.append({"role": "model", "content": response})
         st.rerun()
 
 with col4:
     if st.button("Top expense category?", use_container_width=True):
-        response = get_top_expense_category(df, exchange_rate, currency_symbol)
+        response = get_top_expense_category(exchange_rate, currency_symbol)
         st.session_state.messages.append({"role": "user", "content": "Top expense category?"})
         st.session_state.messages.append({"role": "model", "content": response})
         st.rerun()
@@ -3,14 +3,16 @@
 
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-import sqlite3
 import requests
 import warnings
 import base64
-from database import init_db, add_transaction, get_last_n, format_display_df
+import threading
+import sqlite3
+from database import init_db, add_transaction, get_last_n, format_display_df, get_data_version, get_write_state
+from aggregation import DashboardBundle
+from figure_cache import cached_figure
 warnings.filterwarnings("ignore")
 
 # -------------------------------
@@ -125,9 +127,13 @@ def get_exchange_rate(base="MYR", target="MYR"):
 # ────────────────────────────────────────────────
 # TITLE & SUBTITLE
 # ────────────────────────────────────────────────
-# Load circular logo
-with open("logo_circle.png", "rb") as f:
-    logo_base64 = base64.b64encode(f.read()).decode()
+# Load circular logo (encoded once per process, not on every rerun)
+@st.cache_resource
+def load_logo_base64():
+    with open("logo_circle.png", "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+logo_base64 = load_logo_base64()
 
 # 🎯 MATCH THE BOTTOM HEADER EXACTLY — LARGE LOGO + TITLE + SUBTITLE TIGHTLY UNDER TITLE
 # 🎯 MATCH THE BOTTOM HEADER EXACTLY — LARGE LOGO + TITLE + SUBTITLE TIGHTLY UNDER TITLE
@@ -155,43 +161,38 @@ st.markdown(f"""
 st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
 
 # ────────────────────────────────────────────────
-# LOAD DATA FROM finance.db
+# LOAD DATA (GROUP BY queries inside SQLite, see database.aggregate)
 # ────────────────────────────────────────────────
-@st.cache_data(ttl=30)
-def load_data():
-    try:
-        conn = sqlite3.connect("finance.db")
-        query = """
-        SELECT 
-            date, 
-            amount, 
-            type, 
-            COALESCE(category, 'Uncategorized') AS category,
-            COALESCE(account, 'Unknown') AS account,
-            COALESCE(title, 'No Title') AS title 
-        FROM transactions 
-        WHERE date IS NOT NULL AND amount IS NOT NULL
-        """
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-
-        df['Date'] = pd.to_datetime(df['date'], errors='coerce')
-        df['Amount'] = pd.to_numeric(df['amount'], errors='coerce')
-        df['Type'] = df['type'].str.strip().str.upper()
-        df['Category'] = df['category'].str.strip().str.title()
-        df['Account'] = df['account'].str.strip().str.title()
-        df['Title'] = df['title'].str.strip()
-
-        df = df.dropna(subset=['Date', 'Amount', 'Type'])
-        df = df[df['Type'].isin(['INCOME', 'EXPENSE'])]
-        df['Net'] = np.where(df['Type'] == 'INCOME', df['Amount'], -df['Amount'])
-        return df
-    except Exception as e:
-        st.error(f"⚠️ Database error: {e}")
-        return pd.DataFrame()
-
-df = load_data()
-if df.empty:
+@st.cache_resource
+def bundle_cache():
+    # One bundle per process, in MYR; currency / view / slider only scale and slice it
+    return {'lock': threading.Lock(), 'version': None, 'state': None, 'bundle': None}
+
+def load_bundle(data_version):
+    # Rows appended since the last build are aggregated on their own and folded in; an edit or delete rebuilds
+    cache = bundle_cache()
+    with cache['lock']:
+        if cache['version'] != data_version:
+            epoch, rewrites, last_rowid = state = get_write_state()
+            seen = cache['state']
+            if seen is None or seen[:2] != (epoch, rewrites):
+                cache['bundle'] = DashboardBundle.from_database(rowid_range=(0, last_rowid))
+            elif last_rowid > seen[2]:
+                cache['bundle'] = cache['bundle'].merged(DashboardBundle.from_database(rowid_range=(seen[2], last_rowid)))
+            cache.update(version=data_version, state=state)
+        return cache['bundle']
+
+@st.cache_data(max_entries=1)
+def load_recent(data_version, n=15):
+    return get_last_n(n)
+
+data_version = get_data_version()
+try:
+    bundle = load_bundle(data_version)
+except sqlite3.Error as e:
+    st.error(f"⚠️ Database error: {e}")
+    st.stop()
+if bundle.type_totals.empty:
     st.info("No transactions found in the database.")
     st.stop()
 
@@ -234,15 +235,10 @@ if st.sidebar.button(" Logout", type="secondary"):
 exchange_rate = get_exchange_rate("MYR", selected_currency)
 currency_symbol = currency_symbol_map.get(selected_currency, selected_currency + " ")
 
-df['Amount'] = df['Amount'] * exchange_rate
-df['Net'] = df['Net'] * exchange_rate
-
 # ────────────────────────────────────────────────
 # METRICS (KPIs)
 # ────────────────────────────────────────────────
-total_income = df[df['Type'] == 'INCOME']['Amount'].sum()
-total_expense = df[df['Type'] == 'EXPENSE']['Amount'].sum()
-net_balance = total_income - total_expense
+total_income, total_expense, net_balance = bundle.totals(exchange_rate)
 
 col1, col2, col3 = st.columns(3)
 col1.metric("📈 Total Income", f"{currency_symbol} {total_income:,.0f}")
@@ -259,10 +255,7 @@ st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
 # ────────────────────────────────────────────────
 # 1. INCOME vs EXPENSE – DONUT CHART
 # ────────────────────────────────────────────────
-st.subheader("💸 Income vs Expense")
-if total_income == 0 and total_expense == 0:
-    st.info("No income or expense data available.")
-else:
+def build_donut(total_income, total_expense, currency_symbol):
     pie_data = pd.DataFrame({
         'Type': ['Income', 'Expense'],
         'Amount': [total_income, total_expense]
@@ -287,6 +280,14 @@ else:
         margin=dict(t=60, b=60),
         height=400
     )
+    return fig_pie
+
+st.subheader("💸 Income vs Expense")
+if total_income == 0 and total_expense == 0:
+    st.info("No income or expense data available.")
+else:
+    fig_pie = cached_figure((data_version, "donut", selected_currency, exchange_rate),
+                            lambda: build_donut(total_income, total_expense, currency_symbol))
     st.plotly_chart(fig_pie, use_container_width=True, config={'displayModeBar': True})
 
 st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
@@ -294,37 +295,7 @@ st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
 # ────────────────────────────────────────────────
 # 2. EXPENSE BY CATEGORY (FULL WIDTH BELOW)
 # ────────────────────────────────────────────────
-st.subheader("📊 Expense by Category")
-
-exp_df = df[df['Type'] == 'EXPENSE'].copy()
-if exp_df.empty:
-    st.info("No expense data available.")
-else:
-    col_title, col_radio = st.columns([2, 1])
-    with col_radio:
-        view_option = st.radio(
-            "",
-            options=["Monthly", "Yearly"],
-            index=0,
-            horizontal=True,
-            key="view_by"
-        )
-
-    if view_option == "Monthly":
-        grouped = exp_df.groupby([exp_df['Date'].dt.to_period('M'), 'Category'])['Amount'].sum().unstack(fill_value=0)
-        grouped.index = grouped.index.to_timestamp()
-        title = "Top Expense Categories (Monthly)"
-        xaxis_title = "Month"
-    else:  # Yearly
-        exp_df['Year'] = exp_df['Date'].dt.year
-        grouped = exp_df.groupby(['Year', 'Category'])['Amount'].sum().unstack(fill_value=0)
-        grouped.index = grouped.index.astype(int)
-        title = "Top Expense Categories (Yearly)"
-        xaxis_title = "Year"
-
-    top_cats = grouped.sum().sort_values(ascending=False).head(max_categories).index
-    data_plot = grouped[top_cats]
-
+def build_category_bars(data_plot, title, xaxis_title, currency_symbol):
     fig_stack = go.Figure()
     colors = px.colors.qualitative.Pastel[:len(data_plot.columns)]
     for i, col in enumerate(data_plot.columns):
@@ -346,22 +317,47 @@ else:
         margin=dict(t=40, b=40, l=40, r=20),
         font=dict(size=12)
     )
+    return fig_stack
+
+# The Monthly / Yearly radio reruns only this fragment; the bundle and rate come from the last page run
+@st.fragment
+def expense_by_category(bundle, data_version, max_categories, selected_currency, exchange_rate, currency_symbol):
+    if not bundle.category_views:
+        st.info("No expense data available.")
+        return
+
+    col_title, col_radio = st.columns([2, 1])
+    with col_radio:
+        view_option = st.radio(
+            "",
+            options=["Monthly", "Yearly"],
+            index=0,
+            horizontal=True,
+            key="view_by"
+        )
+
+    data_plot = bundle.categories(view_option, max_categories, exchange_rate)
+    if view_option == "Monthly":
+        title = "Top Expense Categories (Monthly)"
+        xaxis_title = "Month"
+    else:  # Yearly
+        title = "Top Expense Categories (Yearly)"
+        xaxis_title = "Year"
+
+    fig_stack = cached_figure(
+        (data_version, "expense_by_category", selected_currency, exchange_rate, max_categories, view_option),
+        lambda: build_category_bars(data_plot, title, xaxis_title, currency_symbol))
     st.plotly_chart(fig_stack, use_container_width=True, config={'scrollZoom': False})
 
+st.subheader("📊 Expense by Category")
+expense_by_category(bundle, data_version, max_categories, selected_currency, exchange_rate, currency_symbol)
+
 st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
 
 # ────────────────────────────────────────────────
 # 3. INCOME vs EXPENSE BY PAYMENT METHOD (ACCOUNT)
 # ────────────────────────────────────────────────
-st.subheader("💳 Income vs Expense by Payment Method")
-
-account_flow = df.groupby(['Account', 'Type'])['Amount'].sum().unstack(fill_value=0)
-account_flow['Income'] = account_flow.get('INCOME', 0)
-account_flow['Expense'] = account_flow.get('EXPENSE', 0)
-account_flow['Total'] = account_flow['Income'] + account_flow['Expense']
-account_flow = account_flow.sort_values('Total', ascending=True).tail(max_categories)
-
-if not account_flow.empty:
+def build_account_flow(account_flow, currency_symbol):
     fig_hbar = go.Figure()
     fig_hbar.add_trace(go.Bar(
         y=account_flow.index,
@@ -387,6 +383,15 @@ if not account_flow.empty:
         hovermode="y unified",
         margin=dict(l=150, r=50, t=50, b=50)
     )
+    return fig_hbar
+
+st.subheader("💳 Income vs Expense by Payment Method")
+
+account_flow = bundle.accounts(max_categories, exchange_rate)
+
+if not account_flow.empty:
+    fig_hbar = cached_figure((data_version, "account_flow", selected_currency, exchange_rate, max_categories),
+                             lambda: build_account_flow(account_flow, currency_symbol))
     st.plotly_chart(fig_hbar, use_container_width=True)
 else:
     st.info("No account data available.")
@@ -398,7 +403,7 @@ st.markdown("<hr class='section-divider'>", unsafe_allow_html=True)
 # ────────────────────────────────────────────────
 st.subheader("📋 Recent Transactions")
 
-df_raw = get_last_n(15)
+df_raw = load_recent(data_version)
 if not df_raw.empty:
     # Make a copy to avoid modifying original data
     df_for_display = df_raw.copy()
@@ -1,9 +1,11 @@
 # pages/manage_records.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import date
-from sqlalchemy import update
-from database import init_db, get_transactions_df, Transaction, SessionLocal
+from sqlalchemy import delete, update
+from database import init_db, get_data_version, Transaction, SessionLocal
+from data_access import load_invalid_transactions, load_transactions
 import requests
 
 # -------------------------------
@@ -46,11 +48,6 @@ if not st.session_state.get("logged_in"):
         st.switch_page("app.py")
     st.stop()
 
-# Auto-refresh when coming back from Add Transaction page
-if st.session_state.get("new_transaction_added"):
-    st.session_state.refresh_now = True
-    st.session_state.new_transaction_added = False
-
 # -------------------------------
 # Read selected display currency
 # -------------------------------
@@ -217,32 +214,19 @@ with header_container:
 # -------------------------------
 # Optimized Data Loading with Caching
 # -------------------------------
-@st.cache_data(ttl=3600, show_spinner=False)
-def load_and_convert_data(selected_currency: str, _buster: int = 0):
-    df = get_transactions_df()
-    if df.empty:
-        return df
-    rate = get_exchange_rate("MYR", selected_currency)
-    df['display_amount'] = df['amount'] * rate
-    df['Type_Display'] = df['type'].map({'INCOME': 'Income', 'EXPENSE': 'Expense'})
-    return df.copy()
-
-# CRITICAL: Clear ALL caches and force refresh
-if st.session_state.get("refresh_now"):
-    st.cache_data.clear()
-    if "filtered_df" in st.session_state:
-        del st.session_state.filtered_df
-    st.session_state.refresh_now = False
-
-cache_buster = st.session_state.get("cache_buster", 0)
-if st.session_state.get("force_refresh"):
-    cache_buster += 1
-    st.session_state.cache_buster = cache_buster
-    st.session_state.force_refresh = False
-
-df_full = load_and_convert_data(selected_display_currency, cache_buster)
-
-if df_full.empty:
+# Shared read-only frame (data_access.py) under the column names this page
+# uses; amounts stay in MYR and are converted for the visible rows only
+RECORD_COLUMNS = {'id': 'id', 'Date': 'date', 'Title': 'title', 'Category': 'category', 'Account': 'account',
+                  'Amount': 'amount', 'Currency': 'currency', 'Type': 'type'}
+
+# Keyed by the data version: any add / edit / delete (from any page) reloads it
+data_version = get_data_version()
+df_full = load_transactions(data_version)
+df_full.columns = [RECORD_COLUMNS.get(c, c) for c in df_full.columns]  # renames this view only
+# Rows the shared frame leaves out (no valid date / amount, or another type), as stored
+df_invalid = load_invalid_transactions(data_version)
+
+if df_full.empty and df_invalid.empty:
     st.info("No records found. Add your first transaction!")
     st.stop()
     
@@ -261,6 +245,46 @@ def parse_amount(amount_str):
     except ValueError:
         raise ValueError("Invalid amount. Please enter a number (e.g., 100 or 1,234.50).")
 
+def find_record(record_id):
+    """The record to edit: from the table, else the invalid row with unparseable fields left empty."""
+    match = df_full[df_full['id'] == record_id]
+    if len(match):
+        return match.iloc[0]
+    row = df_invalid[df_invalid['id'] == record_id].iloc[0]
+    return pd.Series({
+        'id': row['id'],
+        'title': row['title'] if isinstance(row['title'], str) else "",
+        'category': row['category'],
+        'account': row['account'],
+        'amount': pd.to_numeric(row['amount'], errors='coerce'),
+        'currency': row['currency'],
+        'type': str(row['type']).strip().upper(),
+        'date': pd.to_datetime(row['date'], errors='coerce', format='mixed'),
+    })
+
+# -------------------------------
+# Invalid Records
+# -------------------------------
+# These rows count in no table or total; list them so they can be fixed or deleted
+if len(df_invalid):
+    with st.expander(f"⚠️ {len(df_invalid)} invalid record(s) hidden from the table below", expanded=df_full.empty):
+        st.caption("No valid date or amount, or a type other than Income / Expense. "
+                   "Fix or delete them to bring the records and totals back in line.")
+        st.dataframe(df_invalid[['date', 'title', 'category', 'account', 'amount', 'currency', 'type']].astype('string'),
+                     hide_index=True, use_container_width=True)
+        invalid_labels = {row.id: f"{row.title or 'No Title'} | date: {row.date or '-'} | amount: {row.amount or '-'} | type: {row.type or '-'}"
+                          for row in df_invalid.itertuples()}
+        invalid_id = st.selectbox("Record", options=list(invalid_labels), format_func=invalid_labels.get)
+        col_fix, col_remove = st.columns(2)
+        with col_fix:
+            if st.button("✏️ Fix", key="fix_invalid", use_container_width=True):
+                st.session_state.edit_id = invalid_id
+                st.rerun()
+        with col_remove:
+            if st.button("🗑️ Delete", key="del_invalid", use_container_width=True):
+                st.session_state.confirm_delete_id = invalid_id
+                st.rerun()
+
 # -------------------------------
 # FILTER LOGIC (only re-run when filters change)
 # -------------------------------
@@ -286,7 +310,7 @@ with st.expander("Show Filters", expanded=False):
     with col4:
         currency_filter = st.multiselect("Original Currency", options=sorted(df_full['currency'].dropna().unique()))
     with col5:
-        min_date = st.date_input("From Date", value=df_full['date'].min().date())
+        min_date = st.date_input("From Date", value=df_full['date'].min().date() if len(df_full) else date.today())
     with col6:
         max_date = st.date_input("To Date", value=date.today())
 
@@ -296,48 +320,138 @@ with st.expander("Show Filters", expanded=False):
         "account": tuple(account_filter),
         "currency": tuple(currency_filter),
         "min_date": min_date,
-        "max_date": max_date
+        "max_date": max_date,
+        "data_version": data_version,
+        "display_currency": selected_display_currency,
     }
 
     if st.session_state[filter_key] != current_filters:
         st.session_state[filter_key] = current_filters
-        st.session_state.filtered_df = None
+        st.session_state.filtered_rows = None
 
-# Apply filters (cached per filter state)
-if st.session_state.get("filtered_df") is None:
-    df = df_full.copy()
-    
+# Apply filters (cached per filter state as row positions, newest first — no frame copies)
+if st.session_state.get("filtered_rows") is None:
+    keep = np.ones(len(df_full), dtype=bool)
     if search_query:
-        mask = (
-            df['title'].str.contains(search_query, case=False, na=False) |
-            df['category'].str.contains(search_query, case=False, na=False)
-        )
-        df = df[mask]
+        keep &= (
+            df_full['title'].str.contains(search_query, case=False, na=False) |
+            df_full['category'].str.contains(search_query, case=False, na=False)
+        ).to_numpy()
     if type_filter:
-        df = df[df['type'].isin(type_filter)]
+        keep &= df_full['type'].isin(type_filter).to_numpy()
     if account_filter:
-        df = df[df['account'].isin(account_filter)]
+        keep &= df_full['account'].isin(account_filter).to_numpy()
     if currency_filter:
-        df = df[df['currency'].isin(currency_filter)]
-    df = df[
-        (df['date'].dt.date >= min_date) &
-        (df['date'].dt.date <= max_date)
-    ].sort_values('date', ascending=False).reset_index(drop=True)
+        keep &= df_full['currency'].isin(currency_filter).to_numpy()
+    days = df_full['date'].dt.date
+    keep &= ((days >= min_date) & (days <= max_date)).to_numpy()
+
+    rows = np.flatnonzero(keep)
+    st.session_state.filtered_rows = rows[np.argsort(df_full['date'].to_numpy()[rows], kind='stable')[::-1]]
+
+filtered_rows = st.session_state.filtered_rows
+st.markdown(f"### Showing **{len(filtered_rows)}** of **{len(df_full)}** records")
+
+# -------------------------------
+# Records Table (fragment)
+# -------------------------------
+def change_page(step):
+    # on_click runs before the rerun, so paging needs no st.rerun() of the whole page
+    st.session_state.current_page += step
+
+# Paging reruns only this fragment; edit / delete still rerun the page to show their forms
+@st.fragment
+def records_table(df_full, filtered_rows, exchange_rate, display_symbol, display_currency):
+    # Pagination setup
+    PAGE_SIZE = 20
+    total_pages = max(1, (len(filtered_rows) - 1) // PAGE_SIZE + 1)
     
-    st.session_state.filtered_df = df
+    if "current_page" not in st.session_state:
+        st.session_state.current_page = 1
 
-df_filtered = st.session_state.filtered_df
-st.markdown(f"### Showing **{len(df_filtered)}** of **{len(df_full)}** records")
+    # -------------------------------
+    # BEAUTIFUL PAGINATION DESIGN
+    # -------------------------------
+    st.markdown("<br>", unsafe_allow_html=True)
 
-if df_filtered.empty:
-    st.warning("No records match your filters.")
-    st.stop()
+    pagination_cols = st.columns([1, 3, 1])
+
+    with pagination_cols[0]:
+        if st.session_state.current_page > 1:
+            st.button("← Previous", key="prev_page", use_container_width=True, on_click=change_page, args=(-1,))
+        else:
+            st.button("← Previous", disabled=True, use_container_width=True)
+
+    with pagination_cols[1]:
+        # Centered page indicator
+        st.markdown(
+            f"""
+            <div style="
+                display: flex;
+                justify-content: center;
+                align-items: center;
+                background: #f8f9fa;
+                border-radius: 8px;
+                padding: 8px 16px;
+                font-weight: 600;
+                color: #4a5568;
+                border: 1px solid #e2e8f0;
+                font-size: 0.9em;
+            ">
+                Page <span style="color: #d81b60; margin: 0 4px;">{st.session_state.current_page}</span> of {total_pages}
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+    with pagination_cols[2]:
+        if st.session_state.current_page < total_pages:
+            st.button("Next →", key="next_page", use_container_width=True, on_click=change_page, args=(1,))
+        else:
+            st.button("Next →", disabled=True, use_container_width=True)
+
+    # Get current page data
+    start_idx = (st.session_state.current_page - 1) * PAGE_SIZE
+    end_idx = start_idx + PAGE_SIZE
+    page_df = df_full.iloc[filtered_rows[start_idx:end_idx]]
+
+    # Display table header
+    header_cols = st.columns([2.2, 1.5, 1.3, 1.2, 1.2, 1.0, 0.8])
+    header_cols[0].markdown("**Title**")
+    header_cols[1].markdown(f"**Amount ({display_currency})**")
+    header_cols[2].markdown("**Category**")
+    header_cols[3].markdown("**Account**")
+    header_cols[4].markdown("**Type**")
+    header_cols[5].markdown("**Date**")
+    header_cols[6].markdown("**Actions**")
+    st.divider()
+
+    # Display only current page rows
+    for _, row in page_df.iterrows():
+        cols = st.columns([2.2, 1.5, 1.3, 1.2, 1.2, 1.0, 0.8])
+        cols[0].write(row['title'])
+        cols[1].write(f"{display_symbol} {row['amount'] * exchange_rate:,.2f}")
+        cols[2].write(row['category'])
+        cols[3].write(row['account'])
+        cols[4].write(row['type'].title())
+        cols[5].write(row['date'].strftime('%Y-%m-%d'))
+        
+        with cols[6]:
+            col_edit, col_del = st.columns(2)
+            with col_edit:
+                if st.button("✏️", key=f"edit_{row['id']}", help="Edit", use_container_width=True):
+                    st.session_state.edit_id = row['id']
+                    st.rerun()
+            with col_del:
+                if st.button("🗑️", key=f"del_{row['id']}", help="Delete", use_container_width=True):
+                    st.session_state.confirm_delete_id = row['id']
+                    st.rerun()
 
 # -------------------------------
 # Edit Mode
 # -------------------------------
 if st.session_state.get('edit_id'):
-    edit_row = df_full[df_full['id'] == st.session_state.edit_id].iloc[0]
+    edit_row = find_record(st.session_state.edit_id)
     st.markdown("### Edit Transaction")
     
     with st.form("edit_form"):
@@ -355,14 +469,14 @@ if st.session_state.get('edit_id'):
                 index=ACCOUNTS.index(edit_row['account']) if edit_row['account'] in ACCOUNTS else 2
             )
         with col_b:
-            amount_input = st.text_input("Amount (in MYR)", value=f"{edit_row['amount']:,.2f}")
+            amount_input = st.text_input("Amount (in MYR)", value=f"{edit_row['amount']:,.2f}" if pd.notna(edit_row['amount']) else "")
             currency = st.selectbox(
                 "Original Currency",
                 options=CURRENCIES,
                 index=CURRENCIES.index(edit_row['currency']) if edit_row['currency'] in CURRENCIES else 0
             )
-            trans_type = st.radio("Type", ["Expense", "Income"], index=0 if edit_row['type'] == 'EXPENSE' else 1)
-            trans_date = st.date_input("Date", value=edit_row['date'].date())
+            trans_type = st.radio("Type", ["Expense", "Income"], index=1 if edit_row['type'] == 'INCOME' else 0)
+            trans_date = st.date_input("Date", value=edit_row['date'].date() if pd.notna(edit_row['date']) else date.today())
 
         col1, col2 = st.columns(2)
         with col1:
@@ -387,11 +501,6 @@ if st.session_state.get('edit_id'):
                         )
                     )
                     session.commit()
-            
-                    st.cache_data.clear()
-                    st.session_state.refresh_now = True
-                    if "filtered_df" in st.session_state:
-                        del st.session_state.filtered_df
 
                     st.success("✅ Updated successfully!")
                     st.session_state.edit_id = None
@@ -417,14 +526,10 @@ elif 'confirm_delete_id' in st.session_state:
         if st.button("✅ Yes, Delete", type="primary", use_container_width=True):
             session = SessionLocal()
             try:
-                trans = session.query(Transaction).filter(Transaction.id == st.session_state.confirm_delete_id).first()
-                if trans:
-                    session.delete(trans)
+                # A statement, not an ORM load: invalid rows (e.g. amount 'abc') cannot be loaded
+                result = session.execute(delete(Transaction).where(Transaction.id == st.session_state.confirm_delete_id))
+                if result.rowcount:
                     session.commit()
-                    st.cache_data.clear()
-                    st.session_state.refresh_now = True
-                    if "filtered_df" in st.session_state:
-                        del st.session_state.filtered_df
 
                     st.success("✅ Deleted successfully!")
                     
@@ -443,95 +548,10 @@ elif 'confirm_delete_id' in st.session_state:
 # -------------------------------
 # Display Records — WITH BEAUTIFUL PAGINATION
 # -------------------------------
+elif len(filtered_rows) == 0:
+    st.warning("No records match your filters.")
 else:
-    # Pagination setup
-    PAGE_SIZE = 20
-    total_pages = max(1, (len(df_filtered) - 1) // PAGE_SIZE + 1)
-    
-    if "current_page" not in st.session_state:
-        st.session_state.current_page = 1
-
-    # -------------------------------
-    # BEAUTIFUL PAGINATION DESIGN
-    # -------------------------------
-    st.markdown("<br>", unsafe_allow_html=True)
-
-    pagination_cols = st.columns([1, 3, 1])
-
-    with pagination_cols[0]:
-        if st.session_state.current_page > 1:
-            if st.button("← Previous", key="prev_page", use_container_width=True):
-                st.session_state.current_page -= 1
-                st.rerun()
-        else:
-            st.button("← Previous", disabled=True, use_container_width=True)
-
-    with pagination_cols[1]:
-        # Centered page indicator
-        st.markdown(
-            f"""
-            <div style="
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                background: #f8f9fa;
-                border-radius: 8px;
-                padding: 8px 16px;
-                font-weight: 600;
-                color: #4a5568;
-                border: 1px solid #e2e8f0;
-                font-size: 0.9em;
-            ">
-                Page <span style="color: #d81b60; margin: 0 4px;">{st.session_state.current_page}</span> of {total_pages}
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-
-    with pagination_cols[2]:
-        if st.session_state.current_page < total_pages:
-            if st.button("Next →", key="next_page", use_container_width=True):
-                st.session_state.current_page += 1
-                st.rerun()
-        else:
-            st.button("Next →", disabled=True, use_container_width=True)
-
-    # Get current page data
-    start_idx = (st.session_state.current_page - 1) * PAGE_SIZE
-    end_idx = start_idx + PAGE_SIZE
-    page_df = df_filtered.iloc[start_idx:end_idx]
-
-    # Display table header
-    header_cols = st.columns([2.2, 1.5, 1.3, 1.2, 1.2, 1.0, 0.8])
-    header_cols[0].markdown("**Title**")
-    header_cols[1].markdown(f"**Amount ({selected_display_currency})**")
-    header_cols[2].markdown("**Category**")
-    header_cols[3].markdown("**Account**")
-    header_cols[4].markdown("**Type**")
-    header_cols[5].markdown("**Date**")
-    header_cols[6].markdown("**Actions**")
-    st.divider()
-
-    # Display only current page rows
-    for _, row in page_df.iterrows():
-        cols = st.columns([2.2, 1.5, 1.3, 1.2, 1.2, 1.0, 0.8])
-        cols[0].write(row['title'])
-        cols[1].write(f"{display_symbol} {row['display_amount']:,.2f}")
-        cols[2].write(row['category'])
-        cols[3].write(row['account'])
-        cols[4].write(row['Type_Display'])
-        cols[5].write(row['date'].strftime('%Y-%m-%d'))
-        
-        with cols[6]:
-            col_edit, col_del = st.columns(2)
-            with col_edit:
-                if st.button("✏️", key=f"edit_{row['id']}", help="Edit", use_container_width=True):
-                    st.session_state.edit_id = row['id']
-                    st.rerun()
-            with col_del:
-                if st.button("🗑️", key=f"del_{row['id']}", help="Delete", use_container_width=True):
-                    st.session_state.confirm_delete_id = row['id']
-                    st.rerun()
+    records_table(df_full, filtered_rows, exchange_rate, display_symbol, selected_display_currency)
 
 # -------------------------------
 # Footer
@@ -4,11 +4,14 @@ import sqlite3
 import subprocess
 import sys
 import io
-import os
 import zipfile
 import requests
 import time
 from datetime import datetime, timedelta
+from database import DB_PATH, get_data_version
+from data_access import get_forecast_worker, load_forecast_cube, load_transactions, read_raw_transactions
+from forecast_engine import HORIZONS, fit_targets
+from forecast_store import unfinished_targets
 
 # -------------------------------
 # Shared Currency Configuration (SAME AS TREND PAGE)
@@ -122,7 +125,7 @@ st.markdown("""
 def get_all_users():
     """Get all users from database"""
     try:
-        conn = sqlite3.connect("finance.db")
+        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute('SELECT id, username, email, role, created_at FROM users ORDER BY created_at DESC')
         users = cursor.fetchall()
@@ -135,7 +138,7 @@ def get_all_users():
 def delete_user_by_email(email):
     """Delete user by email (transactions remain in database)"""
     try:
-        conn = sqlite3.connect("finance.db")
+        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
         # Just delete the user - leave transactions as-is
@@ -159,7 +162,7 @@ def create_user(username, email, password, role='user'):
         import hashlib
         password_hash = hashlib.sha256(password.encode()).hexdigest()
         
-        conn = sqlite3.connect("finance.db")
+        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO users (username, email, password_hash, role)
@@ -194,27 +197,21 @@ with header_container:
         st.write("")
 
 # -------------------------------
-# Load Data Function (Currency-Aware)
+# Forecast ZIP Builder (cached by data version + currency)
 # -------------------------------
-@st.cache_data(ttl=300)
-def load_data_with_currency(exchange_rate, user_id=None):
-    try:
-        conn = sqlite3.connect("finance.db")
-        if user_id:
-            df = pd.read_sql_query("SELECT * FROM transactions WHERE user_id = ?", conn, params=(user_id,))
-        else:
-            df = pd.read_sql_query("SELECT * FROM transactions", conn)
-        conn.close()
-        # Convert to display currency
-        df['Amount_Display'] = pd.to_numeric(df['amount'], errors='coerce') * exchange_rate
-        return df
-    except Exception as e:
-        st.error(f"Database error: {e}")
-        return pd.DataFrame()
-
-# Load data for current user
-user_id = st.session_state.get("user_id")
-df = load_data_with_currency(exchange_rate, user_id)
+# Fits never run in this script thread: missing forecasts are queued on the
+# background worker (forecast_worker.py), a fragment polls until all are stored
+# and the ZIP is then built from them and the shared frame (data_access.py).
+@st.cache_data(show_spinner="Building ZIP ...", max_entries=8)
+def build_forecast_zip_cached(selected_currency, data_version):
+    from financial_income_category_forecast import run_forecast, build_forecast_zip
+    # Reads the shared forecasts table only (fit_missing=False), so call it once every target is finished.
+    # No next-transaction models (the report skips that section): training them would block the download
+    results = run_forecast(currency=selected_currency, plots=False, ml=False, output_format="none",
+                           df=load_transactions(data_version), store_version=data_version, fit_missing=False)
+    return build_forecast_zip(results)
+
+data_version = get_data_version()
 
 # -------------------------------
 # SIDEBAR NAVIGATION (Role-based)
@@ -270,19 +267,19 @@ elif section == "Data":
     
     # Export transactions in DISPLAY CURRENCY
     if st.button("Export All Transactions (CSV)", type="primary"):
-        if not df.empty:
-            # Make a copy to avoid side effects
-            export_df = df.copy()
-            
-            # Replace the 'amount' column with the currency-converted values
-            export_df['amount'] = export_df['Amount_Display']
+        # The table as stored (a faithful backup, invalid rows included); only amounts are converted
+        try:
+            export_df = read_raw_transactions(DB_PATH)
+        except (sqlite3.Error, pd.errors.DatabaseError) as e:
+            st.error(f"Database error: {e}")
+            export_df = pd.DataFrame()
+        if not export_df.empty:
+            amounts = pd.to_numeric(export_df['amount'], errors='coerce')
+            export_df['amount'] = (amounts * exchange_rate).where(amounts.notna(), export_df['amount'])
 
             # Update the 'currency' column to reflect the display currency
             export_df['currency'] = selected_currency
             
-            # Remove the helper column 'Amount_Display' (not needed in export)
-            export_df = export_df.drop(columns=['Amount_Display'], errors='ignore')
-            
             # Export ALL columns (no selection — full DataFrame)
             csv = export_df.to_csv(index=False).encode('utf-8')
             st.download_button(
@@ -295,20 +292,48 @@ elif section == "Data":
         else:
             st.warning("No data to export.")
     
-    # Export forecasts 
+    # Export forecasts (built on demand from the current data, cached per data version + currency)
     if st.button("Export All Forecasts (ZIP)", type="primary"):
-        zip_filename = f"forecasts_{selected_currency}.zip"
-        zip_path = os.path.join("forecast_zips", zip_filename)
+        st.session_state.forecast_zip_requested = True
 
-        if not os.path.exists(zip_path):
-            st.error(f"❌ Forecast ZIP for {selected_currency} not found.")
-            st.caption("Make sure `forecast_zips/` is in your repo with all currency ZIPs.")
-            st.stop()
+    if st.session_state.get("forecast_zip_requested"):
+        zip_filename = f"forecasts_{selected_currency}.zip"
+        worker = get_forecast_worker()
+        targets = {h: fit_targets(load_forecast_cube(data_version), h) for h in HORIZONS}
+        n_targets = sum(len(t) for t in targets.values())
+
+        def waiting():
+            return sum(len(unfinished_targets(data_version, h, t)) for h, t in targets.items())
+
+        if not n_targets:
+            st.warning("No data to forecast.")
+        elif waiting():
+            worker.prefetch(data_version, targets)
+
+            # Polls the forecasts table; the full rerun once all are in shows the download
+            @st.fragment(run_every=1)
+            def wait_for_forecasts():
+                left = waiting()
+                if not left:
+                    st.rerun()
+                st.progress((n_targets - left) / n_targets,
+                            text=f"⏳ Computing forecasts in the background ({n_targets - left}/{n_targets} ready) "
+                                 "— the download appears when they are done")
+
+            wait_for_forecasts()
+        else:
+            failed = worker.progress(data_version).get('failed', 0)
+            if failed:
+                st.warning(f"⚠️ {failed} forecasts failed; their categories are left out of the totals.")
+            try:
+                zip_bytes = build_forecast_zip_cached(selected_currency, data_version)
+            except (sqlite3.Error, pd.errors.DatabaseError, ValueError) as e:
+                st.error(f"❌ Could not build forecasts for {selected_currency}: {e}")
+                st.stop()
 
-        with open(zip_path, "rb") as f:
             st.download_button(
                 label="📥 Download ZIP",
-                data=f,
+                data=zip_bytes,
                 file_name=zip_filename,
                 mime="application/zip",
                 key=f"download_forecast_zip_{selected_currency}"
@@ -326,7 +351,7 @@ elif section == "Account":
     # Auto-fetch real email if session lost it
     if "email" not in st.session_state or st.session_state.email in ["user@example.com", "", None]:
         try:
-            conn = sqlite3.connect("finance.db")
+            conn = sqlite3.connect(DB_PATH)
             c = conn.cursor()
             c.execute("SELECT email FROM users WHERE username = ?", (st.session_state.username,))
             result = c.fetchone()
@@ -367,7 +392,7 @@ elif section == "Account":
                 else:
                     try:
                         import hashlib
-                        conn = sqlite3.connect("finance.db")
+                        conn = sqlite3.connect(DB_PATH)
                         c = conn.cursor()
                         
                         # Use username instead of user_id — 100% safe & working
@@ -488,7 +513,7 @@ elif section == "Admin" and user_role == "admin":
     if "delete_verified" in st.session_state and st.session_state.delete_verified == admin_delete_email:
         # Verify user exists
         try:
-            conn = sqlite3.connect("finance.db")
+            conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
             cursor.execute('SELECT username, role FROM users WHERE email = ?', (admin_delete_email,))
             user_info = cursor.fetchone()
@@ -5,11 +5,18 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
-import sqlite3
 import os
 import requests
 from datetime import datetime
-from prophet import Prophet
+import analytics
+from database import DB_PATH, get_data_version
+from forecast_engine import (HORIZONS, TOTAL_CATEGORIES, forecast_dates,
+                             list_forecast_targets, fit_targets, required_targets, format_forecast)
+from forecast_store import get_forecast, get_reconciled, latest_forecast
+from aggregation import AggregationEngine
+from data_access import get_forecast_worker, load_forecast_cube, load_transactions
+from figure_cache import cached_figure
+from downsample import CHART_POINT_BUDGET, lttb, rebucket
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -119,89 +126,25 @@ with col_title:
 # -------------------------------
 # DATA LOADING (WITH CURRENCY AWARENESS)
 # -------------------------------
-@st.cache_data(ttl=3600, show_spinner="Running AI model ...")
-def get_forecast_with_history(selected_currency="MYR"):
-    exchange_rate = get_exchange_rate("MYR", selected_currency)
-    conn = sqlite3.connect("finance.db")
-    df = pd.read_sql_query("SELECT date, amount, type, category FROM transactions", conn)
-    conn.close()
-
-    df['Date'] = pd.to_datetime(df['date'], errors='coerce')
-    df['Amount'] = pd.to_numeric(df['amount'], errors='coerce') * exchange_rate
-    df['Type'] = df['type'].str.strip().str.upper()
-    df['Category'] = df['category'].str.strip().str.title()
-    df = df.dropna(subset=['Date', 'Amount', 'Type', 'Category'])
-    df = df[df['Type'].isin(['INCOME', 'EXPENSE'])]
-
-    HORIZONS = {
-        "4 Days": (4, 'D'), "4 Weeks": (4, 'W'),
-        "2 Months": (2, 'M'), "4 Months": (4, 'M'), "1 Year": (12, 'M')
-    }
-
-    results = {}
-    for label, (periods, freq) in HORIZONS.items():
-        for typ in ['INCOME', 'EXPENSE']:
-            data = df[df['Type'] == typ].copy()
-            data['Period'] = data['Date'].dt.to_period(freq).dt.to_timestamp()
-
-            if typ == 'INCOME':
-                cats = ['Total Income'] + sorted(data['Category'].unique())
-            else:
-                cats = sorted(data['Category'].unique())
-
-            for cat in cats:
-                if cat == 'Total Income':
-                    series = data.groupby('Period')['Amount'].sum()
-                else:
-                    series = data[data['Category'] == cat].groupby('Period')['Amount'].sum()
-
-                hist_df = series.reset_index()
-                hist_df.columns = ['ds', 'y']
-                hist_df = hist_df.sort_values('ds')
-
-                if len(hist_df) < 3:
-                    continue
-
-                m = Prophet(yearly_seasonality=(freq in ['D','W']), weekly_seasonality=(freq=='D'),
-                            seasonality_mode='additive', interval_width=0.8)
-                m.fit(hist_df)
-
-                future = m.make_future_dataframe(periods=periods, freq=freq)
-                forecast = m.predict(future)
-                pred = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(periods).copy()
-
-                last_4_actual = hist_df.tail(4).copy()
-
-                pred['ds'] = pred['ds'].dt.strftime('%Y-%m-%d' if freq in ['D','W'] else '%b %Y')
-                last_4_actual['ds'] = last_4_actual['ds'].dt.strftime('%Y-%m-%d' if freq in ['D','W'] else '%b %Y')
-
-                key = f"{label}_{typ}_{cat}"
-                results[key] = {
-                    'forecast': pred.round(0),
-                    'history': last_4_actual.round(0),
-                    'last_actual_total': hist_df['y'].iloc[-periods:].sum() if len(hist_df) >= periods else hist_df['y'].sum(),
-                    'category': cat
-                }
-    return results
-
-@st.cache_data(ttl=3600)
-def load_raw_transactions(selected_currency="MYR"):
-    exchange_rate = get_exchange_rate("MYR", selected_currency)
-    conn = sqlite3.connect("finance.db")
-    df = pd.read_sql_query("SELECT date, amount, type, category FROM transactions", conn)
-    conn.close()
-    
-    df['Date'] = pd.to_datetime(df['date'], errors='coerce')
-    df['Amount'] = pd.to_numeric(df['amount'], errors='coerce') * exchange_rate
-    df['Type'] = df['type'].str.strip().str.upper()
-    df['Category'] = df['category'].str.strip().str.title()
-    df = df.dropna(subset=['Date', 'Amount', 'Type', 'Category'])
-    df = df[df['Type'].isin(['INCOME', 'EXPENSE'])]
-    return df
+# Transactions are cached in base currency (MYR); forecasts are fitted in MYR
+# and scaled to the display currency at render time (Prophet is scale-invariant).
+# With DuckDB installed (analytics.py) the cube and the monthly history are
+# grouped inside DuckDB instead of from the shared frame — always over the live
+# database (never an ANALYTICS_SOURCE snapshot), since the caches are keyed on its version.
+# The cube and the worker are shared with the other pages (data_access.py).
+@st.cache_resource(max_entries=1)
+def load_forecast_engine(data_version):
+    return AggregationEngine(load_transactions(data_version))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_history(data_version, freq, cutoff, **filters):
+    # Daily / monthly sums since cutoff (MYR), one DuckDB query per target and period
+    return analytics.group_sum(freq, start=cutoff, source=DB_PATH, **filters)
 
-# Load data — PASS CURRENCY TO CACHE KEY
-data = get_forecast_with_history(selected_currency=selected_currency)
-data_source = load_raw_transactions(selected_currency=selected_currency)
+data_version = get_data_version()
+cube = load_forecast_cube(data_version)
+engine = None if analytics.available() else load_forecast_engine(data_version)
+worker = get_forecast_worker()
 
 # -------------------------------
 # Forecast Selector
@@ -210,30 +153,82 @@ st.markdown('<div class="card">', unsafe_allow_html=True)
 col1, col2 = st.columns(2)
 with col1:
     st.markdown("### 🔮 Forecast Horizon")
-    horizon = st.selectbox("Select Horizon", ["4 Days", "4 Weeks", "2 Months", "4 Months", "1 Year"], index=2)
+    horizon = st.selectbox("Select Horizon", list(HORIZONS.keys()), index=2)
 with col2:
     st.markdown("### 🎯 Forecast Target")
-    options = [v['category'] for k, v in data.items() if horizon in k]
-    options = sorted(set(options))
+    targets = list_forecast_targets(cube, horizon, totals=True)
+    totals = [t for t in TOTAL_CATEGORIES.values() if t in targets]
+    options = totals + sorted(t for t in targets if t not in totals)
     selected = st.selectbox("Show Forecast For", options if options else ["Total Income"])
 st.markdown('</div>', unsafe_allow_html=True)
 
 # -------------------------------
-# Retrieve Selected Forecast
+# Retrieve Selected Forecast (background job)
 # -------------------------------
-selected_key = None
-for k, v in data.items():
-    if horizon in k and v['category'] == selected:
-        selected_key = k
-        break
+if selected not in targets:
+    st.error("No data for this selection.")
+    st.stop()
 
-if not selected_key:
+typ = targets[selected]
+# Totals are reconciled from the category forecasts, so a total waits on all of its type's categories
+needed = required_targets(cube, horizon, typ, selected)
+for need_typ, need_cat in needed:
+    worker.submit(data_version, horizon, need_typ, need_cat, priority=0)
+# Queue every other combination behind it
+worker.prefetch(data_version, {h: fit_targets(cube, h) for h in HORIZONS})
+
+def needed_jobs():
+    return [worker.status(data_version, horizon, t, c) or {} for t, c in needed]
+
+jobs = needed_jobs()
+pending = any(j.get('status') not in ('done', 'failed') for j in jobs)
+failed = [j for j in jobs if j.get('status') == 'failed']
+# A category is shown as fitted; a total is reconciled from its categories on the shared periods
+is_total = selected == TOTAL_CATEGORIES[typ]
+if not pending and len(failed) < len(jobs):
+    if is_total:
+        pred = get_reconciled(data_version, horizon, dates=forecast_dates(cube.days[-1], horizon)).get((typ, selected))
+        dropped = [cat for (_, cat), job in zip(needed, jobs) if job.get('status') == 'failed']
+        if dropped:
+            st.warning(f"⚠️ {selected} leaves out {', '.join(dropped)} — their forecasts failed.")
+    else:
+        pred = get_forecast(data_version, horizon, typ, selected)
+else:
+    # Not ready yet: show the last stored forecast while the jobs run — for a total, the
+    # newest fully computed version (kept by prune), never a partial sum of the current one
+    if is_total:
+        completed = worker.completed_version()
+        pred = get_reconciled(completed, horizon).get((typ, selected)) if completed else None
+    else:
+        pred = latest_forecast(horizon, typ, selected)[1]
+    if not pending:
+        st.error(f"Forecast failed: {failed[0].get('error')}")
+    else:
+        @st.fragment(run_every=1)
+        def wait_for_forecast():
+            current = needed_jobs()
+            if all(j.get('status') in ('done', 'failed') for j in current):
+                st.rerun()
+            counts = worker.progress(data_version)
+            label = ("Running AI model ..." if pred is None
+                     else "Showing the last forecast — refreshing in the background ...")
+            st.progress(sum(j.get('progress', 0) for j in current) / len(current),
+                        text=f"{label} ({counts.get('done', 0)}/{sum(counts.values())} forecasts ready)")
+
+        wait_for_forecast()
+    if pred is None:
+        st.stop()
+
+if pred is None:
     st.error("No data for this selection.")
     st.stop()
+result = format_forecast(cube, horizon, typ, selected, pred)
 
-forecast_df = data[selected_key]['forecast']
-history_df = data[selected_key]['history']
-last_actual_total = data[selected_key]['last_actual_total']
+forecast_df = result['forecast'].copy()
+history_df = result['history'].copy()
+forecast_df[['yhat', 'yhat_lower', 'yhat_upper']] = (forecast_df[['yhat', 'yhat_lower', 'yhat_upper']] * exchange_rate).round(0)
+history_df['y'] = (history_df['y'] * exchange_rate).round(0)
+last_actual_total = result['last_actual_total'] * exchange_rate
 
 forecast_df['Date'] = pd.to_datetime(forecast_df['ds'])
 history_df['Date'] = pd.to_datetime(history_df['ds'])
@@ -246,52 +241,59 @@ change_pct = ((total_pred - last_actual_total) / last_actual_total * 100) if las
 # -------------------------------
 # Forecast Chart
 # -------------------------------
-fig = go.Figure()
-
-fig.add_trace(go.Scatter(
-    x=history_df['Date'], y=history_df['y'],
-    mode='lines+markers',
-    name='Last 4 Actual',
-    line=dict(color='#4f46e5', width=3),
-    marker=dict(size=8, color='#4f46e5')
-))
-
-last_hist_date = history_df['Date'].iloc[-1]
-last_hist_value = history_df['y'].iloc[-1]
-
-connected_forecast_x = [last_hist_date] + forecast_df['Date'].tolist()
-connected_forecast_y = [last_hist_value] + forecast_df['yhat'].tolist()
-
-fig.add_trace(go.Scatter(
-    x=connected_forecast_x,
-    y=connected_forecast_y,
-    mode='lines+markers',
-    name='AI Forecast',
-    line=dict(color='#0d9488', width=3, dash='dot'),
-    marker=dict(size=8, symbol='diamond', color='#0d9488')
-))
-
-fig.add_trace(go.Scatter(
-    x=forecast_df['Date'].tolist() + forecast_df['Date'].tolist()[::-1],
-    y=forecast_df['yhat_upper'].tolist() + forecast_df['yhat_lower'].tolist()[::-1],
-    fill='toself',
-    fillcolor='rgba(13, 148, 136, 0.12)',
-    line=dict(color='rgba(0,0,0,0)'),
-    name='80% Confidence'
-))
-
-fig.update_layout(
-    title=f"{selected} • {horizon} Forecast",
-    xaxis_title="", 
-    yaxis_title=f"Amount ({currency_symbol})",
-    hovermode='x unified',
-    height=520,
-    template="simple_white",
-    legend=dict(orientation="h", yanchor="bottom", y=1.01, xanchor="right", x=1),
-    hoverlabel=dict(bgcolor="white", font_size=13, font_family="Segoe UI"),
-    xaxis=dict(showgrid=True, gridcolor='#f1f5f9'),
-    yaxis=dict(showgrid=True, gridcolor='#f1f5f9', tickprefix=f"{currency_symbol} ")
-)
+def build_forecast_figure(history_df, forecast_df, selected, horizon, currency_symbol):
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatter(
+        x=history_df['Date'], y=history_df['y'],
+        mode='lines+markers',
+        name='Last 4 Actual',
+        line=dict(color='#4f46e5', width=3),
+        marker=dict(size=8, color='#4f46e5')
+    ))
+
+    last_hist_date = history_df['Date'].iloc[-1]
+    last_hist_value = history_df['y'].iloc[-1]
+
+    connected_forecast_x = [last_hist_date] + forecast_df['Date'].tolist()
+    connected_forecast_y = [last_hist_value] + forecast_df['yhat'].tolist()
+
+    fig.add_trace(go.Scatter(
+        x=connected_forecast_x,
+        y=connected_forecast_y,
+        mode='lines+markers',
+        name='AI Forecast',
+        line=dict(color='#0d9488', width=3, dash='dot'),
+        marker=dict(size=8, symbol='diamond', color='#0d9488')
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=forecast_df['Date'].tolist() + forecast_df['Date'].tolist()[::-1],
+        y=forecast_df['yhat_upper'].tolist() + forecast_df['yhat_lower'].tolist()[::-1],
+        fill='toself',
+        fillcolor='rgba(13, 148, 136, 0.12)',
+        line=dict(color='rgba(0,0,0,0)'),
+        name='80% Confidence'
+    ))
+
+    fig.update_layout(
+        title=f"{selected} • {horizon} Forecast",
+        xaxis_title="", 
+        yaxis_title=f"Amount ({currency_symbol})",
+        hovermode='x unified',
+        height=520,
+        template="simple_white",
+        legend=dict(orientation="h", yanchor="bottom", y=1.01, xanchor="right", x=1),
+        hoverlabel=dict(bgcolor="white", font_size=13, font_family="Segoe UI"),
+        xaxis=dict(showgrid=True, gridcolor='#f1f5f9'),
+        yaxis=dict(showgrid=True, gridcolor='#f1f5f9', tickprefix=f"{currency_symbol} ")
+    )
+    return fig
+
+# Keyed on the forecast values too: a refresh can replace them within one data version
+pred_key = int(pd.util.hash_pandas_object(pred, index=False).sum())
+fig = cached_figure((data_version, "forecast", selected_currency, exchange_rate, horizon, selected, pred_key),
+                    lambda: build_forecast_figure(history_df, forecast_df, selected, horizon, currency_symbol))
 
 st.plotly_chart(fig, use_container_width=True)
 
@@ -346,35 +348,22 @@ with st.expander("🔍 How to interpret this forecast"):
 st.markdown("---")
 st.subheader("Historical Trend")
 
-trend_period = st.select_slider(
-    "View Historical Data",
-    options=["3M", "6M", "1Y", "2Y", "All"],
-    value="1Y"
-)
-
-cutoff_map = {"3M": 90, "6M": 180, "1Y": 365, "2Y": 730, "All": 9999}
-days = cutoff_map[trend_period]
-hist_data = data_source[data_source['Date'] >= data_source['Date'].max() - pd.Timedelta(days=days)]
-
-if selected.startswith("Total "):
-    hist_agg = hist_data.groupby(hist_data['Date'].dt.to_period('M').dt.to_timestamp())['Amount'].sum().reset_index()
-    title = f"{selected} Trend"
-else:
-    hist_agg = hist_data[hist_data['Category'] == selected]
-    hist_agg = hist_agg.groupby(hist_agg['Date'].dt.to_period('M').dt.to_timestamp())['Amount'].sum().reset_index()
-    title = f"{selected} Monthly Trend"
+HISTORY_DATE_FORMATS = {'D': '%d %b %Y', 'M': '%b %Y'}
 
-if not hist_agg.empty:
-    hist_agg['Month'] = hist_agg['Date'].dt.strftime('%b %Y')
+def build_history_figure(hist_agg, title, currency_symbol, freq='M'):
+    # At most CHART_POINT_BUDGET bars / line points (downsample.py); merged bars show the per-period average
+    bars = rebucket(hist_agg, 'Date', 'Amount', CHART_POINT_BUDGET, how='mean')
+    bars['Month'] = bars['Date'].dt.strftime(HISTORY_DATE_FORMATS[freq])
+    line = hist_agg.iloc[lttb(hist_agg['Date'], hist_agg['Amount'], CHART_POINT_BUDGET)]
     fig_trend = px.bar(
-        hist_agg, x='Date', y='Amount',
+        bars, x='Date', y='Amount',
         title=title,
         color_discrete_sequence=['#636efa'],
         hover_data={'Amount': ':,.0f'},
         custom_data=['Month']
     )
     fig_trend.add_scatter(
-        x=hist_agg['Date'], y=hist_agg['Amount'],
+        x=line['Date'], y=line['Amount'],
         mode='lines+markers', name='Trend',
         line=dict(color='#61dafb', width=2),
         marker=dict(color='#61dafb', size=6),
@@ -385,12 +374,49 @@ if not hist_agg.empty:
         xaxis_title="",
         yaxis_title=currency_symbol,
         hovermode='x unified',
-        xaxis=dict(showgrid=True, gridcolor='#f1f5f9', tickformat='%b %Y'),
+        xaxis=dict(showgrid=True, gridcolor='#f1f5f9', tickformat=HISTORY_DATE_FORMATS[freq]),
         yaxis=dict(showgrid=True, gridcolor='#f1f5f9', tickprefix=f"{currency_symbol} ")
     )
-    st.plotly_chart(fig_trend, use_container_width=True)
-else:
-    st.warning("No historical data in selected period.")
+    return fig_trend
+
+# The period slider reruns only this fragment; engine (None with DuckDB) and target come from the last page run.
+# The daily horizon ("4 Days") shows daily history — years of it are what the point budget is for
+@st.fragment
+def historical_trend(engine, data_version, last_date, horizon, typ, selected, selected_currency, exchange_rate,
+                     currency_symbol):
+    trend_period = st.select_slider(
+        "View Historical Data",
+        options=["3M", "6M", "1Y", "2Y", "All"],
+        value="1Y"
+    )
+
+    cutoff_map = {"3M": 90, "6M": 180, "1Y": 365, "2Y": 730, "All": 9999}
+    days = cutoff_map[trend_period]
+    cutoff = last_date - pd.Timedelta(days=days)
+
+    freq = 'D' if HORIZONS[horizon][1] == 'D' else 'M'
+    if selected.startswith("Total "):
+        filters = {'Type': typ}
+        title = f"{selected} {'Daily ' if freq == 'D' else ''}Trend"
+    else:
+        filters = {'Type': typ, 'Category': selected}
+        title = f"{selected} {'Daily' if freq == 'D' else 'Monthly'} Trend"
+    if engine is None:
+        hist_agg = load_history(data_version, freq, cutoff, **filters)
+    else:
+        hist_agg = engine.sum(freq, start=cutoff, **filters)
+    hist_agg = (hist_agg * exchange_rate).rename_axis('Date').reset_index()
+
+    if not hist_agg.empty:
+        fig_trend = cached_figure(
+            (data_version, "history", selected_currency, exchange_rate, freq, typ, selected, trend_period),
+            lambda: build_history_figure(hist_agg, title, currency_symbol, freq))
+        st.plotly_chart(fig_trend, use_container_width=True)
+    else:
+        st.warning("No historical data in selected period.")
+
+historical_trend(engine, data_version, cube.days[-1], horizon, typ, selected,
+                 selected_currency, exchange_rate, currency_symbol)
 
 # -------------------------------
 # Refresh Button
@@ -398,10 +424,10 @@ else:
 col_r1, col_r2 = st.columns([1, 5])
 with col_r1:
     if st.button("🔄 Refresh", type="secondary"):
-        st.cache_data.clear()
+        worker.refresh(data_version)
         st.rerun()
 with col_r2:
-    st.caption("Clears cached data and reloads all forecasts")
+    st.caption("Re-runs every forecast for the current data")
 
 # -------------------------------
 # AI Insight
@@ -439,8 +465,8 @@ if len(history_df) > 0:
         unc = "high"
         note = "volatile"
 
-    if selected == "Total Income":
-        line1 = f"Total income is projected to **{trend}** over the next **{horizon.lower()}**."
+    if selected in TOTAL_CATEGORIES.values():
+        line1 = f"{selected.capitalize()} is projected to **{trend}** over the next **{horizon.lower()}**."
         line2 = f"With **{unc}** uncertainty, the forecast is **{note}**."
     else:
         line1 = f"**{selected}** is projected to **{trend}** over the next **{horizon.lower()}**."
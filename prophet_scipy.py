@@ -0,0 +1,132 @@
+# prophet_scipy.py
+# In-process MAP fitting for Prophet — a drop-in stan_backend that optimises
+# Prophet's Stan model (linear / flat trend) with SciPy's L-BFGS-B.
+# No cmdstan subprocess and no temp CSV files per fit, so short series fit in
+# milliseconds and worker processes stay warm between fits.
+# Logistic growth and MCMC sampling are handed to Prophet's cmdstanpy backend.
+#
+#   from prophet_scipy import use_scipy_backend
+#   model = use_scipy_backend(Prophet(...))
+#   model.fit(df)
+
+import numpy as np
+from scipy.optimize import minimize
+
+# -------------------------------
+# 1. Objective (negative log posterior, same terms as prophet.stan)
+# -------------------------------
+def _design(stan_data):
+    t = np.asarray(stan_data['t'], dtype=float)
+    t_change = np.asarray(stan_data['t_change'], dtype=float).reshape(-1)
+    X = np.asarray(stan_data['X'], dtype=float)
+    s_a = np.asarray(stan_data['s_a'], dtype=float)
+    s_m = np.asarray(stan_data['s_m'], dtype=float)
+    # linear_trend = (k + A·delta)∘t + (m + A·(−t_change∘delta)) = k·t + m + B·delta
+    A = (t[:, None] >= t_change[None, :]).astype(float)
+    B = A * (t[:, None] - t_change[None, :])
+    return {
+        't': t, 'y': np.asarray(stan_data['y'], dtype=float), 'B': B,
+        'X_sa': X * s_a, 'X_sm': X * s_m,
+        'sigmas': np.asarray(stan_data['sigmas'], dtype=float),
+        'tau': float(stan_data['tau']), 'flat': int(stan_data['trend_indicator']) == 2,
+    }
+
+def _objective(theta, d, S, K):
+    """
+    Value and gradient. theta = [k, m, delta⁺(S), delta⁻(S), log sigma_obs, beta(K)].
+    delta = delta⁺ − delta⁻ with both bounded at 0, so the Laplace prior
+    |delta| = delta⁺ + delta⁻ stays linear and L-BFGS-B needs no smoothing.
+    """
+    k, m = theta[0], theta[1]
+    d_pos, d_neg = theta[2:2 + S], theta[2 + S:2 + 2 * S]
+    delta = d_pos - d_neg
+    u = theta[2 + 2 * S]
+    beta = theta[3 + 2 * S:]
+    sigma = np.exp(u)
+
+    if d['flat']:
+        trend = np.full_like(d['t'], m)
+    else:
+        trend = k * d['t'] + m + d['B'] @ delta
+    mult = 1 + d['X_sm'] @ beta
+    resid = d['y'] - (trend * mult + d['X_sa'] @ beta)
+    T = len(resid)
+    ss = resid @ resid
+
+    value = (
+        (k ** 2 + m ** 2) / 50.0                   # k, m ~ normal(0, 5)
+        + (d_pos.sum() + d_neg.sum()) / d['tau']   # delta ~ double_exponential(0, tau)
+        + 2.0 * sigma ** 2                         # sigma_obs ~ normal(0, 0.5)
+        + 0.5 * np.sum((beta / d['sigmas']) ** 2)  # beta ~ normal(0, sigmas)
+        + T * u + 0.5 * ss / sigma ** 2            # y ~ normal(mu, sigma_obs)
+    )
+
+    g_mu = -resid / sigma ** 2
+    g_trend = g_mu * mult
+    g_delta = np.zeros(S) if d['flat'] else d['B'].T @ g_trend
+    grad = np.empty_like(theta)
+    grad[0] = (0.0 if d['flat'] else g_trend @ d['t']) + k / 25.0
+    grad[1] = g_trend.sum() + m / 25.0
+    grad[2:2 + S] = g_delta + 1.0 / d['tau']
+    grad[2 + S:2 + 2 * S] = -g_delta + 1.0 / d['tau']
+    grad[2 + 2 * S] = T - ss / sigma ** 2 + 4.0 * sigma ** 2
+    grad[3 + 2 * S:] = d['X_sm'].T @ (g_mu * trend) + d['X_sa'].T @ g_mu + beta / d['sigmas'] ** 2
+    return value, grad
+
+# -------------------------------
+# 2. Backend
+# -------------------------------
+class ScipyStanBackend:
+    """Implements the part of prophet.models.IStanBackend that Prophet.fit uses."""
+
+    def __init__(self):
+        self.stan_fit = None
+        self.newton_fallback = True
+        self._cmdstan = None
+
+    @staticmethod
+    def get_type():
+        return "SCIPY"
+
+    def _fallback(self):
+        if self._cmdstan is None:
+            from prophet.models import CmdStanPyBackend
+            self._cmdstan = CmdStanPyBackend()
+        return self._cmdstan
+
+    def fit(self, stan_init, stan_data, **kwargs):
+        if int(stan_data['trend_indicator']) == 1:  # logistic growth → Stan
+            return self._fallback().fit(stan_init, stan_data, **kwargs)
+
+        d = _design(stan_data)
+        S, K = d['B'].shape[1], d['X_sa'].shape[1]
+        delta0 = np.asarray(stan_init['delta'], dtype=float).reshape(-1)
+        theta0 = np.concatenate([
+            [float(np.asarray(stan_init['k']).reshape(-1)[0]), float(np.asarray(stan_init['m']).reshape(-1)[0])],
+            np.maximum(delta0, 0), np.maximum(-delta0, 0),
+            [np.log(max(float(np.asarray(stan_init['sigma_obs']).reshape(-1)[0]), 1e-9))],
+            np.asarray(stan_init['beta'], dtype=float).reshape(-1),
+        ])
+        bounds = [(None, None)] * 2 + [(0, None)] * (2 * S) + [(None, None)] * (1 + K)
+        res = minimize(_objective, theta0, args=(d, S, K), jac=True, method='L-BFGS-B', bounds=bounds,
+                       options={'maxiter': int(kwargs.get('iter', 10000)), 'ftol': 1e-12, 'gtol': 1e-8})
+        theta = res.x
+        delta = theta[2:2 + S] - theta[2 + S:2 + 2 * S]
+        return {
+            'k': theta[0:1].reshape(1, -1),
+            'm': theta[1:2].reshape(1, -1),
+            'delta': delta.reshape(1, -1),
+            'sigma_obs': np.exp(theta[2 + 2 * S:3 + 2 * S]).reshape(1, -1),
+            'beta': theta[3 + 2 * S:].reshape(1, -1),
+        }
+
+    def sampling(self, stan_init, stan_data, samples, **kwargs):
+        return self._fallback().sampling(stan_init, stan_data, samples, **kwargs)
+
+    def cleanup(self):
+        pass
+
+def use_scipy_backend(model):
+    """Swap a Prophet instance's cmdstanpy backend for the in-process one. Returns the model."""
+    model.stan_backend = ScipyStanBackend()
+    return model
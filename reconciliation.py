@@ -0,0 +1,121 @@
+# reconciliation.py
+# Hierarchical forecast reconciliation over type → category.
+# Only the categories (bottom level) need their own model; the type totals and
+# the net balance are linear combinations of them, so every page shows numbers
+# that add up instead of a separately fitted "Total Income" that doesn't.
+#
+#   bottom_up: totals = Σ category forecasts, interval from the summed variances
+#              on one shared period grid (a category adds 0 where it has no forecast)
+#   mint:      MinT with a diagonal (variance-weighted) covariance — aggregate base
+#              forecasts, when given, are blended in and every level is adjusted
+#              so the result is coherent. Without them it equals bottom_up.
+#
+#   nodes = reconcile({('INCOME', 'Salary'): pred, ('EXPENSE', 'Food'): pred, ...},
+#                     dates=forecast_engine.forecast_dates(last_date, "2 Months"))
+#   nodes[('INCOME', 'Total Income')], nodes[('NET', 'Net Balance')]
+
+import numpy as np
+import pandas as pd
+
+TOTAL_CATEGORIES = {'INCOME': "Total Income", 'EXPENSE': "Total Expense"}
+NET_TYPE, NET_CATEGORY = "NET", "Net Balance"
+RECONCILE_METHODS = ["bottom_up", "mint"]
+Z_80 = 1.2816  # two-sided 80% interval, same width Prophet is configured with
+
+def is_aggregate(typ: str, cat: str) -> bool:
+    return typ == NET_TYPE or TOTAL_CATEGORIES.get(typ) == cat
+
+# -------------------------------
+# 1. Hierarchy
+# -------------------------------
+def summing_matrix(bottom_keys):
+    """
+    (node keys, S) with S[node, bottom] the weight of each category in each node:
+    one row per type total, the net balance (income − expense), then the identity.
+    """
+    types = [t for t in TOTAL_CATEGORIES if any(typ == t for typ, _ in bottom_keys)]
+    rows, keys = [], []
+    for t in types:
+        keys.append((t, TOTAL_CATEGORIES[t]))
+        rows.append([1.0 if typ == t else 0.0 for typ, _ in bottom_keys])
+    keys.append((NET_TYPE, NET_CATEGORY))
+    rows.append([1.0 if typ == 'INCOME' else -1.0 for typ, _ in bottom_keys])
+    S = np.vstack([np.array(rows).reshape(len(rows), len(bottom_keys)), np.eye(len(bottom_keys))])
+    return keys + list(bottom_keys), S
+
+def _on_dates(pred, dates):
+    p = pred.assign(ds=pd.to_datetime(pred['ds'])).drop_duplicates('ds').set_index('ds')
+    return p.reindex(dates)
+
+def _align(preds, keys, dates):
+    """
+    yhat and variance (steps × keys) on the shared dates. Each key contributes
+    its own forecast for a date, or 0 with no variance where it has none (a
+    category whose history ended before the others' is not forecast there).
+    """
+    yhat = np.zeros((len(dates), len(keys)))
+    var = np.zeros((len(dates), len(keys)))
+    for j, key in enumerate(keys):
+        p = _on_dates(preds[key], dates)
+        yhat[:, j] = p['yhat'].fillna(0).to_numpy()
+        var[:, j] = (((p['yhat_upper'] - p['yhat_lower']) / (2 * Z_80)) ** 2).fillna(0).to_numpy()
+    return yhat, var
+
+def _covers(pred, dates):
+    return bool(_on_dates(pred, dates)['yhat'].notna().all())
+
+def _frame(dates, yhat, var):
+    spread = Z_80 * np.sqrt(np.maximum(var, 0))
+    return pd.DataFrame({'ds': dates, 'yhat': yhat, 'yhat_lower': yhat - spread, 'yhat_upper': yhat + spread})
+
+# -------------------------------
+# 2. Reconciliation
+# -------------------------------
+def reconcile(preds, method: str = "bottom_up", dates=None):
+    """
+    preds: {(type, category): ds/yhat/yhat_lower/yhat_upper} for one horizon.
+    Entries for a type total or the net balance are aggregate base forecasts
+    (only used by mint, and only if they cover every date). Returns the same
+    kind of dict for every node on `dates` — the horizon's shared periods
+    (forecast_engine.forecast_dates), by default those of the category whose
+    forecast starts last: each category, each type total and the net balance.
+    Empty if no category has a forecast. Show a single category from its own
+    forecast; its node here only covers the shared dates.
+    """
+    if method not in RECONCILE_METHODS:
+        raise ValueError(f"Unknown reconciliation method '{method}'. Choose from {RECONCILE_METHODS}")
+    preds = {k: v for k, v in preds.items() if v is not None and len(v)}
+    bottom_keys = sorted(k for k in preds if not is_aggregate(*k))
+    if not bottom_keys:
+        return {}
+    if dates is None:
+        latest = max(bottom_keys, key=lambda k: pd.to_datetime(preds[k]['ds']).min())
+        dates = pd.to_datetime(preds[latest]['ds'])
+    dates = pd.DatetimeIndex(dates)
+    node_keys, S = summing_matrix(bottom_keys)
+    b_yhat, b_var = _align(preds, bottom_keys, dates)
+    n_agg = len(node_keys) - len(bottom_keys)
+    base = ([i for i, k in enumerate(node_keys[:n_agg]) if k in preds and _covers(preds[k], dates)]
+            if method == "mint" else [])
+
+    if not base:
+        # Bottom-up: aggregates are sums of the aligned categories (independent errors)
+        yhat = b_yhat @ S.T
+        var = b_var @ (S ** 2).T
+        return {k: _frame(dates, yhat[:, i], var[:, i]) for i, k in enumerate(node_keys)}
+
+    # MinT (WLS, W = diag of base forecast variances), solved per forecast step
+    rows = base + list(range(n_agg, len(node_keys)))
+    S_a = S[rows]
+    a_yhat, a_var = _align(preds, [node_keys[i] for i in base], dates)
+    y_a = np.hstack([a_yhat, b_yhat])
+    w_a = np.maximum(np.hstack([a_var, b_var]), 1e-9)
+    yhat = np.empty((len(dates), len(node_keys)))
+    var = np.empty_like(yhat)
+    for t in range(len(dates)):
+        SW = S_a.T / w_a[t]                          # S_a' W⁻¹
+        P = np.linalg.solve(SW @ S_a, SW)            # (S_a' W⁻¹ S_a)⁻¹ S_a' W⁻¹
+        G = S @ P
+        yhat[t] = G @ y_a[t]
+        var[t] = (G ** 2) @ w_a[t]
+    return {k: _frame(dates, yhat[:, i], var[:, i]) for i, k in enumerate(node_keys)}
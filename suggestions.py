@@ -0,0 +1,127 @@
+# suggestions.py
+# Category / account suggestions while a transaction title is being entered.
+# A sorted prefix index over past titles answers most lookups with a bisect;
+# the cached category classifier (ml_models.py) fills in when the title is new.
+# The classifier loads on a background thread, so suggest() never waits for it.
+#
+#   service = SuggestionService(load_transactions(data_version))   # pages: the shared frame (data_access.py)
+#   service = SuggestionService.from_db()                          # scripts
+#   service.suggest("gra", typ="EXPENSE")   # {'category': 'Transport', 'account': 'Credit Card', ...}
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+CACHE_SIZE = 512
+MIN_PREFIX = 2
+
+def normalize_title(title: str) -> str:
+    return " ".join(str(title).lower().split())
+
+# -------------------------------
+# 1. Prefix Index
+# -------------------------------
+class TitleIndex:
+    """
+    One entry per distinct (normalized title, type): how often it was used and
+    its most common category / account. Entries are sorted by title so every
+    prefix is one contiguous slice. df is the cleaned frame (data_access.py).
+    """
+
+    def __init__(self, df):
+        df = df.assign(key=df['Title'].map(normalize_title))
+        df = df[df['key'] != ""]
+        grouped = df.groupby(['key', 'Type'], sort=True)
+        top = lambda s: s.value_counts().index[0] if s.notna().any() else None
+        stats = grouped.agg(count=('Category', 'size'), category=('Category', top),
+                            account=('Account', top), title=('Title', 'last')).reset_index()
+        self.keys = stats['key'].tolist()
+        self.types = stats['Type'].to_numpy()
+        self.counts = stats['count'].to_numpy()
+        self.rows = stats[['title', 'category', 'account']].to_dict('records')
+
+    def lookup(self, prefix: str, typ=None):
+        """Most frequently used title starting with prefix, or None."""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + "\uffff", lo)
+        if lo == hi:
+            return None
+        counts = self.counts[lo:hi]
+        if typ is not None:
+            counts = np.where(self.types[lo:hi] == typ, counts, 0)
+            if not counts.any():
+                return None
+        best = lo + int(np.argmax(counts))
+        return dict(self.rows[best], count=int(self.counts[best]))
+
+# -------------------------------
+# 2. Suggestion Service
+# -------------------------------
+class SuggestionService:
+    """Prefix index + (optional) classifier + LRU of recent answers. Thread-safe."""
+
+    def __init__(self, df, model_dir=None):
+        self.index = TitleIndex(df)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.model = None
+        self._loader = threading.Thread(target=self._load_model, args=(model_dir,),
+                                        name="suggestion-model", daemon=True)
+        self._loader.start()
+
+    @classmethod
+    def from_db(cls, db_path=None, model_dir=None):
+        """Service over a fresh read of db_path — for scripts; pages pass the shared frame instead."""
+        from data_access import read_transactions  # lazy: importing database initialises the schema
+
+        return cls(read_transactions(db_path), model_dir)
+
+    def _load_model(self, model_dir):
+        try:
+            from ml_models import MODEL_DIR, load_bundle
+            self.model = load_bundle(model_dir or MODEL_DIR, amount_model=False)
+        except Exception:
+            self.model = None  # suggestions still work from the title index
+
+    @property
+    def model_ready(self):
+        return self.model is not None
+
+    def suggest(self, title: str, typ=None, account=None, amount=None, when=None):
+        """
+        {'category', 'account', 'source', 'confidence'} or None.
+        source is 'history' (prefix match on a past title) or 'model' (classifier).
+        """
+        prefix = normalize_title(title)
+        if len(prefix) < MIN_PREFIX:
+            return None
+        key = (prefix, typ, account, None if amount is None else round(float(amount), 2), self.model_ready)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self._suggest(prefix, typ, account, amount, when)
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def _suggest(self, prefix, typ, account, amount, when):
+        hit = self.index.lookup(prefix, typ)
+        if hit is not None:
+            return {
+                'category': hit['category'], 'account': hit['account'], 'title': hit['title'],
+                'source': 'history', 'confidence': min(1.0, hit['count'] / 5),
+            }
+        model = self.model
+        if model is None or amount is None or account is None:
+            return None
+        from ml_models import predict_category
+        category, proba = predict_category(model, amount, account, when or date.today())[0]
+        return {'category': category, 'account': account, 'title': None,
+                'source': 'model', 'confidence': proba}